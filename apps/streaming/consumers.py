@@ -6,7 +6,8 @@ from django.conf import settings
 from apps.streaming.models import VideoWatch
 from apps.videos.models import Video, VideoInfo
 from apps.videos.serializers import VideoInfoSerializer
-from helpers.helper import get_available_info
+from apps.videos.storage import get_storage_dir, read_tracks_marker
+from helpers.helper import get_quality_label
 import os
 
 @database_sync_to_async
@@ -14,13 +15,11 @@ def get_video_info_available(video_id):
     try:
         video = Video.objects.get(id=video_id)
         video_info = VideoInfo.objects.get(video=video)
-        video_path = video.fichier.path
-        probe_info = get_available_info(video_path)
         # print(VideoInfoSerializer(video_info).data, probe_info)
         
         qualities = []
         base_url = settings.BASE_URL + settings.MEDIA_URL
-        video_dir = os.path.join("videos", str(video.id))
+        video_dir = get_storage_dir(video)
         for quality in video_info.qualities:
             manifest_path = os.path.join(video_dir, "segments", quality if quality != video_info.qualities[0] else "original", "video.m3u8")
             qualities.append({
@@ -55,32 +54,47 @@ def get_video_info_available(video_id):
                     "144p": "256x144"
                 }.get(quality, "5000000")
             })
-        audio_tracks = []
-        for lang in video_info.audio_languages:
-            audio_manifest = os.path.join(video_dir, "segments", "original", f"audio_{lang}.m3u8")
-            audio_tracks.append({
-                "language": lang,
-                "url": f"{base_url}{audio_manifest}"
-            })
-        subtitle_tracks = []
-        for lang in video_info.subtitle_languages:
-            subtitle_manifest = os.path.join(video_dir, "segments", "original", f"subs_{lang}.m3u8")
-            subtitle_tracks.append({
-                "language": lang,
-                "url": f"{base_url}{subtitle_manifest}"
-            })
+        # Noms réels des pistes (dédoublonnés, sous-titres image exclus) lus dans tracks.json
+        tracks_dir = os.path.join(video_dir, "segments", "original")
+        tracks = read_tracks_marker(os.path.join(settings.MEDIA_ROOT, tracks_dir)) or {}
+        audio_tracks = [
+            {
+                "language": entry["language"],
+                "url": f"{base_url}{os.path.join(tracks_dir, entry['manifest'])}"
+            }
+            for entry in tracks.get("audio", [])
+        ]
+        subtitle_tracks = [
+            {
+                "language": entry["language"],
+                "url": f"{base_url}{os.path.join(tracks_dir, entry['manifest'])}"
+            }
+            for entry in tracks.get("subtitles", [])
+        ]
+
+        thumbnails = None
+        if video.trickplay:
+            thumbnails = {
+                "interval": video.trickplay["interval"],
+                "width": video.trickplay["width"],
+                "height": video.trickplay["height"],
+                "tracks": {
+                    image_format: f"{base_url}{path}" for image_format, path in video.trickplay["tracks"].items()
+                }
+            }
 
         return {
             "qualities": qualities,
             "audio_tracks": audio_tracks,
             "subtitle_tracks": subtitle_tracks,
+            "thumbnails": thumbnails,
             "fps": video_info.fps,
             "width": video_info.width,
             "height": video_info.height,
             "duration": video_info.duration,
             "size": video_info.size,
             "master_manifest": os.path.join(base_url, video.master_manifest_file.name),
-            "quality": probe_info["quality"]
+            "quality": get_quality_label(video_info.height)
         }
     except Video.DoesNotExist:
         return None
@@ -175,6 +189,7 @@ class VideoWatchConsumer(AsyncWebsocketConsumer):
                 'qualities': video_info['qualities'],
                 'audio_tracks': video_info['audio_tracks'],
                 'subtitle_tracks': video_info['subtitle_tracks'],
+                'thumbnails': video_info['thumbnails'],
                 'metadata': {
                     'fps': video_info['fps'],
                     'width': video_info['width'],
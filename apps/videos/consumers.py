@@ -42,6 +42,33 @@ class UploadProgressConsumer(AsyncWebsocketConsumer):
             'video_id': event.get('video_id', None)
         }))
 
+    async def processing_queued(self, event):
+        await self.send(text_data=json.dumps({
+            'status': 'queued',
+            'video_id': event['video_id'],
+            'task_type': event['task_type'],
+            'queue_position': event['queue_position']
+        }))
+
+    async def processing_progress(self, event):
+        await self.send(text_data=json.dumps({
+            'status': 'processing',
+            'video_id': event['video_id'],
+            'renditions': event['renditions'],
+            'frame': event['frame'],
+            'out_time': event['out_time'],
+            'done': event['done']
+        }))
+
+    async def video_ready(self, event):
+        await self.send(text_data=json.dumps({
+            'status': 'ready',
+            'video_id': event['video_id'],
+            'master_manifest': event['master_manifest'],
+            'qualities': event['qualities'],
+            'first_publication': event['first_publication']
+        }))
+
 class VideoConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         await self.accept()
@@ -0,0 +1,72 @@
+from django.conf import settings
+import ctypes
+import os
+import resource
+
+# ioprio_set(2) : pas d'équivalent dans la bibliothèque standard
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_CLASSES = {"realtime": 1, "best-effort": 2, "idle": 3}
+SYS_IOPRIO_SET = {"x86_64": 251, "aarch64": 30}
+
+def worker_cpu_count():
+    # Budget CPU de l'hôte réservé aux workers ; le reste revient à Daphne
+    total = os.cpu_count() or 1
+    return max(1, int(total * settings.VIDEO_WORKER_CPU_BUDGET))
+
+def worker_cpus():
+    # Derniers cœurs de la machine : les premiers restent au serveur HTTP/WebSocket
+    if settings.VIDEO_WORKER_CPUS:
+        return set(settings.VIDEO_WORKER_CPUS)
+    total = os.cpu_count() or 1
+    return set(range(total - worker_cpu_count(), total))
+
+def set_io_priority(io_class, level=7):
+    syscall = SYS_IOPRIO_SET.get(os.uname().machine)
+    if syscall is None or io_class not in IOPRIO_CLASSES:
+        return False
+    value = (IOPRIO_CLASSES[io_class] << IOPRIO_CLASS_SHIFT) | level
+    libc = ctypes.CDLL(None, use_errno=True)
+    return libc.syscall(syscall, IOPRIO_WHO_PROCESS, 0, value) == 0
+
+def join_cgroup(pid):
+    # cgroup v2 : le dossier doit exister et être délégué à l'utilisateur qui lance les workers
+    path = settings.VIDEO_WORKER_CGROUP
+    if not path or not os.path.isdir(path):
+        return False
+    limits = {
+        "cpu.max": f"{settings.VIDEO_WORKER_CPU_QUOTA_PERCENT * 1000 * worker_cpu_count()} 100000",
+        "memory.max": str(settings.VIDEO_WORKER_MEMORY_LIMIT) if settings.VIDEO_WORKER_MEMORY_LIMIT else "max",
+        "io.weight": f"default {settings.VIDEO_WORKER_IO_WEIGHT}",
+    }
+    for name, value in limits.items():
+        try:
+            with open(os.path.join(path, name), 'w') as f:
+                f.write(value)
+        except OSError as e:
+            print(f"[❗] Limite cgroup {name} non appliquée : {e}")
+    try:
+        with open(os.path.join(path, "cgroup.procs"), 'w') as f:
+            f.write(str(pid))
+        return True
+    except OSError as e:
+        print(f"[❗] Impossible de rejoindre le cgroup {path} : {e}")
+        return False
+
+def apply_worker_isolation():
+    # Hérité par les processus ffmpeg lancés ensuite par le worker
+    applied = {}
+    os.setpriority(os.PRIO_PROCESS, 0, settings.VIDEO_WORKER_NICE)
+    applied["nice"] = settings.VIDEO_WORKER_NICE
+    applied["ionice"] = settings.VIDEO_WORKER_IONICE_CLASS if set_io_priority(settings.VIDEO_WORKER_IONICE_CLASS) else None
+    if hasattr(os, "sched_setaffinity"):
+        cpus = worker_cpus()
+        os.sched_setaffinity(0, cpus)
+        applied["cpus"] = sorted(cpus)
+    if settings.VIDEO_WORKER_MEMORY_LIMIT and not settings.VIDEO_WORKER_CGROUP:
+        # Sans cgroup, plafond d'espace d'adressage par processus
+        limit = settings.VIDEO_WORKER_MEMORY_LIMIT
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        applied["rlimit_as"] = limit
+    applied["cgroup"] = settings.VIDEO_WORKER_CGROUP if join_cgroup(os.getpid()) else None
+    return applied
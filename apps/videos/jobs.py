@@ -0,0 +1,407 @@
+from apps.videos.models import Video, VideoProcessingTask
+from apps.videos.tasks import (
+    probe_video, prepare_video_conversion, generate_video_renditions, generate_video_affichage,
+    generate_video_trickplay, pending_renditions, publish_master_playlist, use_chunked_encoding,
+    split_source_chunks, encode_video_chunk, stitch_video_chunks, generate_video_tracks
+)
+from apps.videos.transcoder import get_quality_height
+from apps.videos.storage import hand_over_content
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction, close_old_connections
+from django.db.models import F, Q, Min
+from django.utils import timezone as django_timezone
+from collections import Counter
+from datetime import timedelta
+from contextlib import contextmanager
+from threading import Thread, Event
+import os
+import socket
+import traceback
+import zlib
+
+# Plus la valeur est basse, plus la tâche passe tôt. Les renditions sont ensuite
+# ordonnées par hauteur : la plus basse est prête (et lisible) en premier.
+TASK_PRIORITIES = {
+    # L'envoyeur attend la fin de son upload
+    "FINALIZE": -10,
+    "PROBE": 0,
+    "THUMBNAILS": 10,
+    "CONVERSION": 50,
+    # Pistes audio / sous-titres : en parallèle de la première rendition
+    "TRACKS": 60,
+    "RENDITION": 100,
+    "CHUNK": 100,
+    "STITCH": 100,
+    # Après la première rendition (<= 480p), avant les qualités HD
+    "TRICKPLAY": 600,
+}
+
+def run_conversion(task):
+    groups = prepare_video_conversion(task.video_id)
+    video = Video.objects.get(id=task.video_id)
+    source_height = video.info.height
+    # CONVERSION rejouée après un échec : les tâches encore en attente ou en cours ne sont pas
+    # dupliquées, deux workers travailleraient sinon sur les mêmes fichiers
+    enqueue_unique_task(task.video_id, "TRACKS", user_id=task.user_id)
+    active_groups = [
+        active.get("qualities") for active in VideoProcessingTask.objects.filter(
+            video_id=task.video_id, task_type="RENDITION", status__in=['PENDING', 'PROCESSING']
+        ).values_list('payload', flat=True)
+    ]
+    enqueued = 0
+    for qualities in groups:
+        # Reprise : les groupes dont toutes les renditions sont validées ne sont pas relancés
+        if not pending_renditions(video, qualities):
+            continue
+        enqueued += 1
+        if qualities in active_groups:
+            continue
+        height = min(get_quality_height(q) or source_height for q in qualities)
+        enqueue_task(task.video_id, "RENDITION", payload={"qualities": qualities, "height": height}, user_id=task.user_id)
+    if not enqueued:
+        publish_master_playlist(task.video_id)
+    enqueue_unique_task(task.video_id, "TRICKPLAY", user_id=task.user_id)
+
+class TaskNotReady(Exception):
+    # Dépendances pas encore terminées : la tâche est reportée sans consommer d'essai
+    def __init__(self, message, retry_in=None):
+        super().__init__(message)
+        self.retry_in = retry_in or settings.VIDEO_CHUNK_STITCH_POLL
+
+def run_rendition(task):
+    video = Video.objects.get(id=task.video_id)
+    qualities = task.payload["qualities"]
+    if not use_chunked_encoding(video):
+        return generate_video_renditions(task.video_id, qualities)
+
+    pending = pending_renditions(video, qualities)
+    if not pending:
+        return publish_master_playlist(task.video_id)
+    # Découpe / encodage distribué / assemblage : chaque morceau est une tâche indépendante
+    chunk_names = split_source_chunks(task.video_id)
+    payload = {"qualities": pending, "height": task.payload.get("height", 0)}
+    chunk_tasks = [
+        enqueue_task(task.video_id, "CHUNK", payload={**payload, "chunk": chunk_name}, user_id=task.user_id).id
+        for chunk_name in chunk_names
+    ]
+    enqueue_task(
+        task.video_id, "STITCH", payload={**payload, "chunks": chunk_names, "chunk_tasks": chunk_tasks},
+        user_id=task.user_id
+    )
+
+def run_stitch(task):
+    statuses = set(VideoProcessingTask.objects.filter(id__in=task.payload["chunk_tasks"]).values_list('status', flat=True))
+    if 'FAILED' in statuses:
+        raise RuntimeError("Un morceau n'a pas pu être encodé")
+    if statuses != {'COMPLETED'}:
+        raise TaskNotReady("Morceaux encore en cours d'encodage")
+    stitch_video_chunks(task.video_id, task.payload["qualities"], task.payload["chunks"])
+
+def run_finalize_upload(task):
+    # Import local : uploads dépend des sérialiseurs, qui dépendent de ce module
+    from apps.videos.uploads import complete_video_upload, fail_video_upload
+    try:
+        complete_video_upload(task.payload["upload_id"])
+    except Exception:
+        if task.attempts >= task.max_attempts:
+            fail_video_upload(task.payload["upload_id"])
+        raise
+
+TASK_HANDLERS = {
+    "FINALIZE": run_finalize_upload,
+    "PROBE": lambda task: probe_video(task.video_id),
+    "THUMBNAILS": lambda task: generate_video_affichage(task.video_id),
+    "CONVERSION": run_conversion,
+    "RENDITION": run_rendition,
+    "TRACKS": lambda task: generate_video_tracks(task.video_id),
+    "CHUNK": lambda task: encode_video_chunk(task.video_id, task.payload["qualities"], task.payload["chunk"]),
+    "STITCH": run_stitch,
+    "TRICKPLAY": lambda task: generate_video_trickplay(task.video_id),
+}
+
+# Tâches qui produisent les fichiers partagés par toutes les vidéos d'un même contenu
+CONTENT_TASK_TYPES = ("PROBE", "CONVERSION", "RENDITION", "TRACKS", "CHUNK", "STITCH")
+
+def hand_over_processing(video):
+    # Les doublons n'ont pas de tâches propres : si la vidéo propriétaire disparaît ou échoue
+    # avant la publication du master, une autre vidéo du même contenu reprend le traitement
+    if video.master_manifest_file:
+        return None
+    heir = hand_over_content(video)
+    if heir is None:
+        return None
+    VideoProcessingTask.objects.filter(
+        video_id=video.id, task_type__in=CONTENT_TASK_TYPES, status='PENDING'
+    ).update(status='FAILED', error_message=f"Traitement repris par la vidéo {heir.id}", updated_at=django_timezone.now())
+    print(f"♻️ Traitement du contenu {video.content_id} repris par la vidéo {heir.id} (vidéo {video.id})")
+    return enqueue_video_processing(heir.id, heir.envoyeur_id)
+
+def on_task_failed(task):
+    if task.task_type not in CONTENT_TASK_TYPES or task.video_id is None:
+        return
+    video = Video.objects.filter(id=task.video_id).first()
+    if video is None:
+        return
+    try:
+        hand_over_processing(video)
+    except Exception as e:
+        print(f"[❌] Reprise du traitement impossible pour la vidéo {task.video_id} : {e}")
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def compute_priority(task_type, payload):
+    priority = TASK_PRIORITIES.get(task_type, 100)
+    if task_type in ("RENDITION", "CHUNK", "STITCH"):
+        priority += payload.get("height", 0)
+    return priority
+
+def enqueue_task(video_id, task_type, payload=None, user_id=None):
+    payload = payload or {}
+    if user_id is None and video_id is not None:
+        user_id = Video.objects.filter(id=video_id).values_list('envoyeur_id', flat=True).first()
+    task = VideoProcessingTask.objects.create(
+        video_id=video_id,
+        user_id=user_id,
+        task_type=task_type,
+        payload=payload,
+        priority=compute_priority(task_type, payload),
+        max_attempts=settings.VIDEO_TASK_MAX_ATTEMPTS,
+    )
+    print(f"[📥] Tâche {task_type} #{task.id} mise en file pour la vidéo {video_id}")
+    return task
+
+def enqueue_unique_task(video_id, task_type, payload=None, user_id=None):
+    # Réutilise la tâche déjà en attente ou en cours pour cette vidéo au lieu d'en créer une autre
+    active = VideoProcessingTask.objects.filter(
+        video_id=video_id, task_type=task_type, status__in=['PENDING', 'PROCESSING']
+    ).first()
+    if active is not None:
+        return active
+    return enqueue_task(video_id, task_type, payload=payload, user_id=user_id)
+
+def request_video_affichage(video_id):
+    # Appelé à chaque sérialisation d'une vidéo sans affichage : cache.add est atomique,
+    # une seule requête par intervalle interroge la file
+    if not cache.add(f"video_affichage_requested:{video_id}", True, settings.VIDEO_POSTER_ENQUEUE_INTERVAL):
+        return None
+    return enqueue_unique_task(video_id, "THUMBNAILS")
+
+def get_queue_position(task):
+    return VideoProcessingTask.objects.filter(status='PENDING').filter(
+        Q(priority__lt=task.priority) | Q(priority=task.priority, id__lt=task.id)
+    ).count() + 1
+
+def admission_report(task):
+    # Signalé à l'envoyeur uniquement quand la file est chargée
+    position = get_queue_position(task)
+    if position <= settings.VIDEO_QUEUE_ADMISSION_THRESHOLD:
+        return None
+    return {"task_id": task.id, "task_type": task.task_type, "queue_position": position}
+
+def enqueue_video_processing(video_id, user_id=None):
+    enqueue_task(video_id, "PROBE", user_id=user_id)
+    enqueue_task(video_id, "THUMBNAILS", user_id=user_id)
+    conversion = enqueue_task(video_id, "CONVERSION", user_id=user_id)
+    return admission_report(conversion)
+
+def _claimable(now):
+    # Tâche en attente, ou tâche dont le worker est mort (bail expiré)
+    return (
+        Q(status='PENDING', run_after__lte=now)
+        | Q(status='PROCESSING', locked_until__lt=now, attempts__lt=F('max_attempts'))
+    )
+
+def reap_expired_tasks(now=None):
+    now = now or django_timezone.now()
+    expired = list(VideoProcessingTask.objects.filter(
+        status='PROCESSING', locked_until__lt=now, attempts__gte=F('max_attempts')
+    ))
+    reaped = VideoProcessingTask.objects.filter(
+        id__in=[task.id for task in expired], status='PROCESSING', locked_until__lt=now
+    ).update(
+        status='FAILED', locked_by=None, locked_until=None,
+        error_message="Bail expiré : worker perdu après le dernier essai", updated_at=now
+    )
+    for task in expired:
+        on_task_failed(task)
+    return reaped
+
+def _running_counters(now):
+    running = VideoProcessingTask.objects.filter(status='PROCESSING', locked_until__gte=now)
+    by_type = Counter(running.values_list('task_type', flat=True))
+    by_user = Counter(running.values_list('user_id', flat=True))
+    return by_type, by_user
+
+def iter_candidates(now, video_ids=None):
+    by_type, by_user = _running_counters(now)
+    limits = settings.VIDEO_TASK_CONCURRENCY
+    saturated = [task_type for task_type, limit in limits.items() if by_type[task_type] >= limit]
+    claimable = VideoProcessingTask.objects.filter(_claimable(now)).exclude(task_type__in=saturated)
+    if video_ids is not None:
+        # Worker restreint à quelques vidéos (benchmark)
+        claimable = claimable.filter(video_id__in=video_ids)
+
+    # Part équitable : pour chaque utilisateur, sa meilleure classe de priorité ; à priorité égale
+    # l'utilisateur qui a le moins de tâches en cours passe d'abord
+    heads = claimable.values('user_id').annotate(best_priority=Min('priority'))
+    heads = sorted(heads, key=lambda h: (h['best_priority'], by_user[h['user_id']]))
+    for head in heads:
+        task = claimable.filter(
+            user_id=head['user_id'], priority=head['best_priority']
+        ).order_by('run_after', 'id').first()
+        if task is not None:
+            yield task
+
+@contextmanager
+def task_type_lock(task_type):
+    # Sérialise les réservations d'un même type : le comptage des tâches en cours et la
+    # réservation se font sans qu'un autre worker ne réserve entre les deux
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", [zlib.crc32(f"video_task:{task_type}".encode())])
+            elif connection.vendor == 'mysql':
+                cursor.execute("SELECT GET_LOCK(%s, %s)", [f"video_task:{task_type}", settings.VIDEO_TASK_LEASE_SECONDS])
+            else:
+                # SQLite : une écriture en tête de transaction prend le verrou d'écriture de la base
+                cursor.execute(f"UPDATE {VideoProcessingTask._meta.db_table} SET id = id WHERE 0")
+        try:
+            yield
+        finally:
+            if connection.vendor == 'mysql':
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT RELEASE_LOCK(%s)", [f"video_task:{task_type}"])
+
+def _try_claim(task_id, task_type, worker_id, now, lease):
+    with task_type_lock(task_type):
+        # Limite recomptée sous le verrou : celle vue par iter_candidates n'est qu'un pré-filtre
+        limit = settings.VIDEO_TASK_CONCURRENCY.get(task_type)
+        running = VideoProcessingTask.objects.filter(task_type=task_type, status='PROCESSING', locked_until__gte=now)
+        if limit is not None and running.count() >= limit:
+            return None
+        return _claim(task_id, worker_id, now, lease)
+
+def _claim(task_id, worker_id, now, lease):
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            task = VideoProcessingTask.objects.select_for_update(skip_locked=True).filter(
+                _claimable(now), id=task_id
+            ).first()
+            if task is None:
+                return None
+            task.status = 'PROCESSING'
+            task.locked_by = worker_id
+            task.locked_until = lease
+            task.attempts += 1
+            task.save(update_fields=['status', 'locked_by', 'locked_until', 'attempts', 'updated_at'])
+            return task
+
+    # SQLite : pas de SKIP LOCKED, on réserve par UPDATE conditionnel (compare-and-swap)
+    claimed = VideoProcessingTask.objects.filter(_claimable(now), id=task_id).update(
+        status='PROCESSING', locked_by=worker_id, locked_until=lease,
+        attempts=F('attempts') + 1, updated_at=now
+    )
+    return VideoProcessingTask.objects.get(id=task_id) if claimed else None
+
+def claim_task(worker_id, video_ids=None):
+    now = django_timezone.now()
+    lease = now + timedelta(seconds=settings.VIDEO_TASK_LEASE_SECONDS)
+    reap_expired_tasks(now)
+    for candidate in iter_candidates(now, video_ids):
+        task = _try_claim(candidate.id, candidate.task_type, worker_id, now, lease)
+        if task is not None:
+            return task
+    return None
+
+def extend_lease(task, worker_id):
+    now = django_timezone.now()
+    return VideoProcessingTask.objects.filter(id=task.id, locked_by=worker_id, status='PROCESSING').update(
+        locked_until=now + timedelta(seconds=settings.VIDEO_TASK_LEASE_SECONDS), updated_at=now
+    )
+
+def complete_task(task, worker_id):
+    return VideoProcessingTask.objects.filter(id=task.id, locked_by=worker_id).update(
+        status='COMPLETED', locked_by=None, locked_until=None, error_message=None,
+        updated_at=django_timezone.now()
+    )
+
+def fail_task(task, worker_id, error):
+    now = django_timezone.now()
+    if task.attempts < task.max_attempts:
+        # Backoff exponentiel : base, base*2, base*4 ... plafonné
+        delay = min(
+            settings.VIDEO_TASK_RETRY_BACKOFF * (2 ** (task.attempts - 1)),
+            settings.VIDEO_TASK_RETRY_BACKOFF_MAX
+        )
+        fields = {'status': 'PENDING', 'run_after': now + timedelta(seconds=delay)}
+    else:
+        fields = {'status': 'FAILED'}
+    return VideoProcessingTask.objects.filter(id=task.id, locked_by=worker_id).update(
+        locked_by=None, locked_until=None, error_message=str(error), updated_at=now, **fields
+    )
+
+def defer_task(task, worker_id, delay):
+    now = django_timezone.now()
+    return VideoProcessingTask.objects.filter(id=task.id, locked_by=worker_id).update(
+        status='PENDING', run_after=now + timedelta(seconds=delay), attempts=F('attempts') - 1,
+        locked_by=None, locked_until=None, updated_at=now
+    )
+
+def run_task(task, worker_id):
+    handler = TASK_HANDLERS.get(task.task_type)
+    stop_heartbeat = Event()
+
+    def heartbeat():
+        while not stop_heartbeat.wait(settings.VIDEO_TASK_LEASE_SECONDS / 3):
+            extend_lease(task, worker_id)
+            close_old_connections()
+
+    heartbeat_thread = Thread(target=heartbeat, daemon=True)
+    heartbeat_thread.start()
+    print(f"[!] 🖼️ Worker {worker_id} traite la tâche {task}")
+    try:
+        if handler is None:
+            raise ValueError(f"Type de tâche inconnu : {task.task_type}")
+        handler(task)
+        complete_task(task, worker_id)
+        print(f"✅ Tâche {task.task_type} #{task.id} terminée")
+    except TaskNotReady as e:
+        print(f"[⏳] Tâche {task.task_type} #{task.id} reportée : {e}")
+        defer_task(task, worker_id, e.retry_in)
+    except Exception as e:
+        print(f"[❌] Erreur dans le worker pour la tâche #{task.id} (vidéo {task.video_id}) : {e}")
+        print(traceback.format_exc())
+        fail_task(task, worker_id, e)
+        if task.attempts >= task.max_attempts:
+            on_task_failed(task)
+    finally:
+        stop_heartbeat.set()
+        heartbeat_thread.join()
+
+def run_worker(worker_id=None, poll_interval=None, burst=False, stop_event=None, video_ids=None):
+    worker_id = worker_id or default_worker_id()
+    poll_interval = poll_interval or settings.VIDEO_WORKER_POLL_INTERVAL
+    stop_event = stop_event or Event()
+    print(f"🚀 Worker vidéo {worker_id} démarré")
+    while not stop_event.is_set():
+        close_old_connections()
+        try:
+            task = claim_task(worker_id, video_ids)
+        except Exception as e:
+            print(f"[❌] Impossible de réserver une tâche : {e}")
+            task = None
+        if task is None:
+            if burst:
+                break
+            stop_event.wait(poll_interval)
+            continue
+        run_task(task, worker_id)
+    close_old_connections()
+    print(f"[❗] Worker vidéo {worker_id} arrêté")
+
+def start_inline_worker():
+    worker_thread = Thread(target=run_worker, kwargs={"worker_id": f"{default_worker_id()}:inline"}, daemon=True)
+    worker_thread.start()
+    return worker_thread
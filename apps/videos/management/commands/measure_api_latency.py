@@ -0,0 +1,92 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from apps.videos.isolation import apply_worker_isolation
+from apps.videos.transcoder import build_ladder_command
+from urllib.request import urlopen, Request
+from urllib.error import URLError
+import json
+import statistics
+import shutil
+import subprocess
+import tempfile
+import time
+
+class Command(BaseCommand):
+    help = "Mesure la latence de l'API (p50/p95/p99) au repos puis pendant un transcodage concurrent, isolé ou non."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default=None, help="URL appelée (défaut : BASE_URL/api/videos/)")
+        parser.add_argument('--requests', type=int, default=200, help="Nombre de requêtes par mesure")
+        parser.add_argument('--token', default=None, help="Jeton JWT (en-tête Authorization)")
+        parser.add_argument('--no-isolation', action='store_true', help="Transcodage concurrent sans nice/ionice/affinité/cgroup")
+        parser.add_argument('--json', action='store_true', help="Sortie JSON")
+
+    def measure(self, url, count, token):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        durations = []
+        errors = 0
+        for _ in range(count):
+            start = time.perf_counter()
+            try:
+                with urlopen(Request(url, headers=headers), timeout=30) as response:
+                    response.read()
+            except URLError:
+                errors += 1
+                continue
+            durations.append((time.perf_counter() - start) * 1000)
+        if len(durations) < 2:
+            return {"requests": count, "errors": errors}
+        percentiles = statistics.quantiles(durations, n=100)
+        return {
+            "requests": count,
+            "errors": errors,
+            "p50_ms": round(statistics.median(durations), 2),
+            "p95_ms": round(percentiles[94], 2),
+            "p99_ms": round(percentiles[98], 2),
+            "max_ms": round(max(durations), 2),
+        }
+
+    def start_transcode(self, isolated, work_dir):
+        # Charge réelle d'un worker : échelle complète encodée sans limitation de cadence (pas de -re),
+        # à partir d'une source synthétique 1080p, sorties jetées
+        renditions = ["original", "720p", "480p", "360p"]
+        cmd = build_ladder_command(
+            "testsrc2=size=1920x1080:rate=30", renditions, work_dir, fps=30, remux=False,
+            outputs={quality: ["-f", "null", "-"] for quality in renditions}
+        )
+        source = cmd.index("-i")
+        cmd[source:source] = ["-f", "lavfi"]
+        return subprocess.Popen(cmd, preexec_fn=apply_worker_isolation if isolated else None)
+
+    def handle(self, *args, **options):
+        url = options['url'] or f"{settings.BASE_URL}/api/videos/"
+        count = options['requests']
+        isolated = not options['no_isolation']
+
+        self.stdout.write(f"📏 Mesure au repos : {count} requêtes sur {url}")
+        idle = self.measure(url, count, options['token'])
+
+        self.stdout.write(f"📏 Mesure pendant un transcodage ({'isolé' if isolated else 'non isolé'})")
+        work_dir = tempfile.mkdtemp(prefix="latency_")
+        transcode = self.start_transcode(isolated, work_dir)
+        try:
+            # Laisse l'encodeur monter en charge avant de mesurer
+            time.sleep(2)
+            loaded = self.measure(url, count, options['token'])
+        finally:
+            transcode.terminate()
+            transcode.wait()
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        report = {"url": url, "isolated": isolated, "idle": idle, "transcoding": loaded}
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for label, result in (("Au repos", idle), ("Transcodage", loaded)):
+            if "p50_ms" not in result:
+                self.stdout.write(f"{label:12} : pas assez de réponses ({result['errors']} erreurs)")
+                continue
+            self.stdout.write(
+                f"{label:12} : p50 {result['p50_ms']} ms | p95 {result['p95_ms']} ms | "
+                f"p99 {result['p99_ms']} ms | max {result['max_ms']} ms | erreurs {result['errors']}"
+            )
@@ -0,0 +1,246 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.db.models import Min
+from django.test import override_settings
+from django.utils import timezone as django_timezone
+from apps.users.models import User
+from apps.videos.models import Video, VideoProcessingTask
+from apps.videos.jobs import enqueue_video_processing, run_worker
+from helpers.helper import get_available_info
+from threading import Thread, Event
+import json
+import os
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+
+# Vidéos synthétiques déterministes : (taille, durée en secondes, pistes audio, pistes de sous-titres)
+BENCHMARK_PROFILES = {
+    "360p_10s_1a": ("640x360", 10, 1, 0),
+    "720p_30s_2a_1s": ("1280x720", 30, 2, 1),
+    "1080p_20s_1a_2s": ("1920x1080", 20, 1, 2),
+}
+
+# Une régression sur ces mesures fait échouer la commande
+COMPARED_METRICS = ("wall_s", "cpu_s", "peak_rss_kb", "bytes_written")
+
+LANGUAGES = ["fra", "eng", "mlg"]
+
+def write_subtitles(path, duration, index):
+    with open(path, 'w') as f:
+        for second in range(0, duration, 2):
+            start = time.strftime('%H:%M:%S', time.gmtime(second))
+            end = time.strftime('%H:%M:%S', time.gmtime(min(second + 2, duration)))
+            f.write(f"{second // 2 + 1}\n{start},000 --> {end},000\nPiste {index} - {second}s\n\n")
+
+def generate_test_video(output_path, size, duration, audio_tracks, subtitle_tracks):
+    work_dir = os.path.dirname(output_path)
+    cmd = [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=30:duration={duration}"
+    ]
+    for i in range(audio_tracks):
+        cmd += ["-f", "lavfi", "-i", f"sine=frequency={440 * (i + 1)}:sample_rate=48000:duration={duration}"]
+    for i in range(subtitle_tracks):
+        subtitle_path = os.path.join(work_dir, f"subs_{i}.srt")
+        write_subtitles(subtitle_path, duration, i)
+        cmd += ["-i", subtitle_path]
+    for i in range(1 + audio_tracks + subtitle_tracks):
+        cmd += ["-map", f"{i}:0"]
+    for i in range(audio_tracks):
+        cmd += [f"-metadata:s:a:{i}", f"language={LANGUAGES[i % len(LANGUAGES)]}"]
+    for i in range(subtitle_tracks):
+        cmd += [f"-metadata:s:s:{i}", f"language={LANGUAGES[i % len(LANGUAGES)]}"]
+    cmd += [
+        "-c:v", "libx264", "-preset", "veryfast", "-g", "60", "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-c:s", "mov_text",
+        "-fflags", "+bitexact", "-flags:v", "+bitexact", "-flags:a", "+bitexact",
+        output_path
+    ]
+    subprocess.run(cmd, check=True)
+    return output_path
+
+def process_tree_rss_kb(pid):
+    # RSS du processus et de tous ses descendants (ffmpeg compris), lu dans /proc. Les enfants
+    # sont rattachés au thread qui les a lancés : chaque /proc/<pid>/task/<tid>/children est lu
+    total = 0
+    pending = [pid]
+    seen = set()
+    while pending:
+        current = pending.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+        try:
+            with open(f"/proc/{current}/status") as f:
+                total += next((int(line.split()[1]) for line in f if line.startswith("VmRSS:")), 0)
+            threads = os.listdir(f"/proc/{current}/task")
+        except (OSError, ValueError):
+            continue
+        for thread in threads:
+            try:
+                with open(f"/proc/{current}/task/{thread}/children") as f:
+                    pending += [int(child) for child in f.read().split()]
+            except (OSError, ValueError):
+                continue
+    return total
+
+def directory_size(path):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path) for name in names
+        if os.path.exists(os.path.join(root, name))
+    )
+
+def cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+def measure_stage(media_root, media_duration, stage):
+    peak = {"rss": process_tree_rss_kb(os.getpid())}
+    done = Event()
+
+    def sample():
+        while not done.wait(0.05):
+            peak["rss"] = max(peak["rss"], process_tree_rss_kb(os.getpid()))
+
+    sampler = Thread(target=sample, daemon=True)
+    bytes_before = directory_size(media_root)
+    cpu_before = cpu_seconds()
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        stage()
+    finally:
+        wall = time.perf_counter() - start
+        done.set()
+        sampler.join()
+    return {
+        "wall_s": round(wall, 3),
+        "cpu_s": round(cpu_seconds() - cpu_before, 3),
+        "realtime_factor": round(media_duration / wall, 2) if wall > 0 else None,
+        "peak_rss_kb": peak["rss"],
+        "bytes_written": max(directory_size(media_root) - bytes_before, 0),
+    }
+
+def run_pipeline(video_id):
+    # Pipeline de production : tâches de la file (PROBE, THUMBNAILS, CONVERSION, TRACKS,
+    # RENDITION / CHUNK / STITCH, TRICKPLAY) exécutées par un worker en ligne restreint à la vidéo
+    enqueue_video_processing(video_id)
+    tasks = VideoProcessingTask.objects.filter(video_id=video_id)
+    while True:
+        run_worker(worker_id="benchmark", burst=True, video_ids=[video_id])
+        # Tâches reportées (STITCH en attente des morceaux) : on attend leur échéance
+        next_run = tasks.filter(status__in=['PENDING', 'PROCESSING']).aggregate(next_run=Min('run_after'))['next_run']
+        if next_run is None:
+            break
+        time.sleep(max((next_run - django_timezone.now()).total_seconds(), 0.1))
+    failed = list(tasks.filter(status='FAILED').values_list('task_type', 'error_message'))
+    if failed:
+        raise CommandError("Tâches en échec : " + "; ".join(f"{task_type} ({error})" for task_type, error in failed))
+
+def compare_to_baseline(results, baseline, tolerance):
+    regressions = []
+    for profile, stages in results.items():
+        for stage, metrics in stages.items():
+            reference = baseline.get(profile, {}).get(stage)
+            if not reference:
+                continue
+            for metric in COMPARED_METRICS:
+                if reference.get(metric) and metrics[metric] > reference[metric] * (1 + tolerance):
+                    regressions.append(
+                        f"{profile}/{stage} {metric} : {metrics[metric]} > {reference[metric]} (+{tolerance:.0%})"
+                    )
+    return regressions
+
+class Command(BaseCommand):
+    help = "Benchmark du pipeline vidéo sur des médias synthétiques (lavfi), comparé à une référence enregistrée."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', nargs='*', default=None, help=f"Profils à exécuter ({', '.join(BENCHMARK_PROFILES)})")
+        parser.add_argument('--baseline', default=None, help="Fichier JSON de référence (défaut : VIDEO_BENCHMARK_BASELINE)")
+        parser.add_argument('--save-baseline', action='store_true', help="Enregistre les résultats comme nouvelle référence")
+        parser.add_argument('--tolerance', type=float, default=None, help="Écart toléré avant régression (ex. 0.2 pour 20 %%)")
+        parser.add_argument('--output', default=None, help="Écrit le rapport JSON dans ce fichier")
+        parser.add_argument('--keep', action='store_true', help="Conserve les fichiers générés")
+
+    def run_profile(self, name, media_root):
+        size, duration, audio_tracks, subtitle_tracks = BENCHMARK_PROFILES[name]
+        source_dir = os.path.join(media_root, "videos")
+        os.makedirs(source_dir, exist_ok=True)
+        source_path = generate_test_video(
+            os.path.join(source_dir, f"benchmark_{name}.mp4"), size, duration, audio_tracks, subtitle_tracks
+        )
+        user = User.objects.create(
+            name="benchmark", email=f"benchmark-{name}@example.invalid", birth_date=None, sexe='I'
+        )
+        self.users.append(user)
+        video = Video.objects.create(
+            titre=f"Benchmark {name}", description="Vidéo synthétique",
+            fichier=os.path.relpath(source_path, media_root), envoyeur=user
+        )
+        self.video_ids.append(video.id)
+
+        stages = {"get_available_info": measure_stage(media_root, duration, lambda: get_available_info(source_path))}
+        stages["pipeline"] = measure_stage(media_root, duration, lambda: run_pipeline(video.id))
+        return stages
+
+    def cleanup(self):
+        VideoProcessingTask.objects.filter(video_id__in=self.video_ids).delete()
+        Video.objects.filter(id__in=self.video_ids).delete()
+        for user in self.users:
+            user.delete()
+
+    def handle(self, *args, **options):
+        profiles = options['profiles'] or list(BENCHMARK_PROFILES)
+        unknown = [name for name in profiles if name not in BENCHMARK_PROFILES]
+        if unknown:
+            raise CommandError(f"Profils inconnus : {', '.join(unknown)}")
+        baseline_path = options['baseline'] or settings.VIDEO_BENCHMARK_BASELINE
+        tolerance = settings.VIDEO_BENCHMARK_TOLERANCE if options['tolerance'] is None else options['tolerance']
+
+        # Un worker actif réserverait les tâches du benchmark et écrirait dans le vrai MEDIA_ROOT
+        if VideoProcessingTask.objects.filter(status='PROCESSING', locked_until__gte=django_timezone.now()).exists():
+            raise CommandError("Des workers vidéo sont actifs : lancer le benchmark sur une instance sans worker")
+
+        media_root = tempfile.mkdtemp(prefix="video_benchmark_")
+        results = {}
+        self.users, self.video_ids = [], []
+        try:
+            # MEDIA_ROOT isolé ; les lignes créées sont supprimées à la fin (le worker en ligne
+            # valide ses propres transactions, une transaction englobante annulée n'est pas possible).
+            # Un seul essai par tâche : un échec arrête le benchmark au lieu d'attendre le backoff
+            with override_settings(MEDIA_ROOT=media_root, VIDEO_TASK_MAX_ATTEMPTS=1):
+                for name in profiles:
+                    self.stdout.write(f"⏱️ Profil {name}...")
+                    results[name] = self.run_profile(name, media_root)
+        finally:
+            self.cleanup()
+            if options['keep']:
+                self.stdout.write(f"📁 Fichiers conservés dans {media_root}")
+            else:
+                shutil.rmtree(media_root, ignore_errors=True)
+
+        report = json.dumps(results, indent=2)
+        self.stdout.write(report)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(report)
+
+        if options['save_baseline']:
+            os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+            with open(baseline_path, 'w') as f:
+                f.write(report)
+            self.stdout.write(f"✅ Référence enregistrée dans {baseline_path}")
+            return
+        if not os.path.exists(baseline_path):
+            self.stdout.write(f"[❗] Pas de référence ({baseline_path}) : relancer avec --save-baseline")
+            return
+        with open(baseline_path) as f:
+            regressions = compare_to_baseline(results, json.load(f), tolerance)
+        if regressions:
+            raise CommandError("Régressions de performance :\n" + "\n".join(regressions))
+        self.stdout.write(f"✅ Aucune régression au-delà de {tolerance:.0%}")
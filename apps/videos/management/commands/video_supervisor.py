@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from apps.videos.isolation import worker_cpu_count
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+class Command(BaseCommand):
+    help = "Lance et supervise N processus video_worker isolés (nice, ionice, affinité CPU, cgroup) hors du processus Daphne."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=None, help="Nombre de workers (défaut : VIDEO_WORKER_PROCESSES ou le budget CPU)")
+        parser.add_argument('--poll-interval', type=float, default=None, help="Transmis à chaque worker")
+
+    def worker_command(self, index, poll_interval):
+        cmd = [
+            sys.executable, os.path.join(settings.BASE_DIR, "manage.py"), "video_worker",
+            "--worker-id", f"{socket.gethostname()}:{os.getpid()}:w{index}"
+        ]
+        if poll_interval:
+            cmd += ["--poll-interval", str(poll_interval)]
+        return cmd
+
+    def handle(self, *args, **options):
+        processes = options['processes'] or settings.VIDEO_WORKER_PROCESSES or worker_cpu_count()
+        poll_interval = options['poll_interval']
+        stopping = {"value": False}
+
+        def stop(signum, frame):
+            self.stdout.write("🛑 Arrêt demandé, arrêt des workers...")
+            stopping["value"] = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        self.stdout.write(f"🚀 Démarrage de {processes} workers vidéo...")
+        children = {index: subprocess.Popen(self.worker_command(index, poll_interval)) for index in range(processes)}
+        restart_at = {}
+        while not stopping["value"]:
+            for index, child in list(children.items()):
+                if child is None or child.poll() is None:
+                    continue
+                # Worker mort : relancé après un délai pour éviter une boucle de crash
+                self.stdout.write(f"[❗] Worker w{index} terminé (code {child.returncode}), redémarrage...")
+                children[index] = None
+                restart_at[index] = time.monotonic() + settings.VIDEO_SUPERVISOR_RESTART_DELAY
+            for index, at in list(restart_at.items()):
+                if time.monotonic() >= at:
+                    children[index] = subprocess.Popen(self.worker_command(index, poll_interval))
+                    del restart_at[index]
+            time.sleep(1)
+
+        running = [child for child in children.values() if child is not None and child.poll() is None]
+        for child in running:
+            child.send_signal(signal.SIGTERM)
+        deadline = time.monotonic() + settings.VIDEO_SUPERVISOR_STOP_TIMEOUT
+        for child in running:
+            try:
+                child.wait(timeout=max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                child.kill()
+        self.stdout.write("✅ Workers arrêtés.")
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from apps.videos.jobs import run_worker, default_worker_id
+from apps.videos.isolation import apply_worker_isolation
+from threading import Event
+import signal
+
+class Command(BaseCommand):
+    help = "Worker de traitement vidéo (miniatures, conversion) consommant la file VideoProcessingTask. Peut être lancé en N processus sur plusieurs machines."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--worker-id', default=None, help="Identifiant du worker (défaut : hôte:pid)")
+        parser.add_argument('--poll-interval', type=float, default=None, help="Intervalle d'attente quand la file est vide (secondes)")
+        parser.add_argument('--burst', action='store_true', help="Traite les tâches disponibles puis s'arrête")
+        parser.add_argument('--no-isolation', action='store_true', help="Ne pas appliquer nice/ionice/affinité CPU/cgroup")
+
+    def handle(self, *args, **options):
+        stop_event = Event()
+
+        def stop(signum, frame):
+            self.stdout.write("🛑 Arrêt demandé, fin de la tâche en cours...")
+            stop_event.set()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        worker_id = options['worker_id'] or default_worker_id()
+        if not options['no_isolation']:
+            isolation = apply_worker_isolation()
+            self.stdout.write(f"🔒 Isolation du worker : {isolation}")
+        self.stdout.write(f"🚀 Démarrage du worker {worker_id}...")
+        run_worker(
+            worker_id=worker_id,
+            poll_interval=options['poll_interval'],
+            burst=options['burst'],
+            stop_event=stop_event,
+        )
+        self.stdout.write("✅ Worker arrêté.")
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone as django_timezone
 from apps.users.models import User, default_created_at
 import uuid
 
@@ -45,6 +46,12 @@ class Playlist(models.Model):
         db_table = "playlist"
         
 class VideoUpload(models.Model):
+    STATUS_CHOICES = (
+        ('UPLOADING', 'Uploading'),
+        ('FINALIZING', 'Finalizing'),
+        ('FAILED', 'Failed'),
+    )
+
     upload_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="video_uploads")
     titre = models.CharField(max_length=200, blank=True)
@@ -54,6 +61,16 @@ class VideoUpload(models.Model):
     tags = models.CharField(max_length=500, blank=True)
     total_size = models.PositiveBigIntegerField()
     total_chunks = models.PositiveIntegerField()
+    # Taille commune des morceaux (seul le dernier est plus court), fixée par la première requête ;
+    # vide pour les uploads tus
+    chunk_size = models.PositiveBigIntegerField(null=True, blank=True)
+    # Bitmap des morceaux reçus (bit n = morceau n), à la place d'une ligne par morceau
+    received_chunks = models.BinaryField(default=b"")
+    # Compteurs tenus à jour à chaque morceau : progression et complétude en O(1)
+    received_bytes = models.PositiveBigIntegerField(default=0)
+    received_chunk_count = models.PositiveIntegerField(default=0)
+    # Finalisation (fsync, renommage, hash, création de la vidéo) faite par un worker
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='UPLOADING')
     created_at = models.DateTimeField(default=default_created_at)
 
     class Meta:
@@ -63,18 +80,20 @@ class VideoUpload(models.Model):
     def __str__(self):
         return f"Upload {self.upload_id} by {self.user}"
 
-class VideoChunk(models.Model):
-    video_upload = models.ForeignKey(VideoUpload, on_delete=models.CASCADE, related_name="chunks")
-    chunk_number = models.PositiveIntegerField()
-    chunk_file = models.FileField(upload_to="video_chunks/")
+class VideoContent(models.Model):
+    # Index de contenu : un fichier source identique n'est stocké et converti qu'une fois
+    sha256 = models.CharField(max_length=64, unique=True)
+    size = models.PositiveBigIntegerField()
+    storage_dir = models.CharField(max_length=255)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=default_created_at)
 
     class Meta:
-        db_table = "video_chunk"
+        db_table = "video_content"
         app_label = 'videos'
-        unique_together = ('video_upload', 'chunk_number')
 
     def __str__(self):
-        return f"Chunk {self.chunk_number} for upload {self.video_upload.upload_id}"
+        return f"{self.sha256[:12]} ({self.ref_count} réf.)"
 
 class Video(models.Model):
     code_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
@@ -82,6 +101,9 @@ class Video(models.Model):
     description = models.TextField()
     fichier = models.FileField(upload_to="videos/")
     affichage = models.ImageField(upload_to="videos/affichages/", null=True, blank=True)
+    # {"320": {"webp": "videos/1/affichages/...", "jpeg": "..."}, ...}
+    affichages = models.JSONField(default=dict, blank=True)
+    affichage_lqip = models.TextField(null=True, blank=True)
     envoyeur = models.ForeignKey(User, on_delete=models.CASCADE, related_name="videos_envoyees")
     
     categorie = models.CharField(max_length=200, blank=True, null=True)
@@ -96,6 +118,10 @@ class Video(models.Model):
     
     master_manifest_file = models.FileField(upload_to="videos/manifests/", null=True, blank=True)
     segments_dir = models.CharField(max_length=255, null=True, blank=True)
+    upload_id = models.UUIDField(null=True, blank=True)
+    content = models.ForeignKey(VideoContent, on_delete=models.SET_NULL, null=True, blank=True, related_name="videos")
+    # {"interval": 5, "width": 160, "height": 90, "tracks": {"jpeg": "videos/1/trickplay/thumbnails_jpeg.vtt", ...}}
+    trickplay = models.JSONField(default=dict, blank=True)
     
     uploaded_at = models.DateTimeField(default=default_created_at)
     updated_at = models.DateTimeField(default=default_created_at)
@@ -117,10 +143,42 @@ class VideoInfo(models.Model):
     height = models.IntegerField()
     duration = models.FloatField()
     size = models.IntegerField()
+    video_codec = models.CharField(max_length=50, null=True, blank=True)
+    video_profile = models.CharField(max_length=50, null=True, blank=True)
+    video_level = models.IntegerField(null=True, blank=True)
+    pix_fmt = models.CharField(max_length=50, null=True, blank=True)
+    audio_codec = models.CharField(max_length=50, null=True, blank=True)
+    bitrate = models.PositiveBigIntegerField(null=True, blank=True)
+    keyframe_interval = models.FloatField(null=True, blank=True)
+    # Instants des images clés sur toute la durée (sources H.264 uniquement)
+    keyframe_times = models.JSONField(null=True, blank=True)
+    # Échelle par titre : {"original": {"height": 1080, "bitrate": ..., "maxrate": ...}, "480p": {...}}
+    ladder = models.JSONField(null=True, blank=True)
 
     class Meta:
         db_table = "videoinfo"
 
+class VideoRendition(models.Model):
+    # Point de reprise d'une rendition : une conversion relancée saute celles déjà validées
+    STATUS_CHOICES = (
+        ('PROCESSING', 'Processing'),
+        ('COMPLETED', 'Completed'),
+    )
+    video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name="renditions")
+    quality = models.CharField(max_length=50)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PROCESSING')
+    segment_count = models.PositiveIntegerField(default=0)
+    manifest_checksum = models.CharField(max_length=64, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "video_rendition"
+        app_label = 'videos'
+        unique_together = ('video', 'quality')
+
+    def __str__(self):
+        return f"{self.quality} (video {self.video_id}) - {self.status}"
+
 class VideoVue(models.Model):
     video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name="vues_detaillees")
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="vues_detaillees")
@@ -192,8 +250,15 @@ class Message(models.Model):
 
 class VideoProcessingTask(models.Model):
     TASK_TYPES = (
+        ('FINALIZE', 'Finalize Upload'),
+        ('PROBE', 'Probe Video'),
         ('THUMBNAILS', 'Generate Thumbnails'),
         ('CONVERSION', 'Convert Video'),
+        ('RENDITION', 'Encode Renditions'),
+        ('TRICKPLAY', 'Generate Trickplay Sprites'),
+        ('TRACKS', 'Extract Audio & Subtitle Tracks'),
+        ('CHUNK', 'Encode Chunk'),
+        ('STITCH', 'Stitch Chunks'),
     )
     STATUS_CHOICES = (
         ('PENDING', 'Pending'),
@@ -202,12 +267,27 @@ class VideoProcessingTask(models.Model):
         ('FAILED', 'Failed'),
     )
 
-    video_id = models.IntegerField()
+    video_id = models.IntegerField(null=True, blank=True)
+    user_id = models.IntegerField(null=True, blank=True)
     task_type = models.CharField(max_length=20, choices=TASK_TYPES)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    payload = models.JSONField(default=dict, blank=True)
+    priority = models.IntegerField(default=100)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=django_timezone.now)
+    locked_by = models.CharField(max_length=255, null=True, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     error_message = models.TextField(null=True, blank=True)
 
+    def __str__(self):
+        return f"{self.task_type} #{self.id} (video {self.video_id}) - {self.status}"
+
     class Meta:
-        db_table = 'video_processing_tasks'
\ No newline at end of file
+        db_table = 'video_processing_tasks'
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+            models.Index(fields=['status', 'priority', 'user_id']),
+        ]
@@ -9,35 +9,11 @@ from helpers.helper import (
     calcule_de_similarite_de_phrase, get_available_info, format_file_size, format_duration, format_views, 
     format_elapsed_time
 )
-from apps.videos.tasks import generate_video_affichage
+from apps.videos.tasks import save_video_info
+from apps.videos.jobs import request_video_affichage
 from django.db.models import Count
 from django.contrib.auth.models import AnonymousUser
-from queue import Queue
-from threading import Thread
 import os
-import time
-
-################################# WORKER #################################
-video_affichage_queue = Queue()
-
-def video_affichage_worker():
-    while True:
-        video_id = video_affichage_queue.get()
-        print("[!] 🖼️ Worker génère image pour vidéo ID:", video_id)
-        try:
-            generate_video_affichage(video_id)
-        except Exception as e:
-            print("[❌] Erreur dans le worker pour image ID:", video_id, str(e))
-        finally:
-            video_affichage_queue.task_done()
-            
-affichage_worker_thread = Thread(target=video_affichage_worker, daemon=True)
-affichage_worker_thread.start()
-
-processing_worker_thread = Thread(target=video_affichage_worker, daemon=True)
-processing_worker_thread.start()
-
-################################# WORKER #################################
 
 class TagSerializer(serializers.ModelSerializer):
     class Meta:
@@ -175,11 +151,12 @@ class SuggestedVideoSerializer(serializers.ModelSerializer):
     vues_count = serializers.SerializerMethodField()
     fichier_url = serializers.SerializerMethodField()
     affichage_url = serializers.SerializerMethodField()
+    affichages = serializers.SerializerMethodField()
 
     class Meta:
         model = Video
         fields = [
-            'id', 'titre', 'description', 'fichier_url', 'affichage_url', 'envoyeur',
+            'id', 'titre', 'description', 'fichier_url', 'affichage_url', 'affichages', 'affichage_lqip', 'envoyeur',
             'categorie', 'tags', 'visibilite',
             'autoriser_commentaire', 'ordre_de_commentaire', 'likes_count', 'dislikes_count',
             'vues_count', 'uploaded_at', 'updated_at', 'code_id'
@@ -189,10 +166,16 @@ class SuggestedVideoSerializer(serializers.ModelSerializer):
         return f"{settings.BASE_URL}{obj.fichier.url}" if obj.fichier else None
 
     def get_affichage_url(self, obj):
-        if obj.affichage is None:
-            video_affichage_queue.put(obj.id)
+        if not obj.affichage:
+            request_video_affichage(obj.id)
         return f"{settings.BASE_URL}{obj.affichage.url}" if obj.affichage else None
 
+    def get_affichages(self, obj):
+        return {
+            width: {image_format: f"{settings.BASE_URL}{settings.MEDIA_URL}{path}" for image_format, path in formats.items()}
+            for width, formats in (obj.affichages or {}).items()
+        }
+
     def get_likes_count(self, obj):
         return obj.likes.count()
 
@@ -208,17 +191,7 @@ class SuggestedVideoSerializer(serializers.ModelSerializer):
             try:
                 video_info = get_available_info(video_path)
                 if video_info and 'error' not in video_info:
-                    VideoInfo.objects.create(
-                        video=instance,
-                        qualities=video_info['qualities'],
-                        audio_languages=video_info.get('audio_tracks', []),
-                        subtitle_languages=video_info.get('subtitle_languages', []),
-                        fps=video_info['fps'],
-                        width=video_info['width'],
-                        height=video_info['height'],
-                        duration=video_info['duration'],
-                        size=video_info['size']
-                    )
+                    save_video_info(instance, video_info)
                     instance.refresh_from_db()
             except Exception as e:
                 print(f"Erreur lors de la génération des informations vidéo : {e}")
@@ -260,12 +233,13 @@ class VideoSerializer(serializers.ModelSerializer):
     vues_count = serializers.SerializerMethodField()
     fichier_url = serializers.SerializerMethodField()
     affichage_url = serializers.SerializerMethodField()
+    affichages = serializers.SerializerMethodField()
     suggested_videos = serializers.SerializerMethodField()
 
     class Meta:
         model = Video
         fields = [
-            'id', 'titre', 'description', 'fichier_url', 'affichage_url', 'envoyeur',
+            'id', 'titre', 'description', 'fichier_url', 'affichage_url', 'affichages', 'affichage_lqip', 'envoyeur',
             'categorie', 'tags', 'tag_ids', 'visibilite',
             'autoriser_commentaire', 'ordre_de_commentaire', 'likes_count', 'dislikes_count',
             'vues_count', 'uploaded_at', 'updated_at', 'suggested_videos', 'code_id'
@@ -276,9 +250,15 @@ class VideoSerializer(serializers.ModelSerializer):
     
     def get_affichage_url(self, obj):
         if not obj.affichage:
-            video_affichage_queue.put(obj.id)
+            request_video_affichage(obj.id)
         return f"{settings.BASE_URL}{obj.affichage.url}" if obj.affichage else None
 
+    def get_affichages(self, obj):
+        return {
+            width: {image_format: f"{settings.BASE_URL}{settings.MEDIA_URL}{path}" for image_format, path in formats.items()}
+            for width, formats in (obj.affichages or {}).items()
+        }
+
     def get_likes_count(self, obj):
         return obj.likes.count()
 
@@ -318,7 +298,9 @@ class VideoSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         tag_ids = validated_data.pop('tag_ids', None)
-        validated_data['envoyeur'] = self.context['request'].user
+        # Envoyeur fourni explicitement par les finalisations d'upload faites hors requête
+        if not validated_data.get('envoyeur'):
+            validated_data['envoyeur'] = self.context['request'].user
         video = Video.objects.create(**validated_data)
 
         if tag_ids:
@@ -345,17 +327,7 @@ class VideoSerializer(serializers.ModelSerializer):
             try:
                 video_info = get_available_info(video_path)
                 if video_info and 'error' not in video_info:
-                    VideoInfo.objects.create(
-                        video=instance,
-                        qualities=video_info['qualities'],
-                        audio_languages=video_info.get('audio_tracks', []),
-                        subtitle_languages=video_info.get('subtitle_languages', []),
-                        fps=video_info['fps'],
-                        width=video_info['width'],
-                        height=video_info['height'],
-                        duration=video_info['duration'],
-                        size=video_info['size']
-                    )
+                    save_video_info(instance, video_info)
                     instance.refresh_from_db()
             except Exception as e:
                 print(f"Erreur lors de la génération des informations vidéo : {e}")
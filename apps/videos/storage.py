@@ -0,0 +1,163 @@
+from apps.videos.models import Video, VideoContent
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Subquery
+import hashlib
+import json
+import os
+import shutil
+
+# Champs dérivés du fichier source, partagés par toutes les vidéos d'un même contenu
+SHARED_FIELDS = (
+    'fichier', 'affichage', 'affichages', 'affichage_lqip',
+    'master_manifest_file', 'segments_dir', 'trickplay'
+)
+
+def new_content_hasher():
+    return hashlib.sha256()
+
+def hash_file(path, block_size=1024 * 1024):
+    hasher = new_content_hasher()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def get_storage_dir(video):
+    # Dossier (relatif à MEDIA_ROOT) contenant le fichier source, les segments et le master
+    if video.content_id:
+        return video.content.storage_dir
+    return os.path.join("videos", str(video.id))
+
+def get_tracks_marker_path(segments_dir):
+    return os.path.join(segments_dir, "tracks.json")
+
+def write_tracks_marker(segments_dir, audio_manifests, subtitle_manifests):
+    # Marqueur écrit sur un fichier temporaire puis renommé : jamais lu à moitié écrit
+    marker_path = get_tracks_marker_path(segments_dir)
+    tmp_path = f"{marker_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({
+            "audio": [{"language": lang, "manifest": os.path.basename(m)} for lang, m in audio_manifests],
+            "subtitles": [{"language": lang, "manifest": os.path.basename(m)} for lang, m in subtitle_manifests]
+        }, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, marker_path)
+
+def read_tracks_marker(segments_dir):
+    # Pistes réellement produites (noms de fichiers dédoublonnés) ; None tant qu'elles ne sont pas prêtes
+    try:
+        with open(get_tracks_marker_path(segments_dir)) as f:
+            marker = json.load(f)
+    except (OSError, ValueError):
+        return None
+    tracks = {}
+    for kind, prefix in (("audio", "audio_"), ("subtitles", "subs_")):
+        tracks[kind] = []
+        for entry in marker.get(kind, []):
+            if isinstance(entry, str):
+                # Ancien format : liste des noms de playlists seuls
+                entry = {"language": entry[len(prefix):-len(".m3u8")], "manifest": entry}
+            tracks[kind].append(entry)
+    return tracks
+
+def register_video_content(video, sha256, size):
+    # Retourne True si le contenu existait déjà : la vidéo est alors liée aux fichiers existants
+    with transaction.atomic():
+        content, created = VideoContent.objects.select_for_update().get_or_create(
+            sha256=sha256,
+            defaults={'size': size, 'storage_dir': os.path.join("videos", str(video.id)), 'ref_count': 1}
+        )
+        if not created:
+            content.ref_count = F('ref_count') + 1
+            content.save(update_fields=['ref_count'])
+        Video.objects.filter(id=video.id).update(content=content)
+    video.content = content
+    if created:
+        return False
+
+    source = content.videos.exclude(id=video.id).order_by('id').first()
+    if source is None:
+        # Contenu sans vidéo vivante : cette vidéo en devient propriétaire et sera traitée normalement
+        VideoContent.objects.filter(id=content.id).update(storage_dir=os.path.join("videos", str(video.id)))
+        video.content = VideoContent.objects.get(id=content.id)
+        return False
+    uploaded_path = video.fichier.path if video.fichier else None
+    # Copie en une seule requête : une publication concurrente du master n'est pas écrasée
+    # par une valeur lue plus tôt
+    sources = Video.objects.filter(id=source.id)
+    Video.objects.filter(id=video.id).update(**{
+        field: Subquery(sources.values(field)[:1]) for field in SHARED_FIELDS
+    })
+    video.refresh_from_db()
+    if uploaded_path and uploaded_path != video.fichier.path and os.path.exists(uploaded_path):
+        os.remove(uploaded_path)
+
+    if hasattr(source, 'info'):
+        info = source.info
+        info.pk = None
+        info.id = None
+        info.video = video
+        info.save()
+    print(f"♻️ Contenu {sha256[:12]} déjà présent : vidéo {video.id} liée à la vidéo {source.id}")
+    return True
+
+def share_with_duplicates(video, **fields):
+    if not video.content_id:
+        return 0
+    return Video.objects.filter(content_id=video.content_id).exclude(id=video.id).update(**fields)
+
+def hand_over_content(video):
+    # La vidéo propriétaire du contenu (celle dont les tâches produisent les fichiers) disparaît
+    # ou a échoué : la plus ancienne autre vidéo du contenu reprend le rôle, dans son propre dossier
+    if not video.content_id:
+        return None
+    with transaction.atomic():
+        content = VideoContent.objects.select_for_update().filter(id=video.content_id).first()
+        if content is None or content.storage_dir != os.path.join("videos", str(video.id)):
+            return None
+        heir = content.videos.exclude(id=video.id).order_by('id').first()
+        if heir is None:
+            return None
+        content.storage_dir = os.path.join("videos", str(heir.id))
+        content.save(update_fields=['storage_dir'])
+    return heir
+
+def release_video_content(video):
+    # Retourne le dossier à supprimer quand plus aucune vidéo ne référence le contenu, sinon None
+    if not video.content_id:
+        return None
+    with transaction.atomic():
+        content = VideoContent.objects.select_for_update().filter(id=video.content_id).first()
+        if content is None:
+            return None
+        if content.ref_count > 1:
+            content.ref_count = F('ref_count') - 1
+            content.save(update_fields=['ref_count'])
+            return None
+        storage_dir = content.storage_dir
+        content.delete()
+    return os.path.join(settings.MEDIA_ROOT, storage_dir)
+
+def delete_video_files(video):
+    # Retourne False si les fichiers sont conservés car partagés avec d'autres vidéos
+    dirs = [os.path.join(settings.MEDIA_ROOT, "videos", str(video.id))]
+    if video.content_id:
+        storage_dir = release_video_content(video)
+        if storage_dir is None:
+            return False
+        dirs.append(storage_dir)
+    for field in (video.fichier, video.affichage):
+        if field and os.path.exists(field.path):
+            os.remove(field.path)
+    # Toutes les tailles et formats d'affichage, y compris ceux écrits hors du dossier de la vidéo
+    for formats in (video.affichages or {}).values():
+        for path in formats.values():
+            poster_path = os.path.join(settings.MEDIA_ROOT, path)
+            if os.path.exists(poster_path):
+                os.remove(poster_path)
+    for directory in dirs:
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+    return True
@@ -1,215 +1,557 @@
-from apps.videos.models import Video, VideoInfo
-from helpers.helper import get_available_info, convert_video_quality, extract_random_frame
+from apps.videos.models import Video, VideoInfo, VideoRendition
+from apps.videos.transcoder import (
+    run_ladder, write_master_playlist, variant_entry, measure_playlist, get_quality_height,
+    generate_trickplay, parse_media_playlist, analyze_complexity, plan_adaptive_ladder,
+    build_ladder_command, build_split_command, build_stitch_command, run_ffmpeg, quality_key, can_remux,
+    build_media_tracks_command, can_copy_audio, TEXT_SUBTITLE_CODECS, segment_webvtt, segment_boundaries, first_segment_mpegts
+)
+from apps.videos.storage import (
+    share_with_duplicates, get_storage_dir, get_tracks_marker_path, write_tracks_marker, read_tracks_marker
+)
+from helpers.helper import get_available_info, extract_poster_set
 import os
-import subprocess
 import shutil
+import fcntl
+import hashlib
+import json
+import time
 import ffmpeg
 from pathlib import Path
 from django.conf import settings
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
 
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+def playlist_is_complete(manifest_path):
+    if not os.path.exists(manifest_path):
+        return False
+    with open(manifest_path) as f:
+        return "#EXT-X-ENDLIST" in f.read()
+
+def media_track_name(prefix, lang, used):
+    # Deux pistes de même langue ne doivent pas écrire dans les mêmes fichiers
+    name = f"{prefix}{lang}"
+    suffix = 1
+    while name in used:
+        suffix += 1
+        name = f"{prefix}{lang}{suffix}"
+    used.add(name)
+    return name
+
+def media_tracks_ready(segments_dir):
+    return os.path.exists(get_tracks_marker_path(segments_dir))
+
+def generate_media_tracks(video_path, segments_dir, probe):
+    audio_streams = [s for s in probe['streams'] if s['codec_type'] == 'audio']
+    # Les sous-titres image (PGS, DVD) ne sont pas convertibles en WebVTT
+    subtitle_streams = [
+        (idx, s) for idx, s in enumerate(s for s in probe['streams'] if s['codec_type'] == 'subtitle')
+        if s.get('codec_name') in TEXT_SUBTITLE_CODECS
+    ]
+    used = set()
+    tracks_done = media_tracks_ready(segments_dir)
+    audio_tracks, subtitle_tracks = [], []
+    audio_manifests, subtitle_manifests = [], []
+    for idx, stream in enumerate(audio_streams):
+        lang = stream.get('tags', {}).get('language', f"lang{idx}")
+        name = media_track_name("audio_", lang, used)
+        audio_manifest = os.path.join(segments_dir, f"{name}.m3u8")
+        audio_manifests.append((lang, audio_manifest))
+        # Pistes déjà produites par un essai précédent non refaites
+        if not playlist_is_complete(audio_manifest):
+            audio_tracks.append((idx, name, can_copy_audio(stream)))
+    for idx, stream in subtitle_streams:
+        lang = stream.get('tags', {}).get('language', f"sub{idx}")
+        name = media_track_name("subs_", lang, used)
+        subtitle_manifest = os.path.join(segments_dir, f"{name}.m3u8")
+        subtitle_manifests.append((lang, subtitle_manifest))
+        # Le .vtt complet est découpé sur les segments vidéo à la publication du master ;
+        # sans marqueur, il peut être tronqué par un essai interrompu
+        if not (tracks_done and os.path.exists(os.path.join(segments_dir, f"{name}.vtt"))):
+            subtitle_tracks.append((idx, name, stream.get('codec_name')))
+
+    if audio_tracks or subtitle_tracks:
+        run_ffmpeg(build_media_tracks_command(video_path, segments_dir, audio_tracks, subtitle_tracks))
+
+    # Le master n'est publié qu'une fois les pistes prêtes (sinon lecture sans son)
+    write_tracks_marker(segments_dir, audio_manifests, subtitle_manifests)
+    return audio_manifests, subtitle_manifests
+
+def generate_video_tracks(video_id):
+    video = Video.objects.get(id=video_id)
+    segments_dir = os.path.join(settings.MEDIA_ROOT, "videos", str(video.id), "segments", "original")
+    os.makedirs(segments_dir, exist_ok=True)
+    generate_media_tracks(video.fichier.path, segments_dir, ffmpeg.probe(video.fichier.path))
+    print("✅ Pistes audio et sous-titres générées.")
+    # Publie le master si une rendition vidéo attendait les pistes
+    publish_master_playlist(video_id)
+
 def generate_video_segments(video_id, quality=None):
     try:
         video = Video.objects.get(id=video_id)
         video_dir = os.path.join(settings.MEDIA_ROOT, "videos", str(video.id))
         original_filename = os.path.basename(video.fichier.path)
-        if quality == "original":
-            video_path = os.path.join(video_dir, original_filename)
-        else:
-            video_path = os.path.join(video_dir, "qualities", quality, original_filename)
-        
-        segments_dir = os.path.join(video_dir, "segments", quality or "original")
-        os.makedirs(segments_dir, exist_ok=True)
+        # Toutes les qualités sont encodées directement depuis la source, sans MP4 intermédiaire
+        video_path = os.path.join(video_dir, original_filename)
+        segments_base_dir = os.path.join(video_dir, "segments")
 
-        probe = ffmpeg.probe(video_path)
-        audio_streams = [s for s in probe['streams'] if s['codec_type'] == 'audio']
-        subtitle_streams = [s for s in probe['streams'] if s['codec_type'] == 'subtitle']
-
-        # Générer le manifeste vidéo
-        video_manifest = os.path.join(segments_dir, "video.m3u8")
-        cmd_video = [
-            "ffmpeg", "-i", video_path,
-            "-map", "0:v", "-c:v", "copy",
-            "-f", "hls", "-hls_time", "10", "-hls_list_size", "0",
-            "-hls_segment_filename", os.path.join(segments_dir, "video_%03d.ts"),
-            video_manifest
-        ]
-        subprocess.run(cmd_video, check=True)
-
-        # Générer les manifestes audio (uniquement pour la qualité "original")
+        video_manifest = run_ladder(video_path, [quality or "original"], segments_base_dir)[0]["manifest"]
+        segments_dir = os.path.dirname(video_manifest)
+        variant = variant_entry(quality or "original", video_manifest)
+        bandwidth, resolution = str(variant["bandwidth"]), variant["resolution"]
+
+        # Audio et sous-titres uniquement pour "original" car identiques pour toutes les qualités
         audio_manifests = []
-        if quality == "original":  # Audio uniquement pour "original" car identique pour toutes les qualités
-            for idx, stream in enumerate(audio_streams):
-                lang = stream.get('tags', {}).get('language', f"lang{idx}")
-                audio_manifest = os.path.join(segments_dir, f"audio_{lang}.m3u8")
-                cmd_audio = [
-                    "ffmpeg", "-i", video_path,
-                    "-map", f"0:a:{idx}", "-c:a", "aac",
-                    "-f", "hls", "-hls_time", "10", "-hls_list_size", "0",
-                    "-hls_segment_filename", os.path.join(segments_dir, f"audio_{lang}_%03d.ts"),
-                    audio_manifest
-                ]
-                subprocess.run(cmd_audio, check=True)
-                audio_manifests.append((lang, audio_manifest))
-
-        # Générer les manifestes de sous-titres (uniquement pour "original")
         subtitle_manifests = []
         if quality == "original":
-            for idx, stream in enumerate(subtitle_streams):
-                lang = stream.get('tags', {}).get('language', f"sub{idx}")
-                subtitle_vtt = os.path.join(segments_dir, f"subs_{lang}.vtt")
-                cmd_subtitle = [
-                    "ffmpeg", "-i", video_path,
-                    "-map", f"0:s:{idx}", "-c:s", "webvtt",
-                    subtitle_vtt
-                ]
-                subprocess.run(cmd_subtitle, check=True)
-                subtitle_manifest = os.path.join(segments_dir, f"subs_{lang}.m3u8")
-                duration = probe['format']['duration']
-                with open(subtitle_manifest, 'w') as f:
-                    f.write("#EXTM3U\n#EXT-X-TARGETDURATION:10\n#EXT-X-VERSION:3\n")
-                    f.write("#EXT-X-MEDIA-SEQUENCE:0\n#EXT-X-PLAYLIST-TYPE:VOD\n")
-                    f.write(f"#EXTINF:{duration},\n{os.path.basename(subtitle_vtt)}\n")
-                    f.write("#EXT-X-ENDLIST\n")
-                subtitle_manifests.append((lang, subtitle_manifest))
-
-        # Retourner les informations nécessaires pour le manifeste maître
-        bandwidth = {
-            "original": "8000000",
-            "2160p": "16000000",
-            "1440p": "8000000",
-            "1080p": "5000000",
-            "720p": "2800000",
-            "480p": "1400000",
-            "360p": "800000",
-            "240p": "400000",
-            "144p": "200000"
-        }.get(quality or "original", "5000000")
-        resolution = {
-            "original": "1920x1080",
-            "2160p": "3840x2160",
-            "1440p": "2560x1440",
-            "1080p": "1920x1080",
-            "720p": "1280x720",
-            "480p": "842x480",
-            "360p": "640x360",
-            "240p": "426x240",
-            "144p": "256x144"
-        }.get(quality or "original", "1920x1080")
+            probe = ffmpeg.probe(video_path)
+            audio_manifests, subtitle_manifests = generate_media_tracks(video_path, segments_dir, probe)
 
         return video_manifest, segments_dir, bandwidth, resolution, audio_manifests, subtitle_manifests
     except Exception as e:
         print(f"Erreur lors de la génération des segments : {e}")
         return None, None, None, None, [], []
 
-def process_video_conversion(video_id):
+def save_video_info(video, video_info):
+    qualities = video_info['qualities']
+    existing = VideoInfo.objects.filter(video=video).exclude(ladder__isnull=True).first()
+    if existing is not None:
+        # Les qualités écartées par l'analyse de complexité ne réapparaissent pas
+        qualities = existing.qualities
+    VideoInfo.objects.update_or_create(
+        video=video,
+        defaults={
+            "qualities": qualities,
+            "audio_languages": video_info.get('audio_tracks', []),
+            "subtitle_languages": video_info.get('subtitle_languages', []),
+            "fps": video_info['fps'],
+            "width": video_info['width'],
+            "height": video_info['height'],
+            "duration": video_info['duration'],
+            "size": video_info['size'],
+            "video_codec": video_info.get('video_codec'),
+            "video_profile": video_info.get('video_profile'),
+            "video_level": video_info.get('video_level'),
+            "pix_fmt": video_info.get('pix_fmt'),
+            "audio_codec": video_info.get('audio_codec'),
+            "bitrate": video_info.get('bitrate'),
+            "keyframe_interval": video_info.get('keyframe_interval'),
+            "keyframe_times": video_info.get('keyframe_times')
+        }
+    )
+
+def probe_video(video_id):
+    video = Video.objects.get(id=video_id)
+    save_video_info(video, get_available_info(video.fichier.path))
+    print("✅ Informations vidéo enregistrées...")
+
+def plan_rendition_groups(qualities):
+    # La qualité la plus basse est encodée seule et en premier (lecture possible au plus vite),
+    # "original" (copie) et les autres qualités partagent ensuite une seule passe ffmpeg
+    lower_qualities = qualities[1:]
+    if not lower_qualities:
+        return [["original"]]
+    return [[lower_qualities[-1]], ["original"] + lower_qualities[:-1]]
+
+def prepare_video_conversion(video_id):
     print("🎊 Process video conversion...")
-    try:
+    video = Video.objects.get(id=video_id)
+    video_path = video.fichier.path
+    video_dir = os.path.join(settings.MEDIA_ROOT, "videos", str(video.id))
+    os.makedirs(video_dir, exist_ok=True)
+
+    original_filename = os.path.basename(video_path)
+    new_path = os.path.join(video_dir, original_filename)
+    video_info = get_available_info(video_path if os.path.exists(video_path) else new_path)
+    save_video_info(video, video_info)
+    if video_path != new_path:
+        # Un essai précédent a pu déplacer le fichier sans enregistrer le nouveau chemin
+        if os.path.exists(video_path):
+            shutil.move(video_path, new_path)
+        video.fichier.name = os.path.relpath(new_path, settings.MEDIA_ROOT)
+        video.save(update_fields=['fichier'])
+        share_with_duplicates(video, fichier=video.fichier.name)
+
+    os.makedirs(os.path.join(video_dir, "segments", "original"), exist_ok=True)
+
+    # Les pistes audio / sous-titres sont produites en parallèle de l'échelle vidéo (generate_video_tracks)
+    info = VideoInfo.objects.get(video=video)
+    if settings.VIDEO_ADAPTIVE_LADDER and info.ladder is None:
+        plan_video_ladder(info, new_path)
+    return plan_rendition_groups(info.qualities)
+
+def plan_video_ladder(info, video_path):
+    # Hauteur paire pour l'encodeur (yuv420p)
+    source_height = info.height - info.height % 2
+    heights = [source_height] + [get_quality_height(q) for q in info.qualities[1:] if get_quality_height(q)]
+    bitrates = analyze_complexity(video_path, info.duration, heights)
+    qualities, ladder = plan_adaptive_ladder(info.qualities, source_height, bitrates)
+    dropped = [q for q in info.qualities if q not in qualities]
+    if dropped:
+        print(f"📉 Qualités écartées (débit trop proche de la voisine) : {', '.join(dropped)}")
+    info.qualities = qualities
+    info.ladder = ladder
+    info.save(update_fields=['qualities', 'ladder'])
+    return ladder
+
+def collect_variant_manifests(segments_base_dir, fallback_fps=None, audio=None):
+    variants = []
+    for quality in os.listdir(segments_base_dir):
+        manifest = os.path.join(segments_base_dir, quality, "video.m3u8")
+        if not os.path.exists(manifest):
+            continue
+        with open(manifest) as f:
+            # Rendition publiée uniquement une fois le manifeste VOD terminé
+            if "#EXT-X-ENDLIST" not in f.read():
+                continue
+        variants.append(variant_entry(quality, manifest, fallback_fps=fallback_fps, audio=audio))
+    variants.sort(key=lambda v: (v["quality"] != "original", -(get_quality_height(v["quality"]) or 0)))
+    return variants
+
+def collect_track_manifests(original_segments_dir, kind, prefix):
+    # (langue réelle, nom unique, playlist) lus dans tracks.json, comme le consumer de streaming :
+    # deux pistes "eng" donnent les noms "eng" et "eng2" mais gardent LANGUAGE="eng"
+    manifests = []
+    for entry in (read_tracks_marker(original_segments_dir) or {}).get(kind, []):
+        manifest = os.path.join(original_segments_dir, entry["manifest"])
+        if os.path.exists(manifest):
+            manifests.append((entry["language"], entry["manifest"][len(prefix):-len(".m3u8")], manifest))
+    return manifests
+
+def has_complete_variant(segments_base_dir):
+    if not os.path.isdir(segments_base_dir):
+        return False
+    return any(
+        playlist_is_complete(os.path.join(segments_base_dir, quality, "video.m3u8"))
+        for quality in os.listdir(segments_base_dir)
+    )
+
+def get_master_lock_path(video_id):
+    return os.path.join(settings.MEDIA_ROOT, "videos", str(video_id), ".master.lock")
+
+def trickplay_session_data(video, video_dir):
+    # Pistes de vignettes référencées dans le master (EXT-X-SESSION-DATA), relatives au master
+    tracks = (video.trickplay or {}).get("tracks", {})
+    return [
+        (f"{settings.VIDEO_TRICKPLAY_DATA_ID}.{image_format}", os.path.relpath(os.path.join(settings.MEDIA_ROOT, path), video_dir))
+        for image_format, path in sorted(tracks.items())
+    ]
+
+def segment_subtitle_tracks(original_segments_dir, variant_manifests, video):
+    # Sous-titres découpés sur les frontières des segments vidéo, une seule fois par piste
+    reference_manifest = os.path.join(
+        original_segments_dir, os.pardir, variant_manifests[0]["quality"], "video.m3u8"
+    ) if variant_manifests else None
+    duration = video.info.duration if hasattr(video, 'info') else 0
+    subtitle_playlists = [entry["manifest"] for entry in (read_tracks_marker(original_segments_dir) or {}).get("subtitles", [])]
+    for playlist in subtitle_playlists:
+        track = playlist[:-len(".m3u8")]
+        vtt_path = os.path.join(original_segments_dir, f"{track}.vtt")
+        if os.path.exists(os.path.join(original_segments_dir, playlist)) or not os.path.exists(vtt_path):
+            continue
+        segment_webvtt(
+            vtt_path, original_segments_dir, track,
+            segment_boundaries(reference_manifest, duration), first_segment_mpegts(reference_manifest)
+        )
+        print(f"💬 Sous-titres {track} segmentés.")
+
+def publish_master_playlist(video_id):
+    video_dir = os.path.join(settings.MEDIA_ROOT, "videos", str(video_id))
+    segments_base_dir = os.path.join(video_dir, "segments")
+    original_segments_dir = os.path.join(segments_base_dir, "original")
+    master_manifest_path = os.path.join(video_dir, "master.m3u8")
+
+    # Plusieurs workers peuvent terminer une rendition en même temps pour la même vidéo
+    with open(get_master_lock_path(video_id), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
         video = Video.objects.get(id=video_id)
-        video_path = video.fichier.path
-        video_info = get_available_info(video_path)
-        qualities = video_info['qualities']
-
-        VideoInfo.objects.get_or_create(
-            video=video,
-            defaults={
-                "qualities": video_info['qualities'],
-                "audio_languages": video_info.get('audio_tracks', []),
-                "subtitle_languages": video_info.get('subtitle_languages', []),
-                "fps": video_info['fps'],
-                "width": video_info['width'],
-                "height": video_info['height'],
-                "duration": video_info['duration'],
-                "size": video_info['size']
-            }
+        if not has_complete_variant(segments_base_dir) or not media_tracks_ready(original_segments_dir):
+            # Rien à publier : aucune rendition terminée ou pistes audio encore en cours
+            return None
+        audio_manifests = collect_track_manifests(original_segments_dir, "audio", "audio_")
+        # Le débit de la piste audio la plus lourde s'ajoute à celui de chaque variante
+        audio_measures = [measure_playlist(manifest) for _, _, manifest in audio_manifests]
+        audio = max(audio_measures, key=lambda m: m["peak_bandwidth"]) if audio_measures else None
+        fallback_fps = video.info.fps if hasattr(video, 'info') else None
+        variant_manifests = collect_variant_manifests(segments_base_dir, fallback_fps=fallback_fps, audio=audio)
+        segment_subtitle_tracks(original_segments_dir, variant_manifests, video)
+        subtitle_manifests = collect_track_manifests(original_segments_dir, "subtitles", "subs_")
+        write_master_playlist(
+            master_manifest_path, video_dir, variant_manifests, audio_manifests, subtitle_manifests,
+            session_data=trickplay_session_data(video, video_dir)
         )
-        
-        video_dir = os.path.join(settings.MEDIA_ROOT, "videos", str(video.id))
-        os.makedirs(video_dir, exist_ok=True)
-        
-        original_filename = os.path.basename(video_path)
-        new_path = os.path.join(video_dir, original_filename)
-        shutil.copy2(video_path, new_path)
-        os.remove(video.fichier.path)
-        video.fichier.name = os.path.relpath(new_path, settings.MEDIA_ROOT)
-        video.save()
-        
-        qualities_base_dir = os.path.join(video_dir, "qualities")
-        segments_base_dir = os.path.join(video_dir, "segments")
-        os.makedirs(qualities_base_dir, exist_ok=True)
-        os.makedirs(segments_base_dir, exist_ok=True)
-        
-        variant_manifests = []
-        audio_manifests = []
-        subtitle_manifests = []
 
-        manifest, segments_dir, bandwidth, resolution, audio_m, subtitle_m = generate_video_segments(video_id, "original")
-        if manifest:
-            variant_manifests.append(("original", manifest, bandwidth, resolution))
-            audio_manifests = audio_m
-            subtitle_manifests = subtitle_m
-            master_manifest_path = os.path.join(video_dir, "master.m3u8")
-            with open(master_manifest_path, 'w') as f:
-                f.write("#EXTM3U\n#EXT-X-VERSION:3\n")
-                for lang, audio_manifest in audio_manifests:
-                    relative_audio_path = os.path.relpath(audio_manifest, video_dir)
-                    f.write(f'#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="audio",NAME="{lang}",LANGUAGE="{lang}",URI="{relative_audio_path}"\n')
-                for lang, subtitle_manifest in subtitle_manifests:
-                    relative_subtitle_path = os.path.relpath(subtitle_manifest, video_dir)
-                    f.write(f'#EXT-X-MEDIA:TYPE=SUBTITLES,GROUP-ID="subs",NAME="{lang}",LANGUAGE="{lang}",URI="{relative_subtitle_path}"\n')
-                for q, manifest, bandwidth, resolution in variant_manifests:
-                    relative_video_path = os.path.relpath(manifest, video_dir)
-                    f.write(f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={resolution},AUDIO="audio",SUBTITLES="subs",NAME="{q}"\n')
-                    f.write(f"{relative_video_path}\n")
-            video.master_manifest_file = os.path.relpath(master_manifest_path, settings.MEDIA_ROOT)
-            video.segments_dir = os.path.relpath(segments_dir, settings.MEDIA_ROOT)
-            video.save()
-        for q in qualities[1:]:
-            quality_dir = os.path.join(qualities_base_dir, q)
-            os.makedirs(quality_dir, exist_ok=True)
-            converted_path = convert_video_quality(new_path, q)
-            quality_file_path = os.path.join(quality_dir, original_filename)
-            os.rename(converted_path, quality_file_path)
-            
-            manifest, segments_dir, bandwidth, resolution, _, _ = generate_video_segments(video_id, q)
-            if manifest:
-                variant_manifests.append((q, manifest, bandwidth, resolution))
-                with open(master_manifest_path, 'w') as f:
-                    f.write("#EXTM3U\n#EXT-X-VERSION:3\n")
-                    for lang, audio_manifest in audio_manifests:
-                        relative_audio_path = os.path.relpath(audio_manifest, video_dir)
-                        f.write(f'#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="audio",NAME="{lang}",LANGUAGE="{lang}",URI="{relative_audio_path}"\n')
-                    for lang, subtitle_manifest in subtitle_manifests:
-                        relative_subtitle_path = os.path.relpath(subtitle_manifest, video_dir)
-                        f.write(f'#EXT-X-MEDIA:TYPE=SUBTITLES,GROUP-ID="subs",NAME="{lang}",LANGUAGE="{lang}",URI="{relative_subtitle_path}"\n')
-                    for q, manifest, bandwidth, resolution in variant_manifests:
-                        relative_video_path = os.path.relpath(manifest, video_dir)
-                        f.write(f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={resolution},AUDIO="audio",SUBTITLES="subs",NAME="{q}"\n')
-                        f.write(f"{relative_video_path}\n")
-                video.master_manifest_file = os.path.relpath(master_manifest_path, settings.MEDIA_ROOT)
-                video.segments_dir = os.path.relpath(segments_dir, settings.MEDIA_ROOT)
-                video.save()
-        
+        # La première publication rend la vidéo lisible ; les suivantes ajoutent des qualités
+        first_publication = not video.master_manifest_file
         video.master_manifest_file = os.path.relpath(master_manifest_path, settings.MEDIA_ROOT)
-        video.segments_dir = os.path.relpath(segments_dir, settings.MEDIA_ROOT)
-        video.save()
-        print("✅ Conversion et segmentation terminée.")
+        video.segments_dir = os.path.relpath(original_segments_dir, settings.MEDIA_ROOT)
+        video.save(update_fields=['master_manifest_file', 'segments_dir'])
+        share_with_duplicates(
+            video, master_manifest_file=video.master_manifest_file.name, segments_dir=video.segments_dir
+        )
+
+    notify_video_ready(video, [variant["quality"] for variant in variant_manifests], first_publication)
+    return master_manifest_path
+
+def notify_video_ready(video, qualities, first_publication):
+    group_name = get_upload_group(video)
+    if group_name is None:
+        return
+    try:
+        async_to_sync(get_channel_layer().group_send)(group_name, {
+            'type': 'video_ready',
+            'video_id': video.id,
+            'master_manifest': f"{settings.MEDIA_URL}{video.master_manifest_file}",
+            'qualities': qualities,
+            'first_publication': first_publication
+        })
     except Exception as e:
-        print(f"Erreur : {e}")
+        print(f"Erreur lors de l'envoi de l'évènement video_ready : {e}")
+
+def get_upload_group(video):
+    if not video.upload_id:
+        return None
+    return f"upload_{video.envoyeur_id}_{video.upload_id}"
+
+def make_progress_publisher(video, qualities):
+    group_name = get_upload_group(video)
+    if group_name is None:
+        return None
+    channel_layer = get_channel_layer()
+    last_sent = {"at": 0.0}
+
+    def publish(progress):
+        # Limité à un évènement par VIDEO_PROGRESS_INTERVAL, sauf le dernier
+        now = time.monotonic()
+        if not progress["done"] and now - last_sent["at"] < settings.VIDEO_PROGRESS_INTERVAL:
+            return
+        last_sent["at"] = now
+        rendition = {
+            "percent": round(progress["percent"], 2) if progress["percent"] is not None else None,
+            "eta": round(progress["eta"]) if progress["eta"] is not None else None,
+            "speed": progress["speed"],
+        }
+        try:
+            async_to_sync(channel_layer.group_send)(group_name, {
+                'type': 'processing_progress',
+                'video_id': video.id,
+                'renditions': {quality: rendition for quality in qualities},
+                'frame': progress["frame"],
+                'out_time': round(progress["out_time"], 2),
+                'done': progress["done"]
+            })
+        except Exception as e:
+            print(f"Erreur lors de l'envoi de la progression : {e}")
+
+    return publish
+
+def file_checksum(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def list_rendition_segments(manifest_path):
+    init_uri, segments = parse_media_playlist(manifest_path)
+    # En fMP4 tous les segments pointent vers le même fichier (EXT-X-BYTERANGE)
+    files = {init_uri} if init_uri else set()
+    files.update(segment["uri"] for segment in segments)
+    return segments, files
+
+def rendition_is_complete(video, quality, segments_base_dir):
+    checkpoint = VideoRendition.objects.filter(video=video, quality=quality, status='COMPLETED').first()
+    manifest_path = os.path.join(segments_base_dir, quality, "video.m3u8")
+    if checkpoint is None or not playlist_is_complete(manifest_path):
+        return False
+    if file_checksum(manifest_path) != checkpoint.manifest_checksum:
+        return False
+    segments, files = list_rendition_segments(manifest_path)
+    segments_dir = os.path.dirname(manifest_path)
+    return len(segments) == checkpoint.segment_count and all(
+        os.path.exists(os.path.join(segments_dir, name)) for name in files
+    )
+
+def reset_rendition(video, quality, segments_base_dir):
+    # Sortie partielle d'un essai interrompu : on repart d'un dossier vide pour cette rendition
+    segments_dir = os.path.join(segments_base_dir, quality)
+    if os.path.isdir(segments_dir):
+        for name in os.listdir(segments_dir):
+            # Les pistes audio et sous-titres (dans "original") ont leur propre reprise
+            if name.startswith("video"):
+                os.remove(os.path.join(segments_dir, name))
+    VideoRendition.objects.update_or_create(
+        video=video, quality=quality,
+        defaults={'status': 'PROCESSING', 'segment_count': 0, 'manifest_checksum': None}
+    )
+
+def record_rendition(video, quality, manifest_path):
+    segments, _ = list_rendition_segments(manifest_path)
+    VideoRendition.objects.update_or_create(
+        video=video, quality=quality,
+        defaults={
+            'status': 'COMPLETED',
+            'segment_count': len(segments),
+            'manifest_checksum': file_checksum(manifest_path)
+        }
+    )
+
+def pending_renditions(video, qualities):
+    segments_base_dir = os.path.join(settings.MEDIA_ROOT, "videos", str(video.id), "segments")
+    return [q for q in qualities if not rendition_is_complete(video, q, segments_base_dir)]
+
+def generate_video_renditions(video_id, qualities):
+    video = Video.objects.get(id=video_id)
+    video_dir = os.path.join(settings.MEDIA_ROOT, "videos", str(video.id))
+    segments_base_dir = os.path.join(video_dir, "segments")
+    pending = pending_renditions(video, qualities)
+    if len(pending) < len(qualities):
+        print(f"⏭️ Renditions déjà terminées : {', '.join(q for q in qualities if q not in pending)}")
+    if pending:
+        for quality in pending:
+            reset_rendition(video, quality, segments_base_dir)
+        duration = video.info.duration if hasattr(video, 'info') else None
+        fps = video.info.fps if hasattr(video, 'info') else None
+        ladder = video.info.ladder if hasattr(video, 'info') else None
+        remux = can_remux(video.info if hasattr(video, 'info') else None)
+        if remux and "original" in pending:
+            print("⚡ Source compatible : rendition originale produite par copie de flux")
+        variants = run_ladder(
+            video.fichier.path, pending, segments_base_dir,
+            duration=duration, on_progress=make_progress_publisher(video, pending), fps=fps, ladder=ladder,
+            remux=remux
+        )
+        for variant in variants:
+            record_rendition(video, variant["quality"], variant["manifest"])
+    publish_master_playlist(video_id)
+    print(f"✅ Renditions {', '.join(qualities)} publiées.")
+
+def use_chunked_encoding(video):
+    return (
+        settings.VIDEO_CHUNKED_ENCODING and hasattr(video, 'info')
+        and (video.info.duration or 0) >= settings.VIDEO_CHUNKED_MIN_DURATION
+    )
+
+def get_chunks_dir(video_id):
+    return os.path.join(settings.MEDIA_ROOT, "videos", str(video_id), "chunks")
+
+def chunk_group_name(qualities):
+    return "_".join(quality_key(quality) for quality in qualities)
+
+def split_source_chunks(video_id):
+    # Découpe faite une seule fois par vidéo, partagée par tous les groupes de renditions
+    video = Video.objects.get(id=video_id)
+    source_chunks_dir = os.path.join(get_chunks_dir(video_id), "source")
+    os.makedirs(source_chunks_dir, exist_ok=True)
+    marker_path = os.path.join(source_chunks_dir, "chunks.json")
+    with open(os.path.join(source_chunks_dir, ".split.lock"), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        if os.path.exists(marker_path):
+            with open(marker_path) as f:
+                return json.load(f)
+        run_ffmpeg(build_split_command(video.fichier.path, source_chunks_dir, settings.VIDEO_CHUNK_SECONDS))
+        chunk_names = sorted(name for name in os.listdir(source_chunks_dir) if name.endswith(".mkv"))
+        with open(marker_path, 'w') as f:
+            json.dump(chunk_names, f)
+    print(f"✂️ Source découpée en {len(chunk_names)} morceaux")
+    return chunk_names
+
+def encode_video_chunk(video_id, qualities, chunk_name):
+    video = Video.objects.get(id=video_id)
+    chunks_dir = get_chunks_dir(video_id)
+    group_dir = os.path.join(chunks_dir, chunk_group_name(qualities))
+    stem = os.path.splitext(chunk_name)[0]
+    targets = {quality: os.path.join(group_dir, quality, f"{stem}.mp4") for quality in qualities}
+    # Idempotent : un morceau déjà encodé (renommé en fin d'encodage) n'est pas refait
+    if all(os.path.exists(path) for path in targets.values()):
+        print(f"⏭️ Morceau {chunk_name} déjà encodé")
+        return
+    outputs = {quality: ["-f", "mp4", f"{path}.part"] for quality, path in targets.items()}
+    info = video.info
+    run_ffmpeg(build_ladder_command(
+        os.path.join(chunks_dir, "source", chunk_name), qualities, group_dir,
+        fps=info.fps, ladder=info.ladder, outputs=outputs, remux=can_remux(info)
+    ))
+    for path in targets.values():
+        os.replace(f"{path}.part", path)
+    print(f"✅ Morceau {chunk_name} encodé ({', '.join(qualities)})")
+
+def stitch_video_chunks(video_id, qualities, chunk_names):
+    video = Video.objects.get(id=video_id)
+    segments_base_dir = os.path.join(settings.MEDIA_ROOT, "videos", str(video_id), "segments")
+    group_dir = os.path.join(get_chunks_dir(video_id), chunk_group_name(qualities))
+    for quality in pending_renditions(video, qualities):
+        reset_rendition(video, quality, segments_base_dir)
+        quality_dir = os.path.join(group_dir, quality)
+        concat_list_path = os.path.join(quality_dir, "concat.txt")
+        with open(concat_list_path, 'w') as f:
+            for chunk_name in chunk_names:
+                f.write(f"file '{os.path.splitext(chunk_name)[0]}.mp4'\n")
+        segments_dir = os.path.join(segments_base_dir, quality)
+        os.makedirs(segments_dir, exist_ok=True)
+        run_ffmpeg(build_stitch_command(concat_list_path, segments_dir))
+        record_rendition(video, quality, os.path.join(segments_dir, "video.m3u8"))
+    publish_master_playlist(video_id)
+    shutil.rmtree(group_dir, ignore_errors=True)
+    # Morceaux source supprimés une fois toute l'échelle assemblée
+    if not pending_renditions(video, ["original"] + video.info.qualities[1:]):
+        shutil.rmtree(get_chunks_dir(video_id), ignore_errors=True)
+    print(f"✅ Renditions {', '.join(qualities)} assemblées depuis {len(chunk_names)} morceaux.")
+
+def generate_video_trickplay(video_id):
+    video = Video.objects.get(id=video_id)
+    video_dir = os.path.join(settings.MEDIA_ROOT, "videos", str(video.id))
+    tracks = (video.trickplay or {}).get("tracks", {})
+    if tracks and all(os.path.exists(os.path.join(settings.MEDIA_ROOT, path)) for path in tracks.values()):
+        print("⏭️ Vignettes de prévisualisation déjà générées.")
+        return
+    info = video.info
+    trickplay = generate_trickplay(
+        video.fichier.path, os.path.join(video_dir, "trickplay"), info.duration, info.width, info.height
+    )
+    trickplay["tracks"] = {
+        image_format: os.path.relpath(path, settings.MEDIA_ROOT) for image_format, path in trickplay["tracks"].items()
+    }
+    # Sous le verrou du master : soit une rendition publiée ensuite verra les vignettes,
+    # soit le master existe déjà et on le republie
+    with open(get_master_lock_path(video_id), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        Video.objects.filter(id=video_id).update(trickplay=trickplay)
+        share_with_duplicates(video, trickplay=trickplay)
+        published = Video.objects.filter(id=video_id).exclude(master_manifest_file='').exclude(
+            master_manifest_file__isnull=True
+        ).exists()
+    if published:
+        publish_master_playlist(video_id)
+    print("✅ Vignettes de prévisualisation générées.")
 
 def generate_video_affichage(video_id):
     try:
         video = Video.objects.get(id=video_id)
         video_path = video.fichier.path
-        output_dir = os.path.join(os.path.dirname(video_path), "affichages")
+        # Dans le dossier propre à la vidéo (et non videos/affichages) : supprimé avec elle
+        output_dir = os.path.join(settings.MEDIA_ROOT, get_storage_dir(video), "affichages")
         os.makedirs(output_dir, exist_ok=True)
-        affichage_path = extract_random_frame(video_path, output_dir)
-        if affichage_path:
-            video.affichage = os.path.relpath(affichage_path, MEDIA_ROOT)
-            video.save()
-            print("✅ Image d'affichage générée...")
+        duration = video.info.duration if hasattr(video, 'info') else None
+        poster_set = extract_poster_set(video_path, output_dir, duration)
+        if poster_set is None:
+            raise RuntimeError("Extraction de l'image d'affichage impossible")
+        posters = {
+            width: {image_format: os.path.relpath(path, settings.MEDIA_ROOT) for image_format, path in formats.items()}
+            for width, formats in poster_set["posters"].items()
+        }
+        largest = max(posters, key=int)
+        video.affichage = posters[largest].get("jpeg") or next(iter(posters[largest].values()))
+        video.affichages = posters
+        video.affichage_lqip = poster_set["lqip"]
+        video.save(update_fields=['affichage', 'affichages', 'affichage_lqip'])
+        share_with_duplicates(
+            video, affichage=video.affichage.name, affichages=posters, affichage_lqip=video.affichage_lqip
+        )
+        print("✅ Image d'affichage générée...")
         print("[!] Génération d'affichage finie...")
     except Exception as e:
-        print(f"Erreur lors de la génération de l'image d'affichage : {e}")
\ No newline at end of file
+        print(f"Erreur lors de la génération de l'image d'affichage : {e}")
+        raise
\ No newline at end of file
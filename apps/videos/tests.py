@@ -1,3 +1,506 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone as django_timezone
+from apps.videos.transcoder import build_ladder_command, can_remux, write_master_playlist
+from apps.videos.storage import write_tracks_marker, read_tracks_marker
+from apps.videos.uploads import (
+    infer_chunk_size, chunk_layout_is_valid, expected_chunk_length, chunk_offset, bitmap_size,
+    is_chunk_received, mark_chunk_received, missing_chunk_ranges, parse_tus_metadata, preallocate_upload_file,
+    get_upload_path
+)
+from apps.videos.tus import TusPatchMiddleware
+from apps.videos.models import VideoProcessingTask
+from apps.videos.jobs import iter_candidates, _try_claim, fail_task, run_conversion
+from datetime import timedelta
+from unittest import mock
+from types import SimpleNamespace
+import tempfile
+import shutil
+import base64
+import hashlib
+import json
+import os
 
-# Create your tests here.
+
+class BuildLadderCommandTests(SimpleTestCase):
+    def setUp(self):
+        self.segments_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.segments_dir, ignore_errors=True)
+
+    def filter_graph(self, cmd):
+        return cmd[cmd.index("-filter_complex") + 1]
+
+    @override_settings(VIDEO_HLS_ALIGN_GOP=True)
+    def test_original_odd_dimensions_rounded_to_even(self):
+        # Source 853x480 : "original" ré-encodé en mode aligné doit rester encodable en yuv420p
+        cmd = build_ladder_command("source_853x480.mp4", ["original", "360p"], self.segments_dir, fps=30)
+        graph = self.filter_graph(cmd)
+        self.assertIn("[s0]scale=trunc(iw/2)*2:trunc(ih/2)*2[v0]", graph)
+        self.assertNotIn("null", graph)
+        self.assertIn("[s1]scale=-2:360[v1]", graph)
+        self.assertIn("yuv420p", cmd)
+
+    @override_settings(VIDEO_HLS_ALIGN_GOP=True)
+    def test_original_copied_when_remux(self):
+        cmd = build_ladder_command("source.mp4", ["original", "360p"], self.segments_dir, fps=30, remux=True)
+        self.assertIn("copy", cmd)
+        self.assertNotIn("[s0]scale=trunc(iw/2)*2:trunc(ih/2)*2[v0]", self.filter_graph(cmd))
+
+
+@override_settings(VIDEO_HLS_ALIGN_GOP=True, VIDEO_HLS_GOP_SECONDS=2)
+class CanRemuxTests(SimpleTestCase):
+    def info(self, keyframe_times, duration, fps=30):
+        return SimpleNamespace(
+            video_codec="h264", pix_fmt="yuv420p", video_profile="High", keyframe_interval=1,
+            keyframe_times=keyframe_times, duration=duration, fps=fps
+        )
+
+    def test_gop_equal_to_grid(self):
+        self.assertTrue(can_remux(self.info([i * 2.0 for i in range(30)], 60)))
+
+    def test_shorter_gops_cover_the_grid(self):
+        # GOP de 1 s ou 0,5 s (téléphones, captures d'écran) : une image clé sur chaque point de grille
+        self.assertTrue(can_remux(self.info([i * 1.0 for i in range(60)], 60)))
+        self.assertTrue(can_remux(self.info([i * 0.5 for i in range(120)], 60)))
+
+    def test_gop_not_dividing_grid_rejected(self):
+        self.assertFalse(can_remux(self.info([i * 3.0 for i in range(20)], 60)))
+
+    def test_drifting_keyframes_rejected(self):
+        self.assertFalse(can_remux(self.info([i * 2.02 for i in range(30)], 60)))
+
+    def test_keyframes_within_one_frame_accepted(self):
+        times = [i * 2.0 + (0.02 if i % 2 else 0) for i in range(30)]
+        self.assertTrue(can_remux(self.info(times, 60)))
+
+    def test_truncated_probe_rejected(self):
+        # Instants limités aux 30 premières secondes d'une vidéo de 2 minutes
+        self.assertFalse(can_remux(self.info([i * 1.0 for i in range(31)], 120)))
+
+
+class MasterPlaylistTracksTests(SimpleTestCase):
+    def setUp(self):
+        self.video_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.video_dir, ignore_errors=True)
+        self.segments_dir = os.path.join(self.video_dir, "segments", "original")
+        os.makedirs(self.segments_dir)
+
+    def test_marker_round_trip(self):
+        write_tracks_marker(
+            self.segments_dir,
+            [("eng", os.path.join(self.segments_dir, "audio_eng.m3u8")), ("eng", os.path.join(self.segments_dir, "audio_eng2.m3u8"))],
+            [("fre", os.path.join(self.segments_dir, "subs_fre.m3u8"))]
+        )
+        tracks = read_tracks_marker(self.segments_dir)
+        self.assertEqual(tracks["audio"], [
+            {"language": "eng", "manifest": "audio_eng.m3u8"},
+            {"language": "eng", "manifest": "audio_eng2.m3u8"}
+        ])
+        self.assertEqual(tracks["subtitles"], [{"language": "fre", "manifest": "subs_fre.m3u8"}])
+        self.assertFalse(os.path.exists(os.path.join(self.segments_dir, "tracks.json.tmp")))
+
+    def test_marker_old_format(self):
+        with open(os.path.join(self.segments_dir, "tracks.json"), "w") as f:
+            json.dump({"audio": ["audio_eng2.m3u8"], "subtitles": []}, f)
+        self.assertEqual(read_tracks_marker(self.segments_dir)["audio"], [{"language": "eng2", "manifest": "audio_eng2.m3u8"}])
+
+    def test_missing_marker(self):
+        self.assertIsNone(read_tracks_marker(self.segments_dir))
+
+    def test_same_language_tracks_keep_real_language(self):
+        master = os.path.join(self.video_dir, "master.m3u8")
+        variant = {
+            "quality": "original", "manifest": os.path.join(self.segments_dir, "video.m3u8"),
+            "bandwidth": 1000000, "resolution": "1920x1080"
+        }
+        audio = [
+            ("eng", "eng", os.path.join(self.segments_dir, "audio_eng.m3u8")),
+            ("eng", "eng2", os.path.join(self.segments_dir, "audio_eng2.m3u8")),
+            ("lang2", "lang2", os.path.join(self.segments_dir, "audio_lang2.m3u8")),
+        ]
+        write_master_playlist(master, self.video_dir, [variant], audio, [])
+        with open(master) as f:
+            content = f.read()
+        self.assertIn('NAME="eng",LANGUAGE="eng"', content)
+        self.assertIn('NAME="eng2",LANGUAGE="eng"', content)
+        self.assertNotIn('LANGUAGE="eng2"', content)
+        # Langue inconnue : pas d'attribut LANGUAGE invalide
+        self.assertIn('NAME="lang2",URI=', content)
+
+
+class ChunkLayoutTests(SimpleTestCase):
+    # 10 octets en 3 morceaux de 4 : [0-3] [4-7] [8-9]
+
+    def test_infer_chunk_size_from_regular_chunk(self):
+        self.assertEqual(infer_chunk_size(10, 3, 0, 4), 4)
+        self.assertEqual(infer_chunk_size(10, 3, 1, 4), 4)
+
+    def test_infer_chunk_size_from_last_chunk(self):
+        self.assertEqual(infer_chunk_size(10, 3, 2, 2), 4)
+        # (10 - 3) n'est pas divisible par 2 morceaux pleins
+        self.assertIsNone(infer_chunk_size(10, 3, 2, 3))
+
+    def test_infer_chunk_size_single_chunk(self):
+        self.assertEqual(infer_chunk_size(10, 1, 0, 10), 10)
+
+    def test_chunk_layout_is_valid(self):
+        self.assertTrue(chunk_layout_is_valid(10, 3, 4))
+        self.assertTrue(chunk_layout_is_valid(12, 3, 4))
+        self.assertTrue(chunk_layout_is_valid(10, 1, 10))
+        # Dernier morceau vide, ou morceaux insuffisants pour tout couvrir
+        self.assertFalse(chunk_layout_is_valid(10, 3, 5))
+        self.assertFalse(chunk_layout_is_valid(10, 3, 3))
+        self.assertFalse(chunk_layout_is_valid(10, 3, None))
+        self.assertFalse(chunk_layout_is_valid(10, 3, 0))
+
+    def test_expected_chunk_length(self):
+        self.assertEqual(expected_chunk_length(10, 3, 4, 0), 4)
+        self.assertEqual(expected_chunk_length(10, 3, 4, 1), 4)
+        self.assertEqual(expected_chunk_length(10, 3, 4, 2), 2)
+        self.assertEqual(expected_chunk_length(12, 3, 4, 2), 4)
+
+    def test_chunk_offset(self):
+        self.assertEqual(chunk_offset(4, 0), 0)
+        self.assertEqual(chunk_offset(4, 2), 8)
+
+
+class ChunkBitmapTests(SimpleTestCase):
+    def test_bitmap_size(self):
+        self.assertEqual(bitmap_size(1), 1)
+        self.assertEqual(bitmap_size(8), 1)
+        self.assertEqual(bitmap_size(9), 2)
+
+    def test_mark_and_check(self):
+        bitmap = mark_chunk_received(b"", 9, 10)
+        self.assertEqual(bitmap, b"\x00\x02")
+        self.assertTrue(is_chunk_received(bitmap, 9))
+        self.assertFalse(is_chunk_received(bitmap, 8))
+        # Au-delà du bitmap : non reçu
+        self.assertFalse(is_chunk_received(bitmap, 16))
+        self.assertFalse(is_chunk_received(b"", 0))
+
+    def test_mark_is_idempotent(self):
+        bitmap = mark_chunk_received(b"", 3, 10)
+        self.assertEqual(mark_chunk_received(bitmap, 3, 10), bitmap)
+
+    def test_missing_chunk_ranges(self):
+        bitmap = b""
+        for chunk_number in (0, 1, 4):
+            bitmap = mark_chunk_received(bitmap, chunk_number, 7)
+        self.assertEqual(missing_chunk_ranges(bitmap, 7), [[2, 3], [5, 6]])
+        self.assertEqual(missing_chunk_ranges(b"", 3), [[0, 2]])
+        for chunk_number in range(7):
+            bitmap = mark_chunk_received(bitmap, chunk_number, 7)
+        self.assertEqual(missing_chunk_ranges(bitmap, 7), [])
+
+
+class TusMetadataTests(SimpleTestCase):
+    def test_pairs_and_empty_values(self):
+        metadata = parse_tus_metadata("titre TWEgdmlkw6lvIMOpdMOp, is_private")
+        self.assertEqual(metadata, {"titre": "Ma vidéo été", "is_private": ""})
+
+    def test_invalid_values(self):
+        # Base64 invalide ou octets non UTF-8 : valeur vide plutôt qu'une erreur
+        self.assertEqual(parse_tus_metadata("titre !!!,tags /w=="), {"titre": "", "tags": ""})
+
+    def test_missing_header(self):
+        self.assertEqual(parse_tus_metadata(None), {})
+        self.assertEqual(parse_tus_metadata(""), {})
+
+
+@override_settings(VIDEO_UPLOAD_MAX_SIZE=1024 * 1024)
+class PreallocateUploadFileTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir, ignore_errors=True)
+        self.path = os.path.join(self.tmp_dir, "uploads", "test.part")
+
+    def test_preallocates_size(self):
+        preallocate_upload_file(self.path, 4096)
+        self.assertEqual(os.path.getsize(self.path), 4096)
+
+    def test_ftruncate_fallback_when_fallocate_unsupported(self):
+        for error in (OSError(95, "Operation not supported"), AttributeError("posix_fallocate")):
+            path = f"{self.path}.{type(error).__name__}"
+            with mock.patch("apps.videos.uploads.os.posix_fallocate", side_effect=error, create=True):
+                preallocate_upload_file(path, 4096)
+            self.assertEqual(os.path.getsize(path), 4096)
+
+    def test_existing_file_not_truncated(self):
+        preallocate_upload_file(self.path, 4096)
+        with open(self.path, "r+b") as f:
+            f.write(b"data")
+        preallocate_upload_file(self.path, 4096)
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(4), b"data")
+
+    def test_rejects_oversized_upload(self):
+        with self.assertRaises(ValueError):
+            preallocate_upload_file(self.path, 2 * 1024 * 1024)
+        self.assertFalse(os.path.exists(self.path))
+
+
+class TusPatchMiddlewareTests(SimpleTestCase):
+    upload_id = "123e4567-e89b-12d3-a456-426614174000"
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.path = get_upload_path(self.upload_id)
+        preallocate_upload_file(self.path, 10)
+
+        # Ligne VideoUpload simulée : mêmes règles d'offset que begin_tus_patch / commit_tus_patch
+        self.upload = SimpleNamespace(total_size=10, received_bytes=0)
+        self.commits = []
+
+        def begin(upload_id, user_id, offset):
+            if offset != self.upload.received_bytes:
+                return self.upload, 409
+            return self.upload, None
+
+        def commit(video_upload, offset, written):
+            self.commits.append((offset, written))
+            video_upload.received_bytes = offset + written
+            return video_upload, 204
+
+        async def get_user(token):
+            return SimpleNamespace(id=1, is_active=True)
+
+        for target, replacement in (("begin_tus_patch", begin), ("commit_tus_patch", commit), ("get_user_from_token", get_user)):
+            patcher = mock.patch(f"apps.videos.tus.{target}", replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.inner_calls = []
+
+        async def inner(scope, receive, send):
+            self.inner_calls.append(scope)
+
+        self.middleware = TusPatchMiddleware(inner)
+
+    async def patch(self, body_parts, offset=0, method="PATCH", **extra_headers):
+        headers = [
+            (b"tus-resumable", b"1.0.0"),
+            (b"content-type", b"application/offset+octet-stream"),
+            (b"authorization", b"Bearer jeton"),
+            (b"upload-offset", str(offset).encode()),
+        ] + [(name.replace("_", "-").encode(), value.encode()) for name, value in extra_headers.items()]
+        # Corps découpé en plusieurs messages http.request, comme le ferait le serveur ASGI
+        messages = [
+            {"type": "http.request", "body": part, "more_body": index < len(body_parts) - 1}
+            for index, part in enumerate(body_parts)
+        ]
+
+        async def receive():
+            return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": method, "path": f"/api/videos/tus/{self.upload_id}", "headers": headers}
+        await self.middleware(scope, receive, send)
+        if not sent:
+            return None, {}
+        return sent[0]["status"], dict(sent[0]["headers"])
+
+    def file_content(self):
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    async def test_body_split_across_messages(self):
+        status, headers = await self.patch([b"abc", b"de", b"f"])
+        self.assertEqual(status, 204)
+        self.assertEqual(headers[b"upload-offset"], b"6")
+        self.assertEqual(self.file_content(), b"abcdef\0\0\0\0")
+        self.assertEqual(self.commits, [(0, 6)])
+
+    async def test_resume_at_offset(self):
+        self.upload.received_bytes = 4
+        status, headers = await self.patch([b"ef", b"gh"], offset=4)
+        self.assertEqual(status, 204)
+        self.assertEqual(self.file_content()[4:8], b"efgh")
+        self.assertEqual(headers[b"upload-offset"], b"8")
+
+    async def test_offset_mismatch(self):
+        self.upload.received_bytes = 4
+        status, headers = await self.patch([b"abc"], offset=0)
+        self.assertEqual(status, 409)
+        self.assertEqual(headers[b"upload-offset"], b"4")
+        self.assertEqual(self.file_content(), b"\0" * 10)
+        self.assertEqual(self.commits, [])
+
+    async def test_body_truncated_at_remaining(self):
+        self.upload.received_bytes = 6
+        status, headers = await self.patch([b"123", b"456", b"789"], offset=6)
+        self.assertEqual(status, 204)
+        self.assertEqual(self.file_content(), b"\0" * 6 + b"1234")
+        self.assertEqual(self.commits, [(6, 4)])
+        self.assertEqual(headers[b"upload-offset"], b"10")
+
+    async def test_content_length_over_remaining(self):
+        status, _ = await self.patch([b"x" * 11], content_length="11")
+        self.assertEqual(status, 413)
+        self.assertEqual(self.commits, [])
+
+    async def test_checksum_mismatch_does_not_advance_offset(self):
+        digest = base64.b64encode(hashlib.sha1(b"autre chose").digest()).decode()
+        status, _ = await self.patch([b"abc", b"def"], upload_checksum=f"sha1 {digest}")
+        self.assertEqual(status, 460)
+        self.assertEqual(self.commits, [])
+        self.assertEqual(self.upload.received_bytes, 0)
+
+    async def test_checksum_match(self):
+        digest = base64.b64encode(hashlib.sha1(b"abcdef").digest()).decode()
+        status, headers = await self.patch([b"abc", b"def"], upload_checksum=f"sha1 {digest}")
+        self.assertEqual(status, 204)
+        self.assertEqual(headers[b"upload-offset"], b"6")
+
+    async def test_unsupported_checksum_algorithm(self):
+        status, _ = await self.patch([b"abc"], upload_checksum="crc32 AAAA")
+        self.assertEqual(status, 400)
+
+    async def test_missing_file_returns_conflict(self):
+        # .part renommé par la finalisation entre la vérification et l'écriture
+        os.remove(self.path)
+        status, _ = await self.patch([b"abc"])
+        self.assertEqual(status, 409)
+        self.assertEqual(self.commits, [])
+
+    async def test_other_requests_passed_through(self):
+        status, _ = await self.patch([b""], method="HEAD")
+        self.assertIsNone(status)
+        self.assertEqual(len(self.inner_calls), 1)
+
+
+def make_task(task_type="RENDITION", user_id=1, status="PENDING", priority=100, video_id=1, **fields):
+    return VideoProcessingTask.objects.create(
+        video_id=video_id, user_id=user_id, task_type=task_type, status=status, priority=priority,
+        run_after=django_timezone.now() - timedelta(seconds=1), **fields
+    )
+
+
+@override_settings(VIDEO_TASK_CONCURRENCY={"RENDITION": 4, "TRICKPLAY": 1})
+class IterCandidatesTests(TestCase):
+    def running(self, user_id, task_type="RENDITION"):
+        return make_task(
+            task_type=task_type, user_id=user_id, status="PROCESSING", locked_by="worker",
+            locked_until=django_timezone.now() + timedelta(minutes=5)
+        )
+
+    def test_user_with_fewer_running_tasks_first(self):
+        self.running(user_id=1)
+        self.running(user_id=1)
+        busy = make_task(user_id=1)
+        idle = make_task(user_id=2)
+        candidates = list(iter_candidates(django_timezone.now()))
+        self.assertEqual([task.id for task in candidates], [idle.id, busy.id])
+
+    def test_better_priority_wins_over_fair_share(self):
+        self.running(user_id=1)
+        urgent = make_task(user_id=1, priority=0)
+        normal = make_task(user_id=2, priority=100)
+        candidates = list(iter_candidates(django_timezone.now()))
+        self.assertEqual([task.id for task in candidates], [urgent.id, normal.id])
+
+    def test_one_head_per_user(self):
+        first = make_task(user_id=1)
+        make_task(user_id=1)
+        candidates = list(iter_candidates(django_timezone.now()))
+        self.assertEqual([task.id for task in candidates], [first.id])
+
+    def test_saturated_type_skipped(self):
+        self.running(user_id=1, task_type="TRICKPLAY")
+        make_task(task_type="TRICKPLAY", user_id=2)
+        rendition = make_task(user_id=2, priority=200)
+        candidates = list(iter_candidates(django_timezone.now()))
+        self.assertEqual([task.id for task in candidates], [rendition.id])
+
+    def test_future_task_not_candidate(self):
+        task = make_task()
+        VideoProcessingTask.objects.filter(id=task.id).update(run_after=django_timezone.now() + timedelta(minutes=1))
+        self.assertEqual(list(iter_candidates(django_timezone.now())), [])
+
+
+@override_settings(VIDEO_TASK_CONCURRENCY={"RENDITION": 1})
+class TryClaimTests(TestCase):
+    def claim(self, task):
+        now = django_timezone.now()
+        return _try_claim(task.id, task.task_type, "worker-b", now, now + timedelta(minutes=5))
+
+    def test_limit_recounted_under_lock(self):
+        # Candidat vu libre par iter_candidates, mais un autre worker a réservé entre-temps
+        candidate = make_task()
+        make_task(status="PROCESSING", locked_by="worker-a", locked_until=django_timezone.now() + timedelta(minutes=5))
+        self.assertIsNone(self.claim(candidate))
+        self.assertEqual(VideoProcessingTask.objects.get(id=candidate.id).status, "PENDING")
+
+    def test_expired_lease_not_counted(self):
+        candidate = make_task()
+        make_task(
+            status="PROCESSING", locked_by="worker-a", locked_until=django_timezone.now() - timedelta(minutes=1),
+            attempts=3, max_attempts=3
+        )
+        task = self.claim(candidate)
+        self.assertIsNotNone(task)
+        self.assertEqual(task.status, "PROCESSING")
+        self.assertEqual(task.locked_by, "worker-b")
+        self.assertEqual(task.attempts, 1)
+
+    def test_task_claimed_once(self):
+        candidate = make_task()
+        with override_settings(VIDEO_TASK_CONCURRENCY={"RENDITION": 2}):
+            self.assertIsNotNone(self.claim(candidate))
+            self.assertIsNone(self.claim(candidate))
+
+
+@override_settings(VIDEO_TASK_RETRY_BACKOFF=30, VIDEO_TASK_RETRY_BACKOFF_MAX=100)
+class FailTaskTests(TestCase):
+    def fail(self, attempts, max_attempts=10):
+        task = make_task(status="PROCESSING", locked_by="worker", attempts=attempts, max_attempts=max_attempts)
+        before = django_timezone.now()
+        fail_task(task, "worker", RuntimeError("boom"))
+        task.refresh_from_db()
+        return task, (task.run_after - before).total_seconds()
+
+    def test_exponential_backoff(self):
+        for attempts, delay in ((1, 30), (2, 60)):
+            task, waited = self.fail(attempts)
+            self.assertEqual(task.status, "PENDING")
+            self.assertAlmostEqual(waited, delay, delta=1)
+            self.assertIsNone(task.locked_by)
+            self.assertEqual(task.error_message, "boom")
+
+    def test_backoff_capped(self):
+        _, waited = self.fail(attempts=5)
+        self.assertAlmostEqual(waited, 100, delta=1)
+
+    def test_last_attempt_fails(self):
+        task, _ = self.fail(attempts=3, max_attempts=3)
+        self.assertEqual(task.status, "FAILED")
+
+    def test_other_worker_cannot_fail_task(self):
+        task = make_task(status="PROCESSING", locked_by="worker", attempts=1)
+        self.assertEqual(fail_task(task, "other", RuntimeError("boom")), 0)
+
+
+class RunConversionRetryTests(TestCase):
+    def test_retry_does_not_duplicate_tasks(self):
+        groups = [["original", "360p"], ["720p"]]
+        video = SimpleNamespace(info=SimpleNamespace(height=1080))
+        conversion = make_task(task_type="CONVERSION", status="PROCESSING")
+        with mock.patch("apps.videos.jobs.prepare_video_conversion", return_value=groups), \
+                mock.patch("apps.videos.jobs.Video.objects.get", return_value=video), \
+                mock.patch("apps.videos.jobs.pending_renditions", side_effect=lambda video, qualities: qualities), \
+                mock.patch("apps.videos.jobs.publish_master_playlist"):
+            run_conversion(conversion)
+            run_conversion(conversion)
+        tasks = VideoProcessingTask.objects.filter(video_id=1).exclude(task_type="CONVERSION")
+        self.assertEqual(tasks.filter(task_type="TRACKS").count(), 1)
+        self.assertEqual(tasks.filter(task_type="TRICKPLAY").count(), 1)
+        self.assertEqual(
+            sorted(task.payload["qualities"] for task in tasks.filter(task_type="RENDITION")), sorted(groups)
+        )
@@ -0,0 +1,654 @@
+from django.conf import settings
+from helpers.helper import parse_frame_rate
+from bisect import bisect_left
+import os
+import re
+import ffmpeg
+import subprocess
+import tempfile
+
+QUALITY_HEIGHTS = {
+    "2160p": 2160,
+    "1440p": 1440,
+    "1080p": 1080,
+    "720p": 720,
+    "480p": 480,
+    "360p": 360,
+    "240p": 240,
+    "144p": 144
+}
+
+DEFAULT_BANDWIDTHS = {
+    "original": "8000000",
+    "2160p": "16000000",
+    "1440p": "8000000",
+    "1080p": "5000000",
+    "720p": "2800000",
+    "480p": "1400000",
+    "360p": "800000",
+    "240p": "400000",
+    "144p": "200000"
+}
+
+DEFAULT_RESOLUTIONS = {
+    "original": "1920x1080",
+    "2160p": "3840x2160",
+    "1440p": "2560x1440",
+    "1080p": "1920x1080",
+    "720p": "1280x720",
+    "480p": "842x480",
+    "360p": "640x360",
+    "240p": "426x240",
+    "144p": "256x144"
+}
+
+def quality_key(quality):
+    # "720p (HD)" -> "720p"
+    return (quality or "original").split(" ")[0]
+
+def get_quality_height(quality):
+    return QUALITY_HEIGHTS.get(quality_key(quality))
+
+AVC_PROFILES = {
+    "Baseline": ("42", "E0"),
+    "Constrained Baseline": ("42", "E0"),
+    "Main": ("4D", "40"),
+    "High": ("64", "00"),
+}
+
+AAC_LC_CODEC = "mp4a.40.2"
+
+REMUX_PIX_FMTS = ("yuv420p", "yuvj420p")
+
+def avc_codec_string(profile, level):
+    # Format RFC 6381 : avc1.PPCCLL (profil, contraintes, niveau en hexadécimal)
+    if profile not in AVC_PROFILES or not level:
+        return None
+    profile_idc, constraints = AVC_PROFILES[profile]
+    return f"avc1.{profile_idc}{constraints}{int(level):02X}"
+
+def parse_media_playlist(manifest_path):
+    segments = []
+    init_uri = None
+    duration = None
+    length = None
+    with open(manifest_path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("#EXTINF:"):
+                duration = float(line[len("#EXTINF:"):].split(",")[0])
+            elif line.startswith("#EXT-X-BYTERANGE:"):
+                length = int(line[len("#EXT-X-BYTERANGE:"):].split("@")[0])
+            elif line.startswith("#EXT-X-MAP:"):
+                init_uri = line.split('URI="')[1].split('"')[0]
+            elif line and not line.startswith("#"):
+                segments.append({"uri": line, "duration": duration or 0.0, "length": length})
+                duration = None
+                length = None
+    return init_uri, segments
+
+def playlist_files_size(manifest_path):
+    # Taille réelle d'une rendition HLS : segments (et segment d'init) comptés une seule fois
+    base_dir = os.path.dirname(manifest_path)
+    init_uri, segments = parse_media_playlist(manifest_path)
+    files = {init_uri} if init_uri else set()
+    files.update(segment["uri"] for segment in segments)
+    return sum(
+        os.path.getsize(os.path.join(base_dir, name)) for name in files
+        if os.path.exists(os.path.join(base_dir, name))
+    )
+
+def measure_playlist(manifest_path):
+    base_dir = os.path.dirname(manifest_path)
+    _, segments = parse_media_playlist(manifest_path)
+    peak = 0.0
+    total_bytes = 0
+    total_duration = 0.0
+    for segment in segments:
+        size = segment["length"]
+        if size is None:
+            size = os.path.getsize(os.path.join(base_dir, segment["uri"]))
+        if segment["duration"] > 0:
+            peak = max(peak, size * 8 / segment["duration"])
+        total_bytes += size
+        total_duration += segment["duration"]
+    return {
+        "peak_bandwidth": int(peak),
+        "average_bandwidth": int(total_bytes * 8 / total_duration) if total_duration else 0,
+        "segment_count": len(segments),
+        "duration": total_duration,
+    }
+
+def probe_rendition(manifest_path):
+    base_dir = os.path.dirname(manifest_path)
+    init_uri, segments = parse_media_playlist(manifest_path)
+    # En fMP4 les métadonnées du codec sont dans le segment d'initialisation
+    probe_uri = init_uri or (segments[0]["uri"] if segments else None)
+    if probe_uri is None:
+        return None
+    probe = ffmpeg.probe(os.path.join(base_dir, probe_uri))
+    return next((st for st in probe['streams'] if st['codec_type'] == 'video'), None)
+
+def default_variant(quality, manifest):
+    return {
+        "quality": quality,
+        "manifest": manifest,
+        "bandwidth": int(DEFAULT_BANDWIDTHS.get(quality_key(quality), "5000000")),
+        "average_bandwidth": None,
+        "resolution": DEFAULT_RESOLUTIONS.get(quality_key(quality), "1920x1080"),
+        "frame_rate": None,
+        "codecs": None,
+        "packaging": None,
+        "independent_segments": False,
+    }
+
+def variant_entry(quality, manifest, fallback_fps=None, audio=None):
+    # Débits mesurés sur les segments produits ; valeurs par défaut si la mesure échoue
+    variant = default_variant(quality, manifest)
+    try:
+        init_uri, _ = parse_media_playlist(manifest)
+        variant["packaging"] = "fmp4" if init_uri else "ts"
+        with open(manifest) as f:
+            variant["independent_segments"] = "#EXT-X-INDEPENDENT-SEGMENTS" in f.read()
+        measure = measure_playlist(manifest)
+        stream = probe_rendition(manifest)
+    except Exception as e:
+        print(f"Erreur lors de la mesure de la rendition {quality} : {e}")
+        return variant
+    if measure["peak_bandwidth"]:
+        variant["bandwidth"] = measure["peak_bandwidth"]
+        variant["average_bandwidth"] = measure["average_bandwidth"]
+    if audio:
+        # BANDWIDTH couvre l'ensemble des flux lus simultanément (vidéo + audio)
+        variant["bandwidth"] += audio["peak_bandwidth"]
+        if variant["average_bandwidth"]:
+            variant["average_bandwidth"] += audio["average_bandwidth"]
+    if stream:
+        variant["resolution"] = f"{stream['width']}x{stream['height']}"
+        fps = parse_frame_rate(stream.get('avg_frame_rate')) or parse_frame_rate(stream.get('r_frame_rate'))
+        variant["frame_rate"] = fps or fallback_fps
+        video_codec = avc_codec_string(stream.get('profile'), stream.get('level'))
+        if video_codec:
+            variant["codecs"] = ",".join([video_codec, AAC_LC_CODEC] if audio else [video_codec])
+    return variant
+
+HLS_PACKAGINGS = ("ts", "fmp4")
+
+def hls_output_args(segments_dir, name, packaging=None, align=None):
+    # "ts" : un fichier .ts par segment ; "fmp4" : CMAF, un segment d'init + un seul
+    # fichier média par rendition, adressé par EXT-X-BYTERANGE
+    packaging = packaging or settings.VIDEO_HLS_PACKAGING
+    align = settings.VIDEO_HLS_ALIGN_GOP if align is None else align
+    if packaging not in HLS_PACKAGINGS:
+        raise ValueError(f"Packaging HLS '{packaging}' non supporté")
+    args = [
+        "-f", "hls", "-hls_time", str(settings.VIDEO_HLS_SEGMENT_TIME), "-hls_list_size", "0",
+        "-hls_playlist_type", "vod",
+    ]
+    hls_flags = []
+    if align:
+        # Premier segment court pour un démarrage rapide, segments indépendants (GOP fermés)
+        args += ["-hls_init_time", str(settings.VIDEO_HLS_INIT_SEGMENT_TIME)]
+        hls_flags.append("independent_segments")
+    if packaging == "fmp4":
+        hls_flags.append("single_file")
+        args += [
+            "-hls_segment_type", "fmp4",
+            "-hls_fmp4_init_filename", f"{name}_init.mp4",
+            "-hls_segment_filename", os.path.join(segments_dir, f"{name}.m4s"),
+        ]
+    else:
+        args += ["-hls_segment_filename", os.path.join(segments_dir, f"{name}_%03d.ts")]
+    if hls_flags:
+        args += ["-hls_flags", "+".join(hls_flags)]
+    return args + [os.path.join(segments_dir, f"{name}.m3u8")]
+
+def gop_args(fps=None):
+    # Images clés forcées aux mêmes instants pour toutes les renditions : les frontières
+    # de segments (multiples de VIDEO_HLS_GOP_SECONDS) sont identiques d'une qualité à l'autre
+    gop = settings.VIDEO_HLS_GOP_SECONDS
+    args = ["-force_key_frames", f"expr:gte(t,n_forced*{gop})", "-sc_threshold", "0", "-flags", "+cgop"]
+    if fps:
+        frames = max(int(round(fps * gop)), 1)
+        args += ["-g", str(frames), "-keyint_min", str(frames)]
+    return args
+
+def can_remux(info, align=None):
+    # La source peut-elle servir telle quelle de rendition "original" (copie de flux) ?
+    align = settings.VIDEO_HLS_ALIGN_GOP if align is None else align
+    if info is None or info.video_codec != "h264" or info.pix_fmt not in REMUX_PIX_FMTS:
+        return False
+    if info.video_profile not in AVC_PROFILES or not info.keyframe_interval:
+        return False
+    if not align:
+        # Il suffit de pouvoir couper des segments de la durée visée
+        return info.keyframe_interval <= settings.VIDEO_HLS_SEGMENT_TIME
+    # En mode aligné, chaque point de la grille forcée des autres qualités (multiple du GOP) doit
+    # porter une image clé de la source, à une image près, jusqu'à la fin : des GOP plus courts
+    # (1 s, 0,5 s) conviennent. Des instants limités à une fenêtre sondée laissent des points
+    # sans image clé, la source est alors ré-encodée.
+    keyframes = info.keyframe_times or []
+    if len(keyframes) < 2 or not info.duration:
+        return False
+    gop = settings.VIDEO_HLS_GOP_SECONDS
+    tolerance = 1 / info.fps if info.fps else 0.05
+    start = keyframes[0]
+    end = start + info.duration
+    point = 1
+    while start + point * gop < end - tolerance:
+        boundary = start + point * gop
+        index = bisect_left(keyframes, boundary - tolerance)
+        if index == len(keyframes) or keyframes[index] > boundary + tolerance:
+            return False
+        point += 1
+    return True
+
+def build_ladder_command(source_path, renditions, segments_base_dir, packaging=None, align=None, fps=None, ladder=None, outputs=None, remux=None):
+    # Un seul décodage de la source : split + scale par sortie, HLS écrit directement
+    # (ou, pour un morceau d'encodage distribué, les sorties données par `outputs`)
+    align = settings.VIDEO_HLS_ALIGN_GOP if align is None else align
+    # "original" est copié quand la source est compatible (voir can_remux) ; sans indication,
+    # seulement hors mode aligné
+    remux = (not align) if remux is None else remux
+    copied = [q for q in renditions if q == "original"] if remux else []
+    encoded = [q for q in renditions if q not in copied]
+
+    cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-i", source_path]
+    if encoded:
+        labels = "".join(f"[s{i}]" for i in range(len(encoded)))
+        graph = [f"[0:v:0]split={len(encoded)}{labels}"]
+        for i, quality in enumerate(encoded):
+            if quality == "original":
+                # Dimensions natives arrondies au pair : libx264 refuse le yuv420p de taille impaire (853x480...)
+                graph.append(f"[s{i}]scale=trunc(iw/2)*2:trunc(ih/2)*2[v{i}]")
+                continue
+            height = get_quality_height(quality)
+            if not height:
+                raise ValueError(f"Qualité cible '{quality}' non supportée")
+            graph.append(f"[s{i}]scale=-2:{height}[v{i}]")
+        cmd += ["-filter_complex", ";".join(graph)]
+
+    for quality in renditions:
+        segments_dir = os.path.join(segments_base_dir, quality)
+        os.makedirs(segments_dir, exist_ok=True)
+        if quality in copied:
+            cmd += ["-map", "0:v:0", "-c:v", "copy"]
+        else:
+            cmd += [
+                "-map", f"[v{encoded.index(quality)}]",
+                "-c:v", "libx264",
+                "-preset", settings.VIDEO_ENCODER_PRESET,
+                "-crf", str(settings.VIDEO_ENCODER_CRF),
+                "-pix_fmt", "yuv420p"
+            ]
+            if align:
+                cmd += gop_args(fps)
+            # Échelle par titre : CRF plafonné au débit estimé lors de l'analyse de complexité
+            maxrate = (ladder or {}).get(quality, {}).get("maxrate")
+            if maxrate:
+                cmd += ["-maxrate", str(maxrate), "-bufsize", str(maxrate * 2)]
+        if outputs is not None:
+            cmd += ["-an", "-sn"] + outputs[quality]
+        else:
+            cmd += ["-an", "-sn"] + hls_output_args(segments_dir, "video", packaging, align)
+    return cmd
+
+TEXT_SUBTITLE_CODECS = ("subrip", "srt", "ass", "ssa", "mov_text", "webvtt", "text")
+
+def can_copy_audio(stream):
+    # Seul l'AAC-LC est copié : le master annonce AAC_LC_CODEC pour toutes les pistes audio
+    # (HE-AAC, Main, LTP... sont ré-encodés)
+    return stream.get('codec_name') == "aac" and stream.get('profile') == "LC"
+
+def build_media_tracks_command(source_path, segments_dir, audio_tracks, subtitle_tracks):
+    # Une seule lecture de la source : une sortie HLS par piste audio, une sortie WebVTT par sous-titre.
+    # Audio : (index dans le type, nom de fichier, copie possible) ; sous-titres : (index, nom, codec source)
+    cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-i", source_path]
+    for index, name, copy in audio_tracks:
+        cmd += ["-map", f"0:a:{index}", "-c:a", "copy" if copy else "aac", "-vn", "-sn"]
+        cmd += hls_output_args(segments_dir, name)
+    for index, name, codec in subtitle_tracks:
+        cmd += ["-map", f"0:s:{index}", "-c:s", "webvtt", os.path.join(segments_dir, f"{name}.vtt")]
+    return cmd
+
+def parse_vtt_time(value):
+    # "HH:MM:SS.mmm" ou "MM:SS.mmm"
+    parts = value.replace(",", ".").split(":")
+    seconds = float(parts[-1])
+    if len(parts) == 3:
+        return int(parts[0]) * 3600 + int(parts[1]) * 60 + seconds
+    if len(parts) == 2:
+        return int(parts[0]) * 60 + seconds
+    return seconds
+
+def parse_webvtt(vtt_path):
+    # Retourne les cues (début, fin, lignes) ; l'en-tête et les blocs NOTE/STYLE sont ignorés
+    with open(vtt_path, encoding='utf-8') as f:
+        blocks = f.read().replace("\r\n", "\n").split("\n\n")
+    cues = []
+    for block in blocks:
+        lines = [line for line in block.split("\n") if line.strip()]
+        timing_index = next((i for i, line in enumerate(lines) if "-->" in line), None)
+        if timing_index is None:
+            continue
+        start, _, rest = lines[timing_index].partition("-->")
+        end = rest.strip().split(" ")[0]
+        cues.append((parse_vtt_time(start.strip()), parse_vtt_time(end), lines[timing_index:]))
+    return cues
+
+def segment_boundaries(reference_manifest, duration):
+    # Mêmes frontières que les segments vidéo ; à défaut, la grille théorique de segmentation
+    if reference_manifest and os.path.exists(reference_manifest):
+        _, segments = parse_media_playlist(reference_manifest)
+        boundaries, start = [], 0.0
+        for segment in segments:
+            boundaries.append((start, segment["duration"]))
+            start += segment["duration"]
+        if boundaries:
+            return boundaries
+    boundaries, start = [], 0.0
+    first = settings.VIDEO_HLS_INIT_SEGMENT_TIME if settings.VIDEO_HLS_ALIGN_GOP else settings.VIDEO_HLS_SEGMENT_TIME
+    while start < duration:
+        length = first if not boundaries else settings.VIDEO_HLS_SEGMENT_TIME
+        boundaries.append((start, min(length, duration - start)))
+        start += length
+    return boundaries
+
+def first_segment_mpegts(reference_manifest):
+    # X-TIMESTAMP-MAP : PTS (90 kHz) du début du premier segment vidéo MPEG-TS
+    if not reference_manifest or not os.path.exists(reference_manifest):
+        return settings.VIDEO_SUBTITLE_DEFAULT_MPEGTS
+    init_uri, segments = parse_media_playlist(reference_manifest)
+    if init_uri or not segments:
+        # fMP4 : la timeline des segments commence à 0
+        return 0
+    probe = ffmpeg.probe(os.path.join(os.path.dirname(reference_manifest), segments[0]["uri"]))
+    return int(round(float(probe['format'].get('start_time') or 0) * 90000))
+
+def segment_webvtt(vtt_path, output_dir, name, boundaries, mpegts):
+    cues = parse_webvtt(vtt_path)
+    entries = []
+    for index, (start, length) in enumerate(boundaries):
+        end = start + length
+        segment_name = f"{name}_{index:03d}.vtt"
+        with open(os.path.join(output_dir, segment_name), 'w', encoding='utf-8') as f:
+            f.write(f"WEBVTT\nX-TIMESTAMP-MAP=MPEGTS:{mpegts},LOCAL:00:00:00.000\n\n")
+            # Une cue à cheval sur deux segments est répétée dans chacun
+            for cue_start, cue_end, lines in cues:
+                if cue_start < end and cue_end > start:
+                    f.write("\n".join(lines) + "\n\n")
+        entries.append((segment_name, length))
+    manifest_path = os.path.join(output_dir, f"{name}.m3u8")
+    target_duration = max((int(-(-length // 1)) for _, length in entries), default=1)
+    temp_path = f"{manifest_path}.tmp"
+    with open(temp_path, 'w') as f:
+        f.write(f"#EXTM3U\n#EXT-X-TARGETDURATION:{target_duration}\n#EXT-X-VERSION:3\n")
+        f.write("#EXT-X-MEDIA-SEQUENCE:0\n#EXT-X-PLAYLIST-TYPE:VOD\n")
+        for segment_name, length in entries:
+            f.write(f"#EXTINF:{length:.6f},\n{segment_name}\n")
+        f.write("#EXT-X-ENDLIST\n")
+    os.replace(temp_path, manifest_path)
+    return manifest_path
+
+SUBTITLE_FORMATS = {
+    "srt": ("srt", "srt", "application/x-subrip"),
+    "ttml": ("ttml", "ttml", "application/ttml+xml"),
+    "vtt": ("webvtt", "webvtt", "text/vtt"),
+}
+
+def convert_subtitles(vtt_path, output_path, subtitle_format):
+    codec, muxer, _ = SUBTITLE_FORMATS[subtitle_format]
+    # Fichier temporaire propre à chaque requête : deux premières demandes simultanées
+    # ne doivent pas écrire dans le même fichier
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(output_path), suffix=".part")
+    os.close(fd)
+    try:
+        subprocess.run([
+            "ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-i", vtt_path,
+            "-c:s", codec, "-f", muxer, temp_path
+        ], check=True)
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return output_path
+
+def build_split_command(source_path, chunks_dir, chunk_seconds):
+    # Découpe sans réencodage : le muxer segment ne coupe que sur une image clé
+    return [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-i", source_path,
+        "-map", "0:v:0", "-c", "copy", "-f", "segment", "-segment_time", str(chunk_seconds),
+        "-reset_timestamps", "1", os.path.join(chunks_dir, "chunk_%04d.mkv")
+    ]
+
+def build_stitch_command(concat_list_path, segments_dir, packaging=None):
+    # Concaténation des morceaux encodés en copie de flux, segmentée en un HLS continu
+    return [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-f", "concat", "-safe", "0", "-i", concat_list_path,
+        "-map", "0:v:0", "-c", "copy"
+    ] + hls_output_args(segments_dir, "video", packaging)
+
+def parse_progress(block, duration=None):
+    # Bloc "clé=valeur" émis par `ffmpeg -progress` (frame, out_time_us, speed, total_size...)
+    out_time_us = block.get("out_time_us") or block.get("out_time_ms") or "0"
+    try:
+        out_time = max(int(out_time_us), 0) / 1_000_000
+    except ValueError:
+        out_time = 0.0
+    try:
+        speed = float(block.get("speed", "0").rstrip("x") or 0)
+    except ValueError:
+        speed = 0.0
+    total_size = block.get("total_size", "0")
+    progress = {
+        "frame": int(block.get("frame", 0) or 0),
+        "out_time": out_time,
+        "speed": speed,
+        "total_size": int(total_size) if total_size.isdigit() else 0,
+        "done": block.get("progress") == "end",
+        "percent": None,
+        "eta": None,
+    }
+    if duration:
+        progress["percent"] = 100.0 if progress["done"] else min(out_time / duration * 100, 100.0)
+        if speed > 0:
+            progress["eta"] = max(duration - out_time, 0) / speed
+    return progress
+
+def run_ffmpeg(cmd, duration=None, on_progress=None):
+    if on_progress is None:
+        subprocess.run(cmd, check=True)
+        return None
+    cmd = [cmd[0], "-progress", "pipe:1", "-nostats"] + cmd[1:]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    block = {}
+    last = None
+    for line in process.stdout:
+        key, _, value = line.strip().partition("=")
+        if not key:
+            continue
+        block[key] = value
+        if key == "progress":
+            last = parse_progress(block, duration)
+            on_progress(last)
+            block = {}
+    returncode = process.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd)
+    return last
+
+def run_ladder(source_path, renditions, segments_base_dir, duration=None, on_progress=None, packaging=None, align=None, fps=None, ladder=None, remux=None):
+    if not renditions:
+        return []
+    cmd = build_ladder_command(source_path, renditions, segments_base_dir, packaging, align, fps, ladder, remux=remux)
+    run_ffmpeg(cmd, duration=duration, on_progress=on_progress)
+    return [default_variant(quality, os.path.join(segments_base_dir, quality, "video.m3u8")) for quality in renditions]
+
+def sample_windows(duration):
+    # Fenêtres courtes réparties sur la durée (début et fin exclus)
+    count, length = settings.VIDEO_COMPLEXITY_SAMPLES, settings.VIDEO_COMPLEXITY_WINDOW
+    if not duration or duration <= length * count:
+        return [(0.0, min(duration or length, length * count))]
+    step = duration / (count + 1)
+    return [(step * (i + 1) - length / 2, length) for i in range(count)]
+
+def build_probe_command(source_path, start, length, heights, output_dir):
+    # Même encodeur et même CRF que l'échelle finale, une sortie par hauteur candidate
+    labels = "".join(f"[s{i}]" for i in range(len(heights)))
+    graph = [f"[0:v:0]split={len(heights)}{labels}"]
+    graph += [f"[s{i}]scale=-2:{height}[v{i}]" for i, height in enumerate(heights)]
+    cmd = [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-ss", f"{start:.3f}", "-t", f"{length:.3f}", "-i", source_path,
+        "-filter_complex", ";".join(graph)
+    ]
+    for i, height in enumerate(heights):
+        cmd += [
+            "-map", f"[v{i}]", "-c:v", "libx264",
+            "-preset", settings.VIDEO_ENCODER_PRESET,
+            "-crf", str(settings.VIDEO_ENCODER_CRF),
+            "-pix_fmt", "yuv420p", "-an", "-f", "h264",
+            os.path.join(output_dir, f"probe_{height}.h264")
+        ]
+    return cmd
+
+def analyze_complexity(source_path, duration, heights):
+    # Débit moyen (bits/s) obtenu au CRF cible pour chaque hauteur, sur quelques fenêtres
+    heights = sorted(set(heights), reverse=True)
+    totals = dict.fromkeys(heights, 0)
+    sampled = 0.0
+    with tempfile.TemporaryDirectory() as output_dir:
+        for start, length in sample_windows(duration):
+            run_ffmpeg(build_probe_command(source_path, start, length, heights, output_dir))
+            for height in heights:
+                totals[height] += os.path.getsize(os.path.join(output_dir, f"probe_{height}.h264"))
+            sampled += length
+    return {height: int(total * 8 / sampled) for height, total in totals.items()}
+
+def plan_adaptive_ladder(qualities, source_height, bitrates):
+    # qualities[0] est la source ("original") ; on descend l'échelle en écartant toute
+    # rendition dont le débit est trop proche de la précédente retenue
+    min_gap = settings.VIDEO_LADDER_MIN_BITRATE_GAP
+    factor = settings.VIDEO_LADDER_MAXRATE_FACTOR
+    # Source sous 144 px : aucune qualité standard, seule la rendition native est produite
+    kept = list(qualities[:1])
+    ladder = {"original": {"height": source_height, "bitrate": bitrates[source_height]}}
+    previous = bitrates[source_height]
+    for quality in qualities[1:]:
+        height = get_quality_height(quality)
+        bitrate = bitrates.get(height)
+        if not height or bitrate is None or bitrate >= previous * (1 - min_gap):
+            continue
+        kept.append(quality)
+        ladder[quality] = {"height": height, "bitrate": bitrate}
+        previous = bitrate
+    for rung in ladder.values():
+        rung["maxrate"] = int(rung["bitrate"] * factor)
+    return kept, ladder
+
+TRICKPLAY_EXTENSIONS = {"jpeg": "jpg", "webp": "webp"}
+TRICKPLAY_QUALITY_ARGS = {"jpeg": ["-q:v", "3"], "webp": ["-quality", "75"]}
+
+def trickplay_geometry(source_width, source_height):
+    width = settings.VIDEO_TRICKPLAY_WIDTH
+    # Hauteur paire, calculée ici plutôt que par scale=-2 pour connaître les coordonnées des vignettes
+    height = max(2, int(round(source_height * width / source_width / 2)) * 2)
+    return width, height
+
+def format_vtt_time(seconds):
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{secs:06.3f}"
+
+def build_trickplay_command(source_path, output_dir, width, height, formats=None):
+    # Une seule passe : échantillonnage, mise à l'échelle, mosaïque, puis une sortie par format
+    formats = formats or settings.VIDEO_TRICKPLAY_FORMATS
+    interval = settings.VIDEO_TRICKPLAY_INTERVAL
+    tile = f"{settings.VIDEO_TRICKPLAY_COLUMNS}x{settings.VIDEO_TRICKPLAY_ROWS}"
+    labels = "".join(f"[t{i}]" for i in range(len(formats)))
+    graph = f"[0:v:0]fps=1/{interval},scale={width}:{height},tile={tile},split={len(formats)}{labels}"
+    cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "error", "-i", source_path, "-filter_complex", graph]
+    for i, image_format in enumerate(formats):
+        cmd += ["-map", f"[t{i}]"] + TRICKPLAY_QUALITY_ARGS[image_format]
+        cmd.append(os.path.join(output_dir, f"sprite_%03d.{TRICKPLAY_EXTENSIONS[image_format]}"))
+    return cmd
+
+def write_trickplay_vtt(vtt_path, duration, width, height, image_format):
+    interval = settings.VIDEO_TRICKPLAY_INTERVAL
+    columns, rows = settings.VIDEO_TRICKPLAY_COLUMNS, settings.VIDEO_TRICKPLAY_ROWS
+    per_sprite = columns * rows
+    count = max(1, int(-(-duration // interval)))
+    temp_path = f"{vtt_path}.tmp"
+    with open(temp_path, 'w') as f:
+        f.write("WEBVTT\n\n")
+        for index in range(count):
+            start = index * interval
+            end = min((index + 1) * interval, duration) or interval
+            position = index % per_sprite
+            x, y = (position % columns) * width, (position // columns) * height
+            # Les sprites ffmpeg sont numérotés à partir de 1
+            sprite = f"sprite_{index // per_sprite + 1:03d}.{TRICKPLAY_EXTENSIONS[image_format]}"
+            f.write(f"{format_vtt_time(start)} --> {format_vtt_time(end)}\n")
+            f.write(f"{sprite}#xywh={x},{y},{width},{height}\n\n")
+    os.replace(temp_path, vtt_path)
+    return vtt_path
+
+def generate_trickplay(source_path, output_dir, duration, source_width, source_height):
+    os.makedirs(output_dir, exist_ok=True)
+    width, height = trickplay_geometry(source_width, source_height)
+    run_ffmpeg(build_trickplay_command(source_path, output_dir, width, height), duration=duration)
+    tracks = {}
+    for image_format in settings.VIDEO_TRICKPLAY_FORMATS:
+        tracks[image_format] = write_trickplay_vtt(
+            os.path.join(output_dir, f"thumbnails_{image_format}.vtt"), duration, width, height, image_format
+        )
+    return {"interval": settings.VIDEO_TRICKPLAY_INTERVAL, "width": width, "height": height, "tracks": tracks}
+
+def media_attributes(language, name):
+    # LANGUAGE seulement pour une vraie étiquette (fr, eng, pt-BR...) : pas pour "und", "unknown" ni "lang0"
+    attributes = f'NAME="{name}"'
+    if re.fullmatch(r"[A-Za-z]{2,3}(-[A-Za-z0-9]{2,8})*", language or "") and language.lower() != "und":
+        attributes += f',LANGUAGE="{language}"'
+    return attributes
+
+def write_master_playlist(master_manifest_path, video_dir, variant_manifests, audio_manifests, subtitle_manifests, session_data=None):
+    # EXT-X-MAP (fMP4) impose la version 7 du protocole
+    version = 7 if any(v.get("packaging") == "fmp4" for v in variant_manifests) else 3
+    # Écriture dans un fichier temporaire puis rename : un lecteur ne voit jamais un master partiel
+    temp_path = f"{master_manifest_path}.tmp"
+    with open(temp_path, 'w') as f:
+        f.write(f"#EXTM3U\n#EXT-X-VERSION:{version}\n")
+        if variant_manifests and all(v.get("independent_segments") for v in variant_manifests):
+            f.write("#EXT-X-INDEPENDENT-SEGMENTS\n")
+        for data_id, value in session_data or []:
+            f.write(f'#EXT-X-SESSION-DATA:DATA-ID="{data_id}",VALUE="{value}"\n')
+        # Pistes : (langue, nom unique dans le groupe, playlist)
+        for lang, name, audio_manifest in audio_manifests:
+            relative_audio_path = os.path.relpath(audio_manifest, video_dir)
+            f.write(f'#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="audio",{media_attributes(lang, name)},URI="{relative_audio_path}"\n')
+        for lang, name, subtitle_manifest in subtitle_manifests:
+            relative_subtitle_path = os.path.relpath(subtitle_manifest, video_dir)
+            f.write(f'#EXT-X-MEDIA:TYPE=SUBTITLES,GROUP-ID="subs",{media_attributes(lang, name)},URI="{relative_subtitle_path}"\n')
+        for variant in variant_manifests:
+            attributes = [f"BANDWIDTH={variant['bandwidth']}"]
+            if variant.get("average_bandwidth"):
+                attributes.append(f"AVERAGE-BANDWIDTH={variant['average_bandwidth']}")
+            attributes.append(f"RESOLUTION={variant['resolution']}")
+            if variant.get("frame_rate"):
+                attributes.append(f"FRAME-RATE={variant['frame_rate']:.3f}")
+            if variant.get("codecs"):
+                attributes.append(f'CODECS="{variant["codecs"]}"')
+            # Les groupes ne sont référencés que s'ils existent
+            if audio_manifests:
+                attributes.append('AUDIO="audio"')
+            if subtitle_manifests:
+                attributes.append('SUBTITLES="subs"')
+            attributes.append(f'NAME="{variant["quality"]}"')
+            relative_video_path = os.path.relpath(variant["manifest"], video_dir)
+            f.write(f"#EXT-X-STREAM-INF:{','.join(attributes)}\n")
+            f.write(f"{relative_video_path}\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, master_manifest_path)
+    return master_manifest_path
@@ -0,0 +1,113 @@
+from apps.videos.uploads import (
+    get_upload_path, pwrite_all, begin_tus_patch, commit_tus_patch, tus_error_headers,
+    TUS_VERSION, TUS_CHECKSUM_ALGORITHMS
+)
+from helpers.middleware import get_user_from_token
+from channels.db import database_sync_to_async
+from asgiref.sync import sync_to_async
+from django.conf import settings
+import base64
+import hashlib
+import os
+import re
+
+# PATCH tus traité au niveau ASGI : Django lirait tout le corps dans un SpooledTemporaryFile
+# (disque au-delà de FILE_UPLOAD_MAX_MEMORY_SIZE) avant d'appeler la vue. Ici chaque message
+# http.request est écrit à son offset dès réception. Les autres méthodes restent dans TusUploadView.
+TUS_PATCH_PATH = re.compile(r"/videos/tus/(?P<upload_id>[0-9a-fA-F-]{36})$")
+
+async def write_body_at(path, offset, receive, max_bytes, hasher=None):
+    fd = await sync_to_async(os.open, thread_sensitive=False)(path, os.O_WRONLY)
+    position = offset
+    try:
+        while position - offset < max_bytes:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                # Connexion coupée : les octets déjà écrits restent acquis
+                break
+            data = message.get('body', b'')[:max_bytes - (position - offset)]
+            if data:
+                if hasher is not None:
+                    hasher.update(data)
+                position += await sync_to_async(pwrite_all, thread_sensitive=False)(fd, data, position)
+            if not message.get('more_body'):
+                break
+    finally:
+        os.close(fd)
+    return position - offset
+
+async def handle_tus_patch(scope, receive, upload_id):
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+    if headers.get('tus-resumable') != TUS_VERSION:
+        return 412, {"Tus_Version": TUS_VERSION}
+    if headers.get('content-type', '').split(';')[0].strip() != 'application/offset+octet-stream':
+        return 415, {}
+    # Même jeton JWT que l'API (JWTAuthentication)
+    authorization = headers.get('authorization', '')
+    user = await get_user_from_token(authorization.split(' ', 1)[1]) if authorization.startswith('Bearer ') else None
+    if user is None or not user.is_active:
+        return 401, {}
+    try:
+        offset = int(headers.get('upload-offset', ''))
+    except ValueError:
+        return 400, {}
+
+    hasher = expected_digest = None
+    if headers.get('upload-checksum'):
+        algorithm, _, expected_digest = headers['upload-checksum'].partition(' ')
+        if algorithm not in TUS_CHECKSUM_ALGORITHMS:
+            return 400, {}
+        hasher = hashlib.new(algorithm)
+
+    video_upload, error = await database_sync_to_async(begin_tus_patch)(upload_id, user.id, offset)
+    if error:
+        return error, tus_error_headers(video_upload)
+    remaining = video_upload.total_size - offset
+    content_length = headers.get('content-length', '')
+    if content_length.isdigit() and int(content_length) > remaining:
+        return 413, {}
+
+    try:
+        written = await write_body_at(get_upload_path(upload_id), offset, receive, remaining, hasher)
+    except FileNotFoundError:
+        # Fichier renommé par la finalisation ou supprimé par un abandon entre-temps
+        return 409, {}
+    if hasher is not None and base64.b64encode(hasher.digest()).decode() != expected_digest.strip():
+        # 460 Checksum Mismatch : l'offset n'avance pas, les octets seront réécrits
+        return 460, {}
+
+    video_upload, status = await database_sync_to_async(commit_tus_patch)(video_upload, offset, written)
+    return status, tus_error_headers(video_upload)
+
+async def send_tus_response(send, scope, status, headers):
+    # Réponse sans corps ; Upload_Offset -> en-tête Upload-Offset, comme tus_response
+    response_headers = [(b"tus-resumable", TUS_VERSION.encode())]
+    response_headers += [(name.replace('_', '-').lower().encode(), str(value).encode()) for name, value in headers.items()]
+    origin = dict(scope['headers']).get(b'origin')
+    if origin:
+        # Hors de la pile Django : en-têtes CORS posés comme le ferait django-cors-headers
+        response_headers += [
+            (b"access-control-allow-origin", origin),
+            (b"access-control-allow-credentials", b"true"),
+            (b"access-control-expose-headers", ", ".join(settings.CORS_EXPOSE_HEADERS).encode()),
+            (b"vary", b"origin"),
+        ]
+    await send({"type": "http.response.start", "status": status, "headers": response_headers})
+    await send({"type": "http.response.body", "body": b""})
+
+class TusPatchMiddleware:
+    def __init__(self, inner):
+        self.inner = inner
+
+    async def __call__(self, scope, receive, send):
+        match = None
+        if scope['type'] == 'http' and scope['method'] == 'PATCH':
+            match = TUS_PATCH_PATH.search(scope['path'])
+        if match is None:
+            return await self.inner(scope, receive, send)
+        try:
+            status, headers = await handle_tus_patch(scope, receive, match['upload_id'])
+        except Exception as e:
+            print(f"Erreur dans TusPatchMiddleware: {str(e)}")
+            status, headers = 500, {}
+        await send_tus_response(send, scope, status, headers)
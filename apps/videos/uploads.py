@@ -0,0 +1,299 @@
+from apps.videos.models import Video, VideoUpload, VideoProcessingTask
+from apps.videos.serializers import VideoSerializer
+from apps.videos.storage import hash_file, register_video_content, get_storage_dir
+from apps.videos.jobs import enqueue_video_processing, enqueue_task
+from helpers.helper import format_file_size, format_duration
+from django.conf import settings
+from django.db import transaction
+from channels.layers import get_channel_layer
+from asgiref.sync import async_to_sync
+import base64
+import os
+
+# Upload en morceaux : un fichier préalloué par upload, chaque morceau écrit directement
+# à son offset ; la finalisation (fsync, renommage, hash) est faite par un worker.
+
+def get_upload_path(upload_id):
+    return os.path.join(settings.MEDIA_ROOT, settings.VIDEO_UPLOAD_TMP_DIR, f"{upload_id}.part")
+
+def get_final_upload_name(upload_id):
+    # Nom relatif à MEDIA_ROOT, directement utilisable dans Video.fichier
+    return os.path.join("videos", f"{upload_id}.mp4")
+
+def preallocate_upload_file(path, size):
+    if not 0 < size <= settings.VIDEO_UPLOAD_MAX_SIZE:
+        raise ValueError(f"Taille d'upload invalide : {size}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Sans O_EXCL : plusieurs requêtes peuvent préparer le même fichier sans s'écraser
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if os.fstat(fd).st_size < size:
+            try:
+                os.posix_fallocate(fd, 0, size)
+            except (AttributeError, OSError):
+                # Système de fichiers sans fallocate : fichier creux de la bonne taille
+                os.ftruncate(fd, size)
+    finally:
+        os.close(fd)
+
+def infer_chunk_size(total_size, total_chunks, chunk_number, chunk_length):
+    # Morceaux de taille fixe : tout morceau sauf le dernier donne la taille, le dernier la
+    # donne par différence (total_size = chunk_size * (total_chunks - 1) + longueur du dernier)
+    if chunk_number != total_chunks - 1:
+        return chunk_length
+    if total_chunks == 1:
+        return total_size
+    remaining, rest = divmod(total_size - chunk_length, total_chunks - 1)
+    return remaining if not rest else None
+
+def chunk_layout_is_valid(total_size, total_chunks, chunk_size):
+    # Le dernier morceau contient entre 1 et chunk_size octets
+    return bool(chunk_size) and chunk_size * (total_chunks - 1) < total_size <= chunk_size * total_chunks
+
+def expected_chunk_length(total_size, total_chunks, chunk_size, chunk_number):
+    if chunk_number == total_chunks - 1:
+        return total_size - chunk_size * (total_chunks - 1)
+    return chunk_size
+
+def chunk_offset(chunk_size, chunk_number):
+    return chunk_number * chunk_size
+
+def pwrite_all(fd, data, position):
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, position)
+        view = view[written:]
+        position += written
+    return len(data)
+
+def write_chunk_at(path, offset, chunk):
+    fd = os.open(path, os.O_WRONLY)
+    position = offset
+    try:
+        for data in chunk.chunks():
+            position += pwrite_all(fd, data, position)
+    finally:
+        os.close(fd)
+    return position - offset
+
+def write_stream_at(path, offset, stream, max_bytes, hasher=None, block_size=1024 * 1024):
+    # Corps brut (tus) écrit au fil de la lecture, sans analyse multipart. Sous WSGI, request.stream
+    # lit directement wsgi.input ; sous ASGI, voir apps.videos.tus (Django y bufferise le corps)
+    fd = os.open(path, os.O_WRONLY)
+    position = offset
+    try:
+        while stream is not None and position - offset < max_bytes:
+            try:
+                data = stream.read(min(block_size, max_bytes - (position - offset)))
+            except OSError:
+                # Connexion coupée : les octets déjà écrits restent acquis
+                break
+            if not data:
+                break
+            if hasher is not None:
+                hasher.update(data)
+            position += pwrite_all(fd, data, position)
+    finally:
+        os.close(fd)
+    return position - offset
+
+def bitmap_size(total_chunks):
+    return (total_chunks + 7) // 8
+
+def is_chunk_received(bitmap, chunk_number):
+    byte = chunk_number // 8
+    return byte < len(bitmap) and bool(bitmap[byte] & (1 << (chunk_number % 8)))
+
+def mark_chunk_received(bitmap, chunk_number, total_chunks):
+    bitmap = bytearray(bytes(bitmap or b"").ljust(bitmap_size(total_chunks), b"\0"))
+    bitmap[chunk_number // 8] |= 1 << (chunk_number % 8)
+    return bytes(bitmap)
+
+def missing_chunk_ranges(bitmap, total_chunks):
+    # Plages [début, fin] incluses de morceaux non reçus, pour la reprise côté client
+    ranges, start = [], None
+    for chunk_number in range(total_chunks):
+        if is_chunk_received(bitmap, chunk_number):
+            if start is not None:
+                ranges.append([start, chunk_number - 1])
+                start = None
+        elif start is None:
+            start = chunk_number
+    if start is not None:
+        ranges.append([start, total_chunks - 1])
+    return ranges
+
+def finalize_upload_file(upload_id):
+    # Le fichier complet devient la source de la vidéo sans recopie
+    upload_path = get_upload_path(upload_id)
+    final_name = get_final_upload_name(upload_id)
+    final_path = os.path.join(settings.MEDIA_ROOT, final_name)
+    if not os.path.exists(upload_path) and os.path.exists(final_path):
+        # Déjà renommé par un essai précédent
+        return final_name
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    fd = os.open(upload_path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(upload_path, final_path)
+    # Le renommage lui-même doit survivre à un arrêt brutal
+    dir_fd = os.open(os.path.dirname(final_path), os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+    return final_name
+
+def get_upload_group(user_id, upload_id):
+    return f"upload_{user_id}_{upload_id}"
+
+def notify_upload_status(user_id, upload_id, status, total_size, video_id=None):
+    async_to_sync(get_channel_layer().group_send)(
+        get_upload_group(user_id, upload_id),
+        {
+            'type': 'upload_progress',
+            'progress': 100,
+            'speed': format_file_size(0) + "/s",
+            'total_duration': format_duration(0),
+            'remaining_duration': format_duration(0),
+            'remaining_size': format_file_size(0),
+            'uploaded_bytes': total_size,
+            'total_bytes': total_size,
+            'video_id': video_id,
+            'status': status
+        }
+    )
+
+def start_upload_finalization(video_upload):
+    # À appeler sous le verrou de la ligne, dans la transaction qui reçoit les derniers octets
+    video_upload.status = 'FINALIZING'
+    video_upload.save(update_fields=['status'])
+    return enqueue_task(None, "FINALIZE", payload={"upload_id": str(video_upload.upload_id)}, user_id=video_upload.user_id)
+
+def complete_video_upload(upload_id):
+    # Tâche FINALIZE : rejouable après un échec à n'importe quelle étape. La ligne VideoUpload
+    # n'est supprimée qu'à la toute fin, pour que fail_video_upload puisse encore la marquer.
+    video_upload = VideoUpload.objects.select_related('user').filter(upload_id=upload_id).first()
+    video = Video.objects.filter(upload_id=upload_id).first()
+    if video is None:
+        if video_upload is None:
+            raise VideoUpload.DoesNotExist(f"Upload {upload_id} introuvable")
+        final_file_name = finalize_upload_file(upload_id)
+        video_data = {
+            'titre': video_upload.titre,
+            'description': video_upload.description,
+            'categorie': video_upload.categorie,
+            'visibilite': video_upload.visibilite,
+            'tags_names': [tag.strip() for tag in video_upload.tags.split(',') if tag.strip()]
+        }
+        serializer = VideoSerializer(data=video_data)
+        serializer.is_valid(raise_exception=True)
+        # Le fichier est déjà à sa place définitive : seul son nom est enregistré
+        video = serializer.save(envoyeur=video_upload.user, fichier=final_file_name, upload_id=upload_id)
+    elif video_upload is None:
+        # Finalisation déjà menée à son terme par un essai précédent
+        return video
+
+    total_size = video.fichier.size
+    if video.content_id is None:
+        register_video_content(video, hash_file(video.fichier.path), total_size)
+    # Recalculé à chaque essai : la vidéo est un doublon si elle ne possède pas le dossier du contenu
+    duplicate = get_storage_dir(video) != os.path.join("videos", str(video.id))
+
+    file_attente = None
+    with transaction.atomic():
+        # Verrou de la vidéo : un essai rejoué (ou concurrent) n'enfile pas une seconde fois les tâches
+        Video.objects.select_for_update().filter(pk=video.pk).first()
+        if not VideoProcessingTask.objects.filter(video_id=video.id).exists():
+            if not duplicate:
+                file_attente = enqueue_video_processing(video.id, video.envoyeur_id)
+            elif not hasattr(video, 'info'):
+                enqueue_task(video.id, "PROBE", user_id=video.envoyeur_id)
+
+    notify_upload_status(video.envoyeur_id, upload_id, 'completed', total_size, video_id=video.id)
+    channel_layer = get_channel_layer()
+    if file_attente:
+        # File chargée : on indique sa position à l'envoyeur
+        async_to_sync(channel_layer.group_send)(
+            get_upload_group(video.envoyeur_id, upload_id),
+            {
+                'type': 'processing_queued',
+                'video_id': video.id,
+                **file_attente
+            }
+        )
+
+    # Diffusion via WebSocket pour la création de la vidéo
+    async_to_sync(channel_layer.group_send)(
+        "video_updates",
+        {
+            "type": "video_created",
+            "video_id": video.id,
+            "video_data": VideoSerializer(video).data
+        }
+    )
+    # Finalisation terminée : l'upload n'a plus de raison d'être
+    VideoUpload.objects.filter(upload_id=upload_id).delete()
+    return video
+
+def fail_video_upload(upload_id):
+    video_upload = VideoUpload.objects.filter(upload_id=upload_id).first()
+    if video_upload is None:
+        return
+    VideoUpload.objects.filter(pk=video_upload.pk).update(status='FAILED')
+    notify_upload_status(video_upload.user_id, upload_id, 'failed', video_upload.total_size)
+
+def discard_upload_file(upload_id):
+    upload_path = get_upload_path(upload_id)
+    if os.path.exists(upload_path):
+        os.remove(upload_path)
+
+# tus 1.0 : https://tus.io/protocols/resumable-upload
+TUS_VERSION = "1.0.0"
+TUS_EXTENSIONS = ("creation", "termination", "checksum")
+TUS_CHECKSUM_ALGORITHMS = ("sha1", "sha256", "md5")
+
+def begin_tus_patch(upload_id, user_id, offset):
+    # Vérifié sous le verrou de la ligne avant d'écrire : un upload en finalisation (fichier
+    # renommé) ou abandonné n'accepte plus d'octets. Retourne (upload, statut d'erreur ou None).
+    with transaction.atomic():
+        video_upload = VideoUpload.objects.select_for_update().filter(upload_id=upload_id, user_id=user_id).first()
+        if video_upload is None:
+            return None, 404
+        if video_upload.status != 'UPLOADING' or offset != video_upload.received_bytes:
+            return video_upload, 409
+    return video_upload, None
+
+def commit_tus_patch(video_upload, offset, written):
+    # Avance l'offset une fois les octets écrits ; le dernier octet lance la finalisation
+    with transaction.atomic():
+        video_upload = VideoUpload.objects.select_for_update().filter(pk=video_upload.pk).first()
+        if video_upload is None:
+            # Abandonné (DELETE) pendant l'écriture
+            return None, 404
+        if video_upload.status != 'UPLOADING' or video_upload.received_bytes != offset:
+            # Un autre PATCH sur le même upload a avancé l'offset entre-temps
+            return video_upload, 409
+        video_upload.received_bytes = offset + written
+        video_upload.save(update_fields=['received_bytes'])
+        if video_upload.received_bytes == video_upload.total_size:
+            # Finalisation en tâche de fond, suivie via videos/chunked-upload/<upload_id>/
+            start_upload_finalization(video_upload)
+    return video_upload, 204
+
+def tus_error_headers(video_upload):
+    # Même convention que tus_response : Upload_Offset -> en-tête Upload-Offset
+    return {"Upload_Offset": video_upload.received_bytes} if video_upload is not None else {}
+
+def parse_tus_metadata(header):
+    # "clé valeurBase64,clé2 valeur2" ; la valeur est facultative
+    metadata = {}
+    for pair in filter(None, (item.strip() for item in (header or "").split(","))):
+        key, _, value = pair.partition(" ")
+        try:
+            metadata[key] = base64.b64decode(value.strip(), validate=True).decode('utf-8') if value.strip() else ""
+        except (ValueError, UnicodeDecodeError):
+            metadata[key] = ""
+    return metadata
@@ -19,6 +19,9 @@ urlpatterns = [
     path('videos/<str:code_id>/details/', views.VideoDetailByCodeIdView.as_view(), name='video-detail-by-code'),
     path('videos/create/', views.VideoCreateView.as_view(), name='video-create'),
     path('videos/chunked-upload/', views.ManualVideoChunkUploadView.as_view(), name='video-chunked-upload'),
+    path('videos/chunked-upload/<uuid:upload_id>/', views.ManualVideoChunkUploadStatusView.as_view(), name='video-chunked-upload-status'),
+    path('videos/tus/', views.TusUploadCreateView.as_view(), name='video-tus-create'),
+    path('videos/tus/<uuid:upload_id>', views.TusUploadView.as_view(), name='video-tus-upload'),
     # path('videos/chunked-upload/', views.VideoChunkedUploadView.as_view(), name='video-chunked-upload'),
     path('videos/<int:video_id>/update/', views.VideoUpdateView.as_view(), name='video-update'),
     path('videos/<int:video_id>/delete/', views.VideoDeleteView.as_view(), name='video-delete'),
@@ -27,7 +30,8 @@ urlpatterns = [
     path('videos/<int:video_id>/view/', views.VideoViewView.as_view(), name='video-view'),
     path('videos/<int:video_id>/download/', views.VideoDownloadView.as_view(), name='video-download'),
     path('videos/<int:video_id>/manifest/', views.VideoManifestView.as_view(), name='video-manifest'),
-    path('videos/<int:video_id>/segments/<str:segment_name>/', views.VideoSegmentView.as_view(), name='video-segment'),
+    path('videos/<int:video_id>/segments/<path:segment_name>/', views.VideoSegmentView.as_view(), name='video-segment'),
+    path('videos/<int:video_id>/subtitles/<str:track>.<str:subtitle_format>', views.VideoSubtitleView.as_view(), name='video-subtitles'),
 
     path('chaines/', views.ChaineListView.as_view(), name='chaine-list'),
     path('chaines/<int:chaine_id>/', views.ChaineDetailView.as_view(), name='chaine-detail'),
@@ -3,17 +3,26 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 
-from apps.videos.models import Video, Chaine, VideoPlaylist, Playlist, Commentaire, Message, Tag, VideoVue, VideoLike, VideoDislike, VideoRegarderPlusTard,VideoUpload, VideoChunk, VideoProcessingTask
+from apps.videos.models import Video, Chaine, VideoPlaylist, Playlist, Commentaire, Message, Tag, VideoVue, VideoLike, VideoDislike, VideoRegarderPlusTard,VideoUpload, VideoProcessingTask
 from apps.videos.serializers import VideoSerializer, ChaineSerializer, CommentaireSerializer, MessageSerializer, TagSerializer, PlaylistSerializer
-from apps.videos.tasks import process_video_conversion, generate_video_affichage
-from helpers.helper import LOGGER, get_token_from_request, get_user, format_file_size, get_available_info, format_duration
+from apps.videos.jobs import enqueue_video_processing, enqueue_task, start_inline_worker, hand_over_processing
+from apps.videos.storage import hash_file, register_video_content, delete_video_files, get_storage_dir
+from apps.videos.transcoder import SUBTITLE_FORMATS, convert_subtitles, playlist_files_size
+from apps.videos.uploads import (
+    get_upload_path, preallocate_upload_file, infer_chunk_size, chunk_layout_is_valid, expected_chunk_length,
+    chunk_offset, write_chunk_at,
+    is_chunk_received, mark_chunk_received, missing_chunk_ranges, start_upload_finalization,
+    write_stream_at, discard_upload_file, parse_tus_metadata, begin_tus_patch, commit_tus_patch, tus_error_headers, TUS_VERSION, TUS_EXTENSIONS, TUS_CHECKSUM_ALGORITHMS
+)
+from helpers.helper import LOGGER, get_token_from_request, get_user, format_file_size, get_available_info, format_duration, get_quality_label, ranged_file_response
 
 from drf_yasg.utils import swagger_auto_schema
-from django.core.files import File
 from drf_yasg import openapi
 from django.conf import settings
-from django.http import FileResponse
+from django.http import FileResponse, HttpResponse
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
+from django.db import transaction
 from django.db.models import Count
 from django.utils import timezone as django_timezone
 # from chunked_upload.views import ChunkedUploadView
@@ -22,35 +31,16 @@ from asgiref.sync import async_to_sync
 
 from datetime import datetime
 from datetime import timedelta, timezone
-import uuid, time, os, shutil
-from queue import Queue
-from threading import Thread
+import uuid, time, os, shutil, base64, hashlib
 
 import traceback
 
 ################################# WORKER #################################
 
-video_processing_queue = Queue()
-
-def video_processing_worker():
-    while True:
-        print(video_processing_queue)
-        video_info = video_processing_queue.get()
-        process_type = video_info.get('type')
-        video_id = video_info.get('video_id')
-        print("[!] 🖼️ Worker processing vidéo...", video_id)
-        try:
-            if process_type == "THUMBNAILS":
-                generate_video_affichage(video_id)
-            elif process_type == "CONVERSION":
-                process_video_conversion(video_id)
-        except Exception as e:
-            print("[❌] Erreur dans le worker pour image ID:", video_id, str(e))
-        finally:
-            video_processing_queue.task_done()
-            
-processing_worker_thread = Thread(target=video_processing_worker, daemon=True)
-processing_worker_thread.start()
+# Les tâches sont persistées dans VideoProcessingTask et consommées par `manage.py video_worker`.
+# En développement, un worker peut tourner directement dans ce processus.
+if settings.VIDEO_PROCESSING_INLINE_WORKER:
+    start_inline_worker()
 
 ################################# WORKER #################################
 
@@ -483,18 +473,13 @@ class VideoCreateView(APIView):
             if fichier:
                 video.fichier = fichier
             video.save()
-            video_processing_queue.put(
-                {
-                    "type":"THUMBNAILS",
-                    "video_id":video.id
-                }
-            )            
-            video_processing_queue.put(
-                {
-                    "type":"CONVERSION",
-                    "video_id":video.id
-                }
-            )
+            file_attente = None
+            if register_video_content(video, hash_file(video.fichier.path), video.fichier.size):
+                # Contenu déjà converti : seules les informations propres à la vidéo sont recalculées
+                if not hasattr(video, 'info'):
+                    enqueue_task(video.id, "PROBE", user_id=request.user.id)
+            else:
+                file_attente = enqueue_video_processing(video.id, request.user.id)
             
             channel_layer = get_channel_layer()
             async_to_sync(channel_layer.group_send)(
@@ -506,55 +491,130 @@ class VideoCreateView(APIView):
                 }
             )
             
-            return Response(serializer.data, status=201)
+            data = serializer.data
+            if file_attente:
+                data['file_attente'] = file_attente
+            return Response(data, status=201)
         return Response(serializer.errors, status=400)
 
 class ManualVideoChunkUploadView(APIView):
     permission_classes = [IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser]
 
+    def put(self, request):
+        # Même traitement que POST : les morceaux peuvent arriver en parallèle et dans le désordre
+        return self.post(request)
+
     def post(self, request):
         try:
             user = request.user
 
             start_time = datetime.now(timezone.utc)
             chunk = request.FILES.get('fichier')
-            upload_id = request.POST.get('upload_id', str(uuid.uuid4()))
-            chunk_number = int(request.POST.get('chunk_number', 0))
-            total_chunks = int(request.POST.get('total_chunks', 0))
-            total_size = int(request.POST.get('total_size', 0))
+            try:
+                upload_id = str(uuid.UUID(str(request.data.get('upload_id') or uuid.uuid4())))
+            except ValueError:
+                return Response({"error": "Upload ID invalide"}, status=400)
+            chunk_number = int(request.data.get('chunk_number', 0))
+            total_chunks = int(request.data.get('total_chunks', 0))
+            total_size = int(request.data.get('total_size', 0))
 
             if not chunk or not total_chunks or not total_size:
                 return Response({"error": "Données manquantes (fichier, total_chunks, total_size)"}, status=400)
+            if total_size > settings.VIDEO_UPLOAD_MAX_SIZE:
+                return Response({"error": f"Fichier trop volumineux (max {format_file_size(settings.VIDEO_UPLOAD_MAX_SIZE)})"}, status=413)
+            if not 0 <= chunk_number < total_chunks:
+                return Response({"error": "Numéro de morceau invalide"}, status=400)
+            # Taille des morceaux annoncée par le client, sinon déduite de ce morceau
+            chunk_size = int(request.data.get('chunk_size') or 0) or infer_chunk_size(
+                total_size, total_chunks, chunk_number, chunk.size
+            )
 
-            if chunk_number == 0:
-                video_upload_data = {
-                    'upload_id': upload_id,
+            # Un morceau déjà finalisé (nouvel essai après coupure) ne recrée pas d'upload
+            video = Video.objects.filter(upload_id=upload_id, envoyeur=user).first()
+            if video is not None:
+                return Response({"upload_id": upload_id, "chunk_number": chunk_number, "progress": 100, "video_id": video.id}, status=200)
+
+            # N'importe quel morceau peut créer l'upload : le premier arrivé fixe les métadonnées
+            # et la taille des morceaux
+            with transaction.atomic():
+                video_upload = VideoUpload.objects.filter(upload_id=upload_id).first()
+                if video_upload is None and not chunk_layout_is_valid(total_size, total_chunks, chunk_size):
+                    return Response({"error": "chunk_size incohérent avec total_size et total_chunks"}, status=400)
+                video_upload, created = VideoUpload.objects.get_or_create(upload_id=upload_id, defaults={
                     'user': user,
-                    'titre': request.POST.get('titre', ''),
-                    'description': request.POST.get('description', ''),
-                    'categorie': request.POST.get('categorie', ''),
-                    'visibilite': request.POST.get('visibilite', 'PUBLIC'),
-                    'tags': request.POST.get('tags', ''),
+                    'titre': request.data.get('titre', ''),
+                    'description': request.data.get('description', ''),
+                    'categorie': request.data.get('categorie', ''),
+                    'visibilite': request.data.get('visibilite', 'PUBLIC'),
+                    'tags': request.data.get('tags', ''),
                     'total_size': total_size,
-                    'total_chunks': total_chunks
-                }
-                video_upload = VideoUpload.objects.create(**video_upload_data)
-            else:
-                try:
-                    video_upload = VideoUpload.objects.get(upload_id=upload_id)
-                except VideoUpload.DoesNotExist:
-                    return Response({"error": "Upload ID invalide ou métadonnées manquantes"}, status=400)
-
-            chunk_instance = VideoChunk.objects.create(
-                video_upload=video_upload,
-                chunk_number=chunk_number,
-                chunk_file=chunk
+                    'total_chunks': total_chunks,
+                    'chunk_size': chunk_size
+                })
+                if created:
+                    # Fichier préalloué avant que l'upload ne soit visible des autres requêtes
+                    preallocate_upload_file(get_upload_path(upload_id), total_size)
+
+            if video_upload.user_id != user.id:
+                return Response({"error": "Upload ID invalide"}, status=400)
+            if video_upload.total_size != total_size or video_upload.total_chunks != total_chunks:
+                return Response({"error": "total_size ou total_chunks différent de celui de l'upload"}, status=400)
+            if not video_upload.chunk_size:
+                return Response({"error": "Upload ID invalide"}, status=400)
+            # Un morceau de la mauvaise longueur écraserait ses voisins ou laisserait un trou
+            expected_length = expected_chunk_length(
+                video_upload.total_size, video_upload.total_chunks, video_upload.chunk_size, chunk_number
             )
+            if chunk.size != expected_length:
+                return Response({"error": f"Morceau {chunk_number} de {chunk.size} octets, {expected_length} attendus"}, status=400)
+            offset = chunk_offset(video_upload.chunk_size, chunk_number)
+
+            # Écriture directe à l'offset du morceau dans le fichier préalloué : ni fichier par
+            # morceau ni recombinaison finale. Réécrire un morceau déjà reçu est sans effet.
+            try:
+                write_chunk_at(get_upload_path(upload_id), offset, chunk)
+            except FileNotFoundError:
+                # Fichier déjà renommé par la finalisation : un client qui renvoie le dernier morceau
+                # après une coupure voit l'upload terminé (comme le HEAD tus), pas un échec
+                video = Video.objects.filter(upload_id=upload_id, envoyeur=user).first()
+                if video is not None:
+                    return Response({"upload_id": upload_id, "chunk_number": chunk_number, "progress": 100, "video_id": video.id}, status=200)
+                if VideoUpload.objects.filter(pk=video_upload.pk, status='FINALIZING').exists():
+                    return Response({
+                        "upload_id": upload_id,
+                        "chunk_number": chunk_number,
+                        "progress": 100,
+                        "status": "finalizing",
+                        "status_url": request.build_absolute_uri(
+                            reverse('videos:video-chunked-upload-status', kwargs={'upload_id': upload_id})
+                        )
+                    }, status=202)
+                return Response({"error": "Upload introuvable ou en échec"}, status=409)
+
+            # Bitmap et compteurs mis à jour ensemble sous le verrou de la ligne
+            with transaction.atomic():
+                video_upload = VideoUpload.objects.select_for_update().get(pk=video_upload.pk)
+                already_received = is_chunk_received(video_upload.received_chunks, chunk_number)
+                if not already_received:
+                    video_upload.received_chunks = mark_chunk_received(
+                        video_upload.received_chunks, chunk_number, video_upload.total_chunks
+                    )
+                    video_upload.received_bytes += chunk.size
+                    video_upload.received_chunk_count += 1
+                    video_upload.save(update_fields=['received_chunks', 'received_bytes', 'received_chunk_count'])
+                # Seule la requête qui pose le dernier bit lance la finalisation, une fois chaque octet reçu
+                completed = (
+                    not already_received
+                    and video_upload.received_chunk_count == video_upload.total_chunks
+                    and video_upload.received_bytes == video_upload.total_size
+                )
+                if completed:
+                    start_upload_finalization(video_upload)
 
             elapsed_time = (datetime.now(timezone.utc) - start_time).total_seconds()
             speed = chunk.size / elapsed_time if elapsed_time > 0 else 0
-            uploaded_bytes = sum(c.chunk_file.size for c in video_upload.chunks.all())
+            uploaded_bytes = video_upload.received_bytes
             progress = (uploaded_bytes / total_size) * 100
             total_duration = total_size / speed if speed > 0 else 0
             remaining_duration = total_duration * (1 - progress / 100)
@@ -572,85 +632,21 @@ class ManualVideoChunkUploadView(APIView):
                     'remaining_size': format_file_size(remaining_size),
                     'uploaded_bytes': uploaded_bytes,
                     'total_bytes': total_size,
-                    'status': 'uploading'
+                    'status': 'finalizing' if completed else 'uploading'
                 }
             )
 
-            if video_upload.chunks.count() == int(total_chunks):
-                try:
-                    final_file_path = os.path.join(settings.MEDIA_ROOT, 'videos', f"{upload_id}.mp4")
-                    os.makedirs(os.path.dirname(final_file_path), exist_ok=True)
-                    with open(final_file_path, 'wb') as final_file:
-                        for i in range(total_chunks):
-                            chunk_instance = video_upload.chunks.get(chunk_number=i)
-                            with open(chunk_instance.chunk_file.path, 'rb') as chunk_file:
-                                final_file.write(chunk_file.read())
-                            os.remove(chunk_instance.chunk_file.path)
-                            chunk_instance.delete()
-
-                    if not os.path.exists(final_file_path):
-                        return Response({"error": "Le fichier final n'a pas été créé correctement"}, status=500)
-
-                    with open(final_file_path, 'rb') as final_file:
-                        django_file = File(final_file, name=f"{upload_id}.mp4")
-
-                        video_data = {
-                            'envoyeur': user,
-                            'titre': video_upload.titre,
-                            'description': video_upload.description,
-                            'categorie': video_upload.categorie,
-                            'visibilite': video_upload.visibilite,
-                            'tags_names': [tag.strip() for tag in video_upload.tags.split(',') if tag.strip()]
-                        }
-
-                        serializer = VideoSerializer(data=video_data, context={'request': request})
-                        if serializer.is_valid(raise_exception=True):
-                            video = serializer.save(fichier=django_file)
-                            video_upload.delete()
-                            async_to_sync(channel_layer.group_send)(
-                                f"upload_{user.id}_{upload_id}",
-                                {
-                                    'type': 'upload_progress',
-                                    'progress': 100,
-                                    'speed': format_file_size(0) + "/s",
-                                    'total_duration': format_duration(0),
-                                    'remaining_duration': format_duration(0),
-                                    'remaining_size': format_file_size(0),
-                                    'uploaded_bytes': total_size,
-                                    'total_bytes': total_size,
-                                    'video_id': video.id,
-                                    'status': 'completed'
-                                }
-                            )
-                            video_processing_queue.put(
-                                {
-                                    "type":"THUMBNAILS",
-                                    "video_id":video.id
-                                }
-                            )        
-                            video_processing_queue.put(
-                                {
-                                    "type":"CONVERSION",
-                                    "video_id":video.id
-                                }
-                            )
-                            
-                            # Diffusion via WebSocket pour la création de la vidéo
-                            async_to_sync(channel_layer.group_send)(
-                                "video_updates",
-                                {
-                                    "type": "video_created",
-                                    "video_id": video.id,
-                                    "video_data": VideoSerializer(video, context={'request': request}).data
-                                }
-                            )
-                            
-                            return Response(serializer.data, status=201)
-                        else:
-                            return Response(serializer.errors, status=400)
-                except Exception as e:
-                    print(f"Erreur lors de la recombinaison: {str(e)}")
-                    return Response({"error": f"Erreur lors de la recombinaison: {str(e)}"}, status=500)
+            if completed:
+                # Finalisation en tâche de fond : la fin est annoncée sur le groupe WebSocket de l'upload
+                return Response({
+                    "upload_id": upload_id,
+                    "chunk_number": chunk_number,
+                    "progress": 100,
+                    "status": "finalizing",
+                    "status_url": request.build_absolute_uri(
+                        reverse('videos:video-chunked-upload-status', kwargs={'upload_id': upload_id})
+                    )
+                }, status=202)
 
             return Response({
                 "upload_id": upload_id,
@@ -662,6 +658,185 @@ class ManualVideoChunkUploadView(APIView):
             print(f"Erreur dans ManualVideoChunkUploadView: {str(e)}")
             return Response({"error": str(e)}, status=500)
 
+class ManualVideoChunkUploadStatusView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        operation_description="État d'un upload (uploading, finalizing, failed, completed) : plages de morceaux manquants à (ré)envoyer pour reprendre",
+        responses={
+            200: openapi.Response(
+                description="Morceaux reçus et plages manquantes [début, fin] incluses",
+                schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={
+                    "upload_id": openapi.Schema(type=openapi.TYPE_STRING),
+                    "status": openapi.Schema(type=openapi.TYPE_STRING),
+                    "received_chunks": openapi.Schema(type=openapi.TYPE_INTEGER),
+                    "received_bytes": openapi.Schema(type=openapi.TYPE_INTEGER),
+                    "missing_ranges": openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_INTEGER)))
+                })
+            ),
+            404: openapi.Response(
+                description="Upload non trouvé",
+                schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={"error": openapi.Schema(type=openapi.TYPE_STRING)})
+            )
+        }
+    )
+    def get(self, request, upload_id):
+        try:
+            video_upload = VideoUpload.objects.get(upload_id=upload_id, user=request.user)
+        except VideoUpload.DoesNotExist:
+            video = Video.objects.filter(upload_id=upload_id, envoyeur=request.user).first()
+            if video is None:
+                return Response({"error": "Upload non trouvé"}, status=404)
+            return Response({"upload_id": str(upload_id), "status": "completed", "video_id": video.id, "missing_ranges": []}, status=200)
+        return Response({
+            "upload_id": str(upload_id),
+            "status": video_upload.status.lower(),
+            "total_chunks": video_upload.total_chunks,
+            "total_size": video_upload.total_size,
+            "received_chunks": video_upload.received_chunk_count,
+            "received_bytes": video_upload.received_bytes,
+            "missing_ranges": missing_chunk_ranges(video_upload.received_chunks, video_upload.total_chunks)
+        }, status=200)
+
+def tus_response(status, **headers):
+    # Réponses tus sans corps ; Upload_Offset -> en-tête Upload-Offset
+    response = HttpResponse(status=status)
+    response['Tus-Resumable'] = TUS_VERSION
+    for name, value in headers.items():
+        response[name.replace('_', '-')] = str(value)
+    return response
+
+def tus_options_response():
+    return tus_response(
+        204, Tus_Version=TUS_VERSION, Tus_Extension=",".join(TUS_EXTENSIONS),
+        Tus_Max_Size=settings.VIDEO_UPLOAD_MAX_SIZE, Tus_Checksum_Algorithm=",".join(TUS_CHECKSUM_ALGORITHMS)
+    )
+
+class TusUploadCreateView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get_permissions(self):
+        # Découverte des capacités du serveur sans authentification
+        if self.request.method == 'OPTIONS':
+            return [AllowAny()]
+        return super().get_permissions()
+
+    def options(self, request, *args, **kwargs):
+        return tus_options_response()
+
+    @swagger_auto_schema(
+        operation_description="tus 1.0 (extension creation) : crée un upload de Upload-Length octets. Métadonnées Upload-Metadata : titre, description, categorie, visibilite, tags",
+        responses={201: openapi.Response(description="Upload créé, URL dans l'en-tête Location")}
+    )
+    def post(self, request):
+        if request.headers.get('Tus-Resumable') != TUS_VERSION:
+            return tus_response(412, Tus_Version=TUS_VERSION)
+        try:
+            # Upload-Defer-Length non supporté : la taille est nécessaire pour préallouer le fichier
+            upload_length = int(request.headers.get('Upload-Length', ''))
+        except ValueError:
+            return tus_response(400)
+        if upload_length <= 0:
+            return tus_response(400)
+        if upload_length > settings.VIDEO_UPLOAD_MAX_SIZE:
+            return tus_response(413)
+
+        metadata = parse_tus_metadata(request.headers.get('Upload-Metadata'))
+        upload_id = str(uuid.uuid4())
+        with transaction.atomic():
+            VideoUpload.objects.create(
+                upload_id=upload_id,
+                user=request.user,
+                titre=metadata.get('titre') or metadata.get('filename', ''),
+                description=metadata.get('description', ''),
+                categorie=metadata.get('categorie', ''),
+                visibilite=metadata.get('visibilite') or 'PUBLIC',
+                tags=metadata.get('tags', ''),
+                total_size=upload_length,
+                # Flux continu : l'offset tus est suivi par received_bytes, sans morceaux
+                total_chunks=0
+            )
+            preallocate_upload_file(get_upload_path(upload_id), upload_length)
+        location = request.build_absolute_uri(reverse('videos:video-tus-upload', kwargs={'upload_id': upload_id}))
+        return tus_response(201, Location=location)
+
+class TusUploadView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get_permissions(self):
+        if self.request.method == 'OPTIONS':
+            return [AllowAny()]
+        return super().get_permissions()
+
+    def options(self, request, *args, **kwargs):
+        return tus_options_response()
+
+    @swagger_auto_schema(operation_description="tus 1.0 : offset courant (Upload-Offset) d'un upload, pour reprendre l'envoi")
+    def head(self, request, upload_id):
+        if request.headers.get('Tus-Resumable') != TUS_VERSION:
+            return tus_response(412, Tus_Version=TUS_VERSION)
+        video_upload = VideoUpload.objects.filter(upload_id=upload_id, user=request.user).first()
+        if video_upload is None:
+            # Upload déjà finalisé : le client voit un envoi terminé plutôt qu'un upload disparu
+            video = Video.objects.filter(upload_id=upload_id, envoyeur=request.user).first()
+            if video is None:
+                return tus_response(404, Cache_Control='no-store')
+            return tus_response(200, Upload_Offset=video.fichier.size, Upload_Length=video.fichier.size, Cache_Control='no-store')
+        return tus_response(
+            200, Upload_Offset=video_upload.received_bytes, Upload_Length=video_upload.total_size, Cache_Control='no-store'
+        )
+
+    @swagger_auto_schema(operation_description="tus 1.0 (extension checksum) : écrit le corps brut (application/offset+octet-stream) à Upload-Offset")
+    def patch(self, request, upload_id):
+        # Sous ASGI, les PATCH sont interceptés par apps.videos.tus.TusPatchMiddleware avant Django
+        if request.headers.get('Tus-Resumable') != TUS_VERSION:
+            return tus_response(412, Tus_Version=TUS_VERSION)
+        if request.content_type.split(';')[0].strip() != 'application/offset+octet-stream':
+            return tus_response(415)
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+        except ValueError:
+            return tus_response(400)
+        video_upload, error = begin_tus_patch(upload_id, request.user.id, offset)
+        if error:
+            return tus_response(error, **tus_error_headers(video_upload))
+
+        hasher = expected_digest = None
+        if request.headers.get('Upload-Checksum'):
+            algorithm, _, expected_digest = request.headers['Upload-Checksum'].partition(' ')
+            if algorithm not in TUS_CHECKSUM_ALGORITHMS:
+                return tus_response(400)
+            hasher = hashlib.new(algorithm)
+
+        remaining = video_upload.total_size - offset
+        content_length = request.META.get('CONTENT_LENGTH')
+        if content_length and content_length.isdigit() and int(content_length) > remaining:
+            return tus_response(413)
+
+        # Le corps n'est jamais lu par DRF (request.data) : il est écrit au fil de l'eau à l'offset
+        try:
+            written = write_stream_at(get_upload_path(upload_id), offset, request.stream, remaining, hasher)
+        except FileNotFoundError:
+            # Fichier renommé par la finalisation ou supprimé par un abandon entre-temps
+            return tus_response(409)
+        if hasher is not None and base64.b64encode(hasher.digest()).decode() != expected_digest.strip():
+            # 460 Checksum Mismatch : l'offset n'avance pas, les octets seront réécrits
+            return tus_response(460)
+
+        video_upload, status = commit_tus_patch(video_upload, offset, written)
+        return tus_response(status, **tus_error_headers(video_upload))
+
+    @swagger_auto_schema(operation_description="tus 1.0 (extension termination) : abandonne un upload et supprime ses données")
+    def delete(self, request, upload_id):
+        if request.headers.get('Tus-Resumable') != TUS_VERSION:
+            return tus_response(412, Tus_Version=TUS_VERSION)
+        # Un upload complet en cours de finalisation ne peut plus être abandonné
+        deleted, _ = VideoUpload.objects.filter(upload_id=upload_id, user=request.user, status='UPLOADING').delete()
+        if not deleted:
+            return tus_response(404)
+        discard_upload_file(upload_id)
+        return tus_response(204)
+
 # class VideoChunkedUploadView(ChunkedUploadView):
 #     model = VideoChunkedUpload
 #     field_name = 'fichier'
@@ -827,19 +1002,16 @@ class VideoDeleteView(APIView):
     def delete(self, request, video_id):
         try:
             video = Video.objects.get(id=video_id)
-            video_dir = os.path.join(settings.MEDIA_ROOT, "videos", str(video.id))
             original_file_path = os.path.join(settings.MEDIA_ROOT, "videos", os.path.basename(video.fichier.name))
 
             if hasattr(video, 'video_playlist'):
                 video.video_playlist.all().delete()
-            if os.path.exists(video.fichier.path):
-                os.remove(video.fichier.path)
-            if os.path.exists(video.affichage.path):
-                os.remove(video.affichage.path)
+            # Traitement en cours pour ce contenu : un doublon restant le reprend à son compte
+            hand_over_processing(video)
+            # Le fichier et les renditions ne sont supprimés qu'à la dernière référence du contenu
+            files_deleted = delete_video_files(video)
             video.delete()
-            if os.path.exists(video_dir):
-                shutil.rmtree(video_dir)
-            if os.path.exists(original_file_path) and original_file_path != video.fichier.path:
+            if files_deleted and os.path.exists(original_file_path) and original_file_path != video.fichier.path:
                 os.remove(original_file_path)
                 
             channel_layer = get_channel_layer()
@@ -1393,9 +1565,17 @@ class VideoManifestView(APIView):
         except Video.DoesNotExist:
             return Response({'error': 'Vidéo non trouvée'}, status=404)
 
+SEGMENT_CONTENT_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.ts': 'video/mp2t',
+    '.m4s': 'video/iso.segment',
+    '.mp4': 'video/mp4',
+    '.vtt': 'text/vtt',
+}
+
 class VideoSegmentView(APIView):
     @swagger_auto_schema(
-        operation_description="Récupère un segment vidéo spécifique (.ts) pour une vidéo",
+        operation_description="Récupère un segment vidéo (.ts, .m4s, init .mp4) d'une vidéo, avec support des requêtes Range",
         tags=["Streaming"],
         responses={
             200: openapi.Response(
@@ -1411,14 +1591,60 @@ class VideoSegmentView(APIView):
     def get(self, request, video_id, segment_name):
         try:
             video = Video.objects.get(id=video_id)
-            segment_path = os.path.join(settings.MEDIA_ROOT, "videos", str(video.id), "segments", segment_name)
-            if os.path.exists(segment_path):
-                return FileResponse(open(segment_path, 'rb'), content_type='video/mp4')
+            segments_root = os.path.join(settings.MEDIA_ROOT, get_storage_dir(video), "segments")
+            segment_path = os.path.normpath(os.path.join(segments_root, segment_name))
+            if segment_path.startswith(segments_root + os.sep) and os.path.isfile(segment_path):
+                # Les renditions fMP4 sont lues par plages d'octets (EXT-X-BYTERANGE)
+                content_type = SEGMENT_CONTENT_TYPES.get(os.path.splitext(segment_path)[1], 'application/octet-stream')
+                return ranged_file_response(segment_path, request.headers.get('Range'), content_type)
             else:
                 return Response({'error': 'Segment non trouvé'}, status=404)
         except Video.DoesNotExist:
             return Response({'error': 'Vidéo non trouvée'}, status=404)
 
+class VideoSubtitleView(APIView):
+    @swagger_auto_schema(
+        operation_description="Récupère une piste de sous-titres complète au format srt, ttml ou vtt (conversion mise en cache à la première demande)",
+        tags=["Streaming"],
+        responses={
+            200: openapi.Response(
+                description="Fichier de sous-titres",
+                content={'application/x-subrip': {}, 'application/ttml+xml': {}, 'text/vtt': {}}
+            ),
+            404: openapi.Response(
+                description="Piste, format ou vidéo non trouvé",
+                schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={"error": openapi.Schema(type=openapi.TYPE_STRING)})
+            )
+        }
+    )
+    def get(self, request, video_id, track, subtitle_format):
+        if subtitle_format not in SUBTITLE_FORMATS:
+            return Response({'error': 'Format de sous-titres non supporté'}, status=404)
+        try:
+            video = Video.objects.get(id=video_id)
+        except Video.DoesNotExist:
+            return Response({'error': 'Vidéo non trouvée'}, status=404)
+
+        video_dir = os.path.join(settings.MEDIA_ROOT, get_storage_dir(video))
+        segments_dir = os.path.join(video_dir, "segments", "original")
+        source_path = os.path.normpath(os.path.join(segments_dir, f"subs_{track}.vtt"))
+        if not source_path.startswith(segments_dir + os.sep) or not os.path.isfile(source_path):
+            return Response({'error': 'Piste de sous-titres non trouvée'}, status=404)
+
+        content_type = SUBTITLE_FORMATS[subtitle_format][2]
+        if subtitle_format == "vtt":
+            return FileResponse(open(source_path, 'rb'), content_type=content_type)
+
+        cache_path = os.path.join(video_dir, settings.VIDEO_SUBTITLE_CACHE_DIR, f"subs_{track}.{subtitle_format}")
+        if not os.path.isfile(cache_path):
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            try:
+                convert_subtitles(source_path, cache_path, subtitle_format)
+            except Exception as e:
+                LOGGER.error(f"Erreur lors de la conversion des sous-titres {source_path} : {e}")
+                return Response({'error': 'Conversion des sous-titres impossible'}, status=500)
+        return FileResponse(open(cache_path, 'rb'), content_type=content_type)
+
 class VideoLikeView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -1656,8 +1882,9 @@ class VideoDownloadView(APIView):
                                 type=openapi.TYPE_OBJECT,
                                 properties={
                                     "quality": openapi.Schema(type=openapi.TYPE_STRING, description="Qualité de la vidéo (e.g., 1080p, 720p)"),
-                                    "url": openapi.Schema(type=openapi.TYPE_STRING, description="URL directe pour le téléchargement"),
-                                    "size": openapi.Schema(type=openapi.TYPE_STRING, description="Taille du fichier formatée"),
+                                    "url": openapi.Schema(type=openapi.TYPE_STRING, description="URL directe pour le téléchargement (fichier MP4, ou playlist m3u8 pour le format hls)"),
+                                    "format": openapi.Schema(type=openapi.TYPE_STRING, description="mp4 (fichier unique) ou hls (playlist + segments)"),
+                                    "size": openapi.Schema(type=openapi.TYPE_STRING, description="Taille formatée (somme des segments pour hls)"),
                                     "duration": openapi.Schema(type=openapi.TYPE_STRING, description="Durée de la vidéo formatée"),
                                 }
                             )
@@ -1675,7 +1902,14 @@ class VideoDownloadView(APIView):
         try:
             video = Video.objects.get(id=video_id)
             video_path = video.fichier.path
-            video_info = get_available_info(video_path)
+            if hasattr(video, 'info'):
+                video_info = {
+                    'qualities': video.info.qualities,
+                    'duration_formatted': format_duration(video.info.duration),
+                    'quality': get_quality_label(video.info.height)
+                }
+            else:
+                video_info = get_available_info(video_path)
             qualities = video_info.get('qualities', [])
             duration = video_info.get('duration_formatted', 'N/A')
             base_url = settings.BASE_URL
@@ -1684,15 +1918,27 @@ class VideoDownloadView(APIView):
             qualities_list = []
             for quality in qualities:
                 if quality == video_info.get('quality',None):
-                    quality_file_path = os.path.join("videos", str(video.id), original_filename)
+                    quality_file_path = os.path.join(get_storage_dir(video), original_filename)
+                    full_path = os.path.join(settings.MEDIA_ROOT, quality_file_path)
+                    quality_format = "mp4"
+                    size = format_file_size(os.path.getsize(full_path)) if os.path.exists(full_path) else "N/A"
                 else:
-                    quality_file_path = os.path.join("videos", str(video.id), "qualities", quality, original_filename)
-                quality_url = f"{base_url}{media_url}{quality_file_path}"
-                full_path = os.path.join(settings.MEDIA_ROOT, quality_file_path)
-                size = format_file_size(os.path.getsize(full_path)) if os.path.exists(full_path) else "N/A"
+                    # Les qualités inférieures n'existent qu'en HLS (pas de MP4 intermédiaire) : annoncées
+                    # comme telles, avec la taille cumulée des segments plutôt que celle de la playlist
+                    quality_file_path = os.path.join(get_storage_dir(video), "segments", quality, "video.m3u8")
+                    full_path = os.path.join(settings.MEDIA_ROOT, quality_file_path)
+                    if not os.path.exists(full_path):
+                        continue
+                    with open(full_path) as f:
+                        if "#EXT-X-ENDLIST" not in f.read():
+                            # Rendition encore en cours d'encodage
+                            continue
+                    quality_format = "hls"
+                    size = format_file_size(playlist_files_size(full_path))
                 qualities_list.append({
                     "quality": quality,
-                    "url": quality_url,
+                    "url": f"{base_url}{media_url}{quality_file_path}",
+                    "format": quality_format,
                     "taille": size,
                     "duration": duration
                 })
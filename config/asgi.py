@@ -4,12 +4,14 @@ from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from apps.videos.routing import video_websocket_urlpatterns
 from apps.streaming.routing import streaming_websocket_urlpatterns
+from apps.videos.tus import TusPatchMiddleware
 from helpers.middleware import TokenAuthMiddleware
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    # Corps des PATCH tus écrits au fil de l'eau, sans passer par Django
+    "http": TusPatchMiddleware(get_asgi_application()),
     "websocket": TokenAuthMiddleware(
         AuthMiddlewareStack(
             URLRouter(
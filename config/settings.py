@@ -87,6 +87,15 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Requis dès que les workers vidéo tournent hors du processus Daphne
+if os.getenv('REDIS_URL'):
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [os.getenv('REDIS_URL')]},
+        },
+    }
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
@@ -150,6 +159,97 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 BASE_URL = f"http://{IP_ADDR}:{PORT}"
 
+# Traitement vidéo (ffmpeg)
+VIDEO_HLS_SEGMENT_TIME = 10
+# "ts" (un fichier par segment) ou "fmp4" (CMAF, un fichier par rendition en EXT-X-BYTERANGE)
+VIDEO_HLS_PACKAGING = "ts"
+# Images clés alignées (GOP fermés) sur toutes les renditions ; VIDEO_HLS_SEGMENT_TIME
+# doit être un multiple de VIDEO_HLS_GOP_SECONDS
+VIDEO_HLS_ALIGN_GOP = True
+VIDEO_HLS_GOP_SECONDS = 2
+VIDEO_HLS_INIT_SEGMENT_TIME = 2
+# X-TIMESTAMP-MAP des sous-titres segmentés sans segment MPEG-TS de référence :
+# ffmpeg démarre les flux MPEG-TS à 1,4 s (126000 en horloge 90 kHz)
+VIDEO_SUBTITLE_DEFAULT_MPEGTS = 126000
+VIDEO_SUBTITLE_CACHE_DIR = "subtitles_cache"
+# Uploads en morceaux : fichier préalloué (relatif à MEDIA_ROOT) écrit aux offsets des morceaux
+VIDEO_UPLOAD_TMP_DIR = "video_uploads"
+# Taille maximale d'un upload (morceaux ou tus, annoncée par Tus-Max-Size), vérifiée avant préallocation
+VIDEO_UPLOAD_MAX_SIZE = 20 * 1024 * 1024 * 1024
+VIDEO_ENCODER_PRESET = "veryfast"
+VIDEO_ENCODER_CRF = 23
+VIDEO_PROGRESS_INTERVAL = 1.0
+# Échelle par titre : sondes CRF sur quelques fenêtres, renditions à moins de 15 % de débit
+# de leur voisine écartées, débit plafonné à VIDEO_LADDER_MAXRATE_FACTOR x l'estimation
+VIDEO_ADAPTIVE_LADDER = True
+VIDEO_COMPLEXITY_SAMPLES = 3
+VIDEO_COMPLEXITY_WINDOW = 4
+VIDEO_LADDER_MIN_BITRATE_GAP = 0.15
+VIDEO_LADDER_MAXRATE_FACTOR = 1.5
+MEDIA_INFO_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Images d'affichage (extraites sur image clé par ffmpeg)
+VIDEO_POSTER_WIDTHS = [320, 640, 1280]
+VIDEO_POSTER_FORMATS = ["webp", "jpeg"]
+VIDEO_POSTER_QUALITY = 82
+VIDEO_POSTER_LQIP_WIDTH = 16
+# Une vidéo sans affichage ne relance pas de tâche plus d'une fois par intervalle
+VIDEO_POSTER_ENQUEUE_INTERVAL = 60 * 10
+
+# Vignettes de prévisualisation (sprites + piste WebVTT)
+VIDEO_TRICKPLAY_INTERVAL = 5
+VIDEO_TRICKPLAY_WIDTH = 160
+VIDEO_TRICKPLAY_COLUMNS = 10
+VIDEO_TRICKPLAY_ROWS = 10
+VIDEO_TRICKPLAY_FORMATS = ["jpeg", "webp"]
+VIDEO_TRICKPLAY_DATA_ID = "com.video.thumbnails"
+
+# File de traitement persistée (VideoProcessingTask)
+# Les workers tournent hors de Daphne (`manage.py video_supervisor`) ; le worker intégré au
+# processus web n'est à activer qu'en développement
+VIDEO_PROCESSING_INLINE_WORKER = os.getenv('VIDEO_PROCESSING_INLINE_WORKER', 'False') == 'True'
+VIDEO_WORKER_POLL_INTERVAL = 2
+VIDEO_TASK_LEASE_SECONDS = 300
+VIDEO_TASK_MAX_ATTEMPTS = 3
+VIDEO_TASK_RETRY_BACKOFF = 30
+VIDEO_TASK_RETRY_BACKOFF_MAX = 3600
+VIDEO_TASK_CONCURRENCY = {
+    "FINALIZE": 4,
+    "PROBE": 4,
+    "THUMBNAILS": 4,
+    "CONVERSION": 2,
+    "RENDITION": 2,
+    "TRACKS": 2,
+    "TRICKPLAY": 2,
+    "CHUNK": 8,
+    "STITCH": 2,
+}
+VIDEO_QUEUE_ADMISSION_THRESHOLD = 5
+
+# Isolation des workers (appliquée par `video_worker`, héritée par ffmpeg)
+VIDEO_WORKER_PROCESSES = None  # défaut : un worker par cœur du budget CPU
+VIDEO_WORKER_CPU_BUDGET = 0.75  # part des cœurs de l'hôte réservée aux workers
+VIDEO_WORKER_CPUS = None  # liste explicite de cœurs, sinon les derniers cœurs du budget
+VIDEO_WORKER_NICE = 10
+VIDEO_WORKER_IONICE_CLASS = "idle"  # "best-effort", "idle" ou "realtime"
+# cgroup v2 délégué (ex. /sys/fs/cgroup/video-workers) ; None pour ne pas l'utiliser
+VIDEO_WORKER_CGROUP = None
+VIDEO_WORKER_CPU_QUOTA_PERCENT = 100  # par cœur du budget (cpu.max)
+VIDEO_WORKER_MEMORY_LIMIT = None  # octets (memory.max, ou RLIMIT_AS sans cgroup)
+VIDEO_WORKER_IO_WEIGHT = 50  # io.weight (1-10000, défaut noyau 100)
+VIDEO_SUPERVISOR_RESTART_DELAY = 5
+VIDEO_SUPERVISOR_STOP_TIMEOUT = 60
+
+# Benchmark du pipeline (`manage.py video_benchmark`)
+VIDEO_BENCHMARK_BASELINE = os.path.join(BASE_DIR, "benchmarks", "video_baseline.json")
+VIDEO_BENCHMARK_TOLERANCE = 0.2
+# Encodage distribué des vidéos longues : découpe sur images clés, un job CHUNK par morceau,
+# puis assemblage (STITCH) en copie de flux
+VIDEO_CHUNKED_ENCODING = True
+VIDEO_CHUNKED_MIN_DURATION = 60 * 20
+VIDEO_CHUNK_SECONDS = 60 * 5
+VIDEO_CHUNK_STITCH_POLL = 15
+
 AUTH_USER_MODEL = 'users.User'
 AUTHENTICATION_BACKENDS = ['apps.users.backends.EmailBackend']
 
@@ -189,6 +289,7 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_METHODS = [
     'GET',
+    'HEAD',
     'DELETE',
     'OPTIONS',
     'PATCH',
@@ -206,6 +307,23 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'tus-resumable',
+    'upload-length',
+    'upload-offset',
+    'upload-metadata',
+    'upload-checksum',
+]
+
+# En-têtes tus lisibles par les clients navigateur
+CORS_EXPOSE_HEADERS = [
+    'location',
+    'tus-resumable',
+    'tus-version',
+    'tus-extension',
+    'tus-max-size',
+    'tus-checksum-algorithm',
+    'upload-length',
+    'upload-offset',
 ]
 
 CORS_ORIGIN_WHITELIST =[
@@ -2,6 +2,8 @@ from dotenv import load_dotenv
 from datetime import timedelta, datetime
 from django.utils import timezone as django_timezone
 from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse, FileResponse
 
 from rest_framework.request import Request
 from rest_framework_simplejwt.tokens import AccessToken, TokenError
@@ -10,8 +12,9 @@ from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from base64 import b64decode,b64encode
 from cryptography.hazmat.backends import default_backend
 from difflib import SequenceMatcher
+from hashlib import sha1
 from moviepy.editor import VideoFileClip
-from PIL import Image
+from PIL import Image, ImageFilter
 
 from apps.users.models import User, default_created_at
 
@@ -20,6 +23,8 @@ import random, re
 from helpers.constantes import *
 import ffmpeg
 import traceback
+import subprocess
+from io import BytesIO
 
 load_dotenv()
 LOGGER = logging.getLogger(__name__)
@@ -30,6 +35,50 @@ def get_token_from_request(request: Request) -> str:
         return authorization_header.split()[1]
     return None
 
+def parse_range_header(range_header, file_size):
+    # "bytes=start-end" | "bytes=start-" | "bytes=-suffix" ; une seule plage supportée
+    match = re.match(r'^bytes=(\d*)-(\d*)$', (range_header or '').strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+    if match.group(1):
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else file_size - 1
+    else:
+        start = max(file_size - int(match.group(2)), 0)
+        end = file_size - 1
+    end = min(end, file_size - 1)
+    if start > end:
+        return None
+    return start, end
+
+def iter_file_range(path, start, length, block_size=64 * 1024):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = f.read(min(block_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+def ranged_file_response(path, range_header, content_type):
+    file_size = os.path.getsize(path)
+    if range_header:
+        byte_range = parse_range_header(range_header, file_size)
+        if byte_range is None:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{file_size}"
+            return response
+        start, end = byte_range
+        response = StreamingHttpResponse(iter_file_range(path, start, end - start + 1), status=206, content_type=content_type)
+        response['Content-Range'] = f"bytes {start}-{end}/{file_size}"
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
 def get_timezone():
     tz = os.getenv("TIMEZONE_HOURS")
     if '-' in tz:
@@ -146,79 +195,130 @@ def format_duration(seconds):
     secs = int(seconds % 60)
     return f"{hours:02d}:{minutes:02d}:{secs:02d}"
 
+STANDARD_QUALITIES = [
+    (2160, "2160p (4K)"),
+    (1440, "1440p (2K)"),
+    (1080, "1080p (Full HD)"),
+    (720, "720p (HD)"),
+    (480, "480p"),
+    (360, "360p"),
+    (240, "240p"),
+    (144, "144p")
+]
+
+def get_quality_label(height):
+    return next((q for h, q in STANDARD_QUALITIES[:-1] if height >= h - 10), f"{height}p")
+
+def parse_frame_rate(rate):
+    try:
+        num, _, den = (rate or "0/1").partition("/")
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+def get_keyframe_times(packets, video_index):
+    return sorted(
+        round(float(p['pts_time']), 3) for p in packets
+        if p.get('stream_index') == video_index and 'K' in p.get('flags', '') and p.get('pts_time') not in (None, 'N/A')
+    )
+
+def probe_keyframe_times(file_path, video_index):
+    # Images clés sur toute la durée : lecture des seuls paquets (sans décodage), ligne par ligne
+    cmd = [
+        "ffprobe", "-v", "error", "-select_streams", str(video_index),
+        "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", file_path
+    ]
+    times = []
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True) as process:
+        for line in process.stdout:
+            pts_time, _, flags = line.strip().partition(",")
+            if "K" in flags and pts_time not in ("", "N/A"):
+                times.append(round(float(pts_time), 3))
+    if process.returncode:
+        raise Exception(f"[❗]ffprobe a échoué sur {file_path} (code {process.returncode})")
+    return sorted(times)
+
+def get_keyframe_interval(packets, video_index):
+    keyframes = get_keyframe_times(packets, video_index)
+    if len(keyframes) < 2:
+        return None
+    intervals = [b - a for a, b in zip(keyframes, keyframes[1:])]
+    return round(max(intervals), 3)
+
+def inspect_media(file_path):
+    # Un seul ffprobe (sans décodage) : streams, format et paquets vidéo des 30 premières secondes
+    probe = ffmpeg.probe(
+        file_path,
+        show_entries='packet=stream_index,pts_time,flags',
+        read_intervals='%+30'
+    )
+    streams = probe['streams']
+    video_stream = next((s for s in streams if s['codec_type'] == 'video' and not s.get('disposition', {}).get('attached_pic')), None)
+    if video_stream is None:
+        raise Exception(f"[❗]aucun flux vidéo dans {file_path}")
+    audio_streams = [s for s in streams if s['codec_type'] == 'audio']
+    subtitle_streams = [s for s in streams if s['codec_type'] == 'subtitle']
+
+    size = os.path.getsize(file_path)
+    duration = float(probe['format'].get('duration') or video_stream.get('duration') or 0)
+    width = int(video_stream['width'])
+    height = int(video_stream['height'])
+    fps = parse_frame_rate(video_stream.get('avg_frame_rate')) or parse_frame_rate(video_stream.get('r_frame_rate'))
+
+    audio_tracks = []
+    for stream in audio_streams:
+        language = stream.get('tags', {}).get('language', 'unknown')
+        title = stream.get('tags', {}).get('title', '')
+        if title:
+            audio_tracks.append(f"{language} ({title})")
+        elif language not in audio_tracks:
+            audio_tracks.append(language)
+
+    subtitle_languages = [stream.get('tags', {}).get('language', 'unknown') for stream in subtitle_streams]
+
+    return {
+        'qualities': [quality for threshold, quality in STANDARD_QUALITIES if height >= threshold],
+        'size': size,
+        'size_formatted': format_file_size(size),
+        'duration': duration,
+        'duration_formatted': format_duration(duration),
+        'width': width,
+        'height': height,
+        'fps': round(fps, 3),
+        'has_subtitles': bool(subtitle_streams),
+        'subtitle_languages': subtitle_languages,
+        'audio_tracks': audio_tracks,
+        'has_multiple_languages': len(set(audio_tracks)) > 1,
+        'quality': get_quality_label(height),
+        'video_codec': video_stream.get('codec_name'),
+        'video_profile': video_stream.get('profile'),
+        'video_level': video_stream.get('level'),
+        'pix_fmt': video_stream.get('pix_fmt'),
+        'audio_codec': audio_streams[0].get('codec_name') if audio_streams else None,
+        'bitrate': int(probe['format'].get('bit_rate') or 0) or None,
+        'video_bitrate': int(video_stream.get('bit_rate') or 0) or None,
+        'keyframe_interval': get_keyframe_interval(probe.get('packets', []), video_stream['index']),
+        # Seule une source H.264 peut être copiée (voir can_remux) : inutile de parcourir les autres
+        'keyframe_times': probe_keyframe_times(file_path, video_stream['index']) if video_stream.get('codec_name') == "h264" else None
+    }
+
 def get_available_info(file_path):
     print("[❕] Getting available info....")
     if not os.path.exists(file_path):
         raise Exception(f"[❗]le chemin de fichier {file_path} est introuvable, veuillez verifiez...")
-    try:
-        clip = VideoFileClip(file_path)
-        height = clip.h
-        
-        standard_qualities = [
-            (2160, "2160p (4K)"),
-            (1440, "1440p (2K)"),
-            (1080, "1080p (Full HD)"),
-            (720, "720p (HD)"),
-            (480, "480p"),
-            (360, "360p"),
-            (240, "240p"),
-            (144, "144p")
-        ]
-        
-        available_qualities = [quality for threshold, quality in standard_qualities if height >= threshold]
-        quality = next((q for h, q in {
-            2160: "2160p (4K)",
-            1440: "1440p (2K)",
-            1080: "1080p (Full HD)",
-            720: "720p (HD)",
-            480: "480p",
-            360: "360p",
-            240: "240p"
-        }.items() if height >= h - 10), f"{height}p")
-        probe = ffmpeg.probe(file_path)
-        video_info = {
-            'qualities': available_qualities,
-            'size': os.path.getsize(file_path),
-            'size_formatted': format_file_size(os.path.getsize(file_path)),
-            'duration': clip.duration,
-            'duration_formatted': format_duration(clip.duration),
-            'width': clip.w,
-            'height': clip.h,
-            'fps': clip.fps,
-            'has_subtitles': False,
-            'subtitle_languages': [],
-            'audio_tracks': [],
-            'has_multiple_languages': False,
-            'quality': quality
-        }
-        
-        subtitle_streams = [stream for stream in probe['streams'] if stream['codec_type'] == 'subtitle']
-        if subtitle_streams:
-            video_info['has_subtitles'] = True
-            video_info['subtitle_languages'] = [
-                stream.get('tags', {}).get('language', 'unknown') for stream in subtitle_streams
-            ]
-        
-        audio_streams = [stream for stream in probe['streams'] if stream['codec_type'] == 'audio']
-        audio_tracks = []
-        for stream in audio_streams:
-            language = stream.get('tags', {}).get('language', 'unknown')
-            title = stream.get('tags', {}).get('title', '')
-            if title:
-                audio_tracks.append(f"{language} ({title})")
-            elif language not in audio_tracks:
-                audio_tracks.append(language)
-        video_info['audio_tracks'] = audio_tracks
-        video_info['has_multiple_languages'] = len(set(audio_tracks)) > 1
-        
-        clip.close()
+    stat = os.stat(file_path)
+    # Le couple taille/mtime invalide le cache dès que le fichier est remplacé
+    cache_key = "media_info:" + sha1(f"{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()
+    video_info = cache.get(cache_key)
+    if video_info is not None:
         return video_info
-    
+    try:
+        video_info = inspect_media(file_path)
     except Exception as e:
-        if 'clip' in locals():
-            clip.close()
         print(traceback.format_exc())
         raise Exception(f"Erreur lors de l'obtention des informations vidéo: {str(e)}")
+    cache.set(cache_key, video_info, settings.MEDIA_INFO_CACHE_TIMEOUT)
+    return video_info
 
 def custom_resize(clip, newsize, resample=Image.Resampling.LANCZOS):
     return clip.resize(newsize, resample=resample)
@@ -316,15 +416,51 @@ def format_elapsed_time(uploaded_at):
         years = now.year - uploaded_at.year
         return f"{years} ans"
 
-def extract_random_frame(video_path, output_dir):
+def extract_keyframe(video_path, output_path, timestamp):
+    # -ss avant -i : seek sur l'image clé la plus proche, seules les images clés sont décodées
+    cmd = [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+        "-skip_frame", "nokey", "-ss", f"{timestamp:.3f}", "-i", video_path,
+        "-map", "0:v:0", "-frames:v", "1", "-q:v", "2", output_path
+    ]
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    return output_path
+
+def build_lqip(image):
+    # Miniature floue encodée en data URI, affichée pendant le chargement de l'affiche
+    width = settings.VIDEO_POSTER_LQIP_WIDTH
+    height = max(1, round(image.height * width / image.width))
+    placeholder = image.resize((width, height)).filter(ImageFilter.GaussianBlur(1))
+    buffer = BytesIO()
+    placeholder.save(buffer, format="JPEG", quality=40)
+    return f"data:image/jpeg;base64,{b64encode(buffer.getvalue()).decode()}"
+
+def extract_poster_set(video_path, output_dir, duration=None):
     try:
-        clip = VideoFileClip(video_path)
-        duration = clip.duration
-        random_time = random.uniform(0, duration) 
-        output_path = os.path.join(output_dir, f"affichage_{os.path.basename(video_path).split('.')[0]}.jpg")
-        clip.save_frame(output_path, t=random_time)
-        clip.close()
-        return output_path
+        if duration is None:
+            duration = get_available_info(video_path).get("duration") or 0
+        # On évite le tout début et la fin (génériques, écrans noirs)
+        timestamp = random.uniform(duration * 0.1, duration * 0.9) if duration else 0
+        name = os.path.basename(video_path).split('.')[0]
+        frame_path = os.path.join(output_dir, f"affichage_{name}_source.jpg")
+        extract_keyframe(video_path, frame_path, timestamp)
+
+        posters = {}
+        with Image.open(frame_path) as frame:
+            frame = frame.convert("RGB")
+            for width in settings.VIDEO_POSTER_WIDTHS:
+                # Pas d'agrandissement au-delà de la résolution source
+                width = min(width, frame.width)
+                height = max(1, round(frame.height * width / frame.width))
+                resized = frame.resize((width, height), Image.LANCZOS)
+                for image_format in settings.VIDEO_POSTER_FORMATS:
+                    extension = "jpg" if image_format == "jpeg" else image_format
+                    output_path = os.path.join(output_dir, f"affichage_{name}_{width}.{extension}")
+                    resized.save(output_path, format=image_format.upper(), quality=settings.VIDEO_POSTER_QUALITY)
+                    posters.setdefault(str(width), {})[image_format] = output_path
+            lqip = build_lqip(frame)
+        os.remove(frame_path)
+        return {"posters": posters, "lqip": lqip}
     except Exception as e:
         print(f"Erreur lors de l'extraction de l'image : {e}")
-        return None
\ No newline at end of file
+        return None